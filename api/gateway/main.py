@@ -1,7 +1,8 @@
 from fastapi import FastAPI, Request, Response, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 import os
 import json
@@ -9,7 +10,12 @@ import logging
 import uuid
 import asyncio
 from typing import Dict, Any, Optional, List
-from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
+from shared.utils.admission import Admission, AdmissionController, AdmissionRejected
+from shared.utils.connection_manager import ConnectionManager
+from shared.utils.event_bus import create_event_bus_from_env
+from shared.utils.deadline import Deadline, DeadlineExceeded
+from shared.utils.http_pool import ServiceClientPool
+from shared.utils.retry import RetryBudget, attempt_timeout_for, call_service_with_retry
 
 # 配置日志
 logging.basicConfig(
@@ -45,46 +51,31 @@ SERVICE_URLS = {
     "intent": os.environ.get("INTENT_SERVICE_URL", "http://intent-service:7006"),
 }
 
-# 异步HTTP客户端
-http_client = httpx.AsyncClient(timeout=60.0)  # 增加默认超时时间
+# 进程级连接池：每个下游服务一个长连接客户端，所有请求共享
+http_pool = ServiceClientPool({"orchestrator": ORCHESTRATOR_URL, **SERVICE_URLS}, timeout=60.0)
 
-# 重试装饰器
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-async def call_service_with_retry(client, url, **kwargs):
-    """带重试功能的服务调用"""
-    try:
-        logger.info(f"正在调用服务: {url}")
-        response = await client.post(url, **kwargs)
-        response.raise_for_status()
-        return response
-    except httpx.HTTPStatusError as e:
-        logger.error(f"服务调用失败: {url}, 状态码: {e.response.status_code}, 错误: {e.response.text}")
-        raise
-    except httpx.RequestError as e:
-        logger.error(f"请求错误: {url}, 错误: {str(e)}")
-        raise
+# 准入控制：按客户端限流，并限制每个下游服务的并发数和排队数，过载时快速返回429/503
+admission = AdmissionController()
 
-# WebSocket连接管理
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+# 流式音频上传时每个客户端缓存的最大帧数，队列满时对客户端形成背压
+AUDIO_STREAM_QUEUE_SIZE = int(os.environ.get("AUDIO_STREAM_QUEUE_SIZE", "32"))
+# 客户端未声明格式时，默认按16kHz单声道16位PCM处理
+DEFAULT_STREAM_CONTENT_TYPE = "audio/L16;rate=16000;channels=1"
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
-        logger.info(f"WebSocket client connected: {client_id}")
+# 请求的最长处理时间（秒）：网关据此设置截止时间，经编排服务传递给各下游服务，
+# 客户端可以通过 X-Request-Deadline 要求更早的截止时间
+GATEWAY_REQUEST_TIMEOUT = float(os.environ.get("GATEWAY_REQUEST_TIMEOUT", "60"))
+GATEWAY_WORKFLOW_TIMEOUT = float(os.environ.get("GATEWAY_WORKFLOW_TIMEOUT", "120"))
+# 有副作用的服务，超时或5xx时不重试
+NON_IDEMPOTENT_SERVICES = {"memory"}
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            logger.info(f"WebSocket client disconnected: {client_id}")
+# 按下游服务限制重试总量，下游故障时重试不会成倍放大负载
+retry_budget = RetryBudget()
 
-    async def send_status(self, client_id: str, status: dict):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(status)
-            logger.debug(f"Sent status to client {client_id}: {status}")
-
-manager = ConnectionManager()
+# 状态事件总线：编排服务发布的工作流状态经总线投递到客户端所连接的网关副本
+event_bus = create_event_bus_from_env()
+# WebSocket连接管理：推送经每个连接自己的发送队列，不阻塞工作流
+manager = ConnectionManager(event_bus)
 
 # 辅助函数：根据服务名称确定服务URL
 def get_service_url(service_name: str) -> str:
@@ -93,6 +84,30 @@ def get_service_url(service_name: str) -> str:
         return SERVICE_URLS[service_name]
     raise HTTPException(status_code=404, detail=f"服务 '{service_name}' 不存在")
 
+def get_client_key(request: Request) -> str:
+    """限流使用的客户端标识：优先使用 X-Client-ID，否则使用客户端IP"""
+    client_id = request.headers.get("X-Client-ID")
+    if client_id:
+        return client_id
+    return request.client.host if request.client else "unknown"
+
+def request_deadline(request: Request, timeout: float) -> Deadline:
+    """请求的截止时间：不晚于 timeout 秒后"""
+    return Deadline.from_headers(request.headers, default_timeout=timeout, max_timeout=timeout)
+
+async def admit(request: Request, service: str, deadline: Optional[Deadline] = None) -> Admission:
+    """获取下游服务的执行名额，排队不超过请求的剩余时间，被拒绝时返回带 Retry-After 的429/503"""
+    try:
+        return await admission.admit(
+            service, get_client_key(request), timeout=deadline.remaining() if deadline else None
+        )
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": e.retry_after_header}
+        )
+
 # 挂载静态文件目录
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -101,148 +116,309 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def get_index():
     return FileResponse("static/index.html")
 
+def _parse_control_message(text: Optional[str]) -> dict:
+    """解析WebSocket文本控制消息，非JSON消息视为心跳"""
+    if not text:
+        return {}
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return {}
+    return message if isinstance(message, dict) else {}
+
+def _end_audio_stream(audio_queue: Optional[asyncio.Queue], audio_task: Optional[asyncio.Task]):
+    """向流式工作流发送结束标记，不阻塞WebSocket接收循环"""
+    if audio_queue is None or audio_task is None or audio_task.done():
+        return
+    asyncio.create_task(audio_queue.put(None))
+
 # WebSocket端点
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+    """
+    状态推送与流式音频上传共用的WebSocket连接
+
+    客户端协议:
+    - 文本 {"type": "audio_start", "content_type": "audio/L16;rate=16000;channels=1"}: 开始一段语音
+    - 二进制帧: 音频数据块，逐块转发给编排服务
+    - 文本 {"type": "audio_end"}: 语音结束
+    - 其他文本消息: 心跳，保持连接活跃
+    """
+    connection = await manager.connect(websocket, client_id)
+    audio_queue: Optional[asyncio.Queue] = None
+    audio_task: Optional[asyncio.Task] = None
     try:
         while True:
-            # 保持连接活跃
-            await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes") is not None:
+                # 只有存在进行中的流式工作流时才转发音频帧
+                if audio_task is not None and not audio_task.done():
+                    await audio_queue.put(message["bytes"])
+                continue
+
+            control = _parse_control_message(message.get("text"))
+            if control.get("type") == "audio_start":
+                _end_audio_stream(audio_queue, audio_task)
+                audio_queue = asyncio.Queue(maxsize=AUDIO_STREAM_QUEUE_SIZE)
+                audio_task = asyncio.create_task(
+                    execute_stream_workflow_with_status(
+                        client_id,
+                        audio_queue,
+                        control.get("content_type") or DEFAULT_STREAM_CONTENT_TYPE
+                    )
+                )
+                logger.info(f"客户端 {client_id} 开始流式上传音频")
+            elif control.get("type") == "audio_end":
+                _end_audio_stream(audio_queue, audio_task)
+                audio_queue, audio_task = None, None
+                logger.info(f"客户端 {client_id} 结束流式上传音频")
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        pass
+    finally:
+        _end_audio_stream(audio_queue, audio_task)
+        await manager.disconnect(connection)
 
 # RESTful API路由
 @app.post("/api/v1/{service_name}/process")
 async def process(service_name: str, request: Request):
     """RESTful风格的服务处理API"""
     service_url = get_service_url(service_name)
-    payload = await request.json()
-    
+    deadline = request_deadline(request, GATEWAY_REQUEST_TIMEOUT)
+    ticket = await admit(request, service_name, deadline)
     try:
+        payload = await request.json()
         response = await call_service_with_retry(
-            http_client,
+            http_pool.client(service_name),
             f"{service_url}/process",
+            deadline,
+            idempotent=service_name not in NON_IDEMPOTENT_SERVICES,
+            attempt_timeout=attempt_timeout_for(service_name),
+            retry_budget=retry_budget,
             json=payload
         )
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
-            media_type=response.headers.get("content-type", "application/json")
-        )
-    except (httpx.RequestError, RetryError) as e:
+    except httpx.HTTPStatusError as e:
+        response = e.response
+    except (DeadlineExceeded, httpx.TimeoutException) as e:
+        logger.error(f"请求服务超时: {str(e)}")
+        raise HTTPException(status_code=504, detail="服务处理超时")
+    except httpx.RequestError as e:
         logger.error(f"请求服务出错: {str(e)}")
         raise HTTPException(status_code=503, detail="服务暂时不可用")
+    finally:
+        ticket.release()
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type", "application/json")
+    )
 
 # 音频处理API
 @app.post("/api/v1/process_audio")
 async def process_audio(request: Request):
-    """处理音频数据并通过WebSocket返回状态更新"""
+    """把音频提交到编排服务的工作流队列，处理状态通过WebSocket推送"""
+    deadline = request_deadline(request, GATEWAY_WORKFLOW_TIMEOUT)
+    ticket = await admit(request, "orchestrator", deadline)
+    try:
+        return await _submit_audio(request, deadline)
+    finally:
+        ticket.release()
+
+async def _submit_audio(request: Request, deadline: Deadline):
     # 获取音频数据
     audio_data = await request.body()
     client_id = request.headers.get("X-Client-ID", str(uuid.uuid4()))
     
     logger.info(f"接收到客户端 {client_id} 的音频数据，大小: {len(audio_data)} 字节")
-    
-    # 创建工作流实例
-    payload = {
-        "client_id": client_id
-    }
-    
-    # 异步执行工作流，这样可以立即返回响应
-    asyncio.create_task(
-        execute_workflow_with_status(client_id, "process_audio", payload, audio_data)
-    )
-    
-    return {"status": "processing", "client_id": client_id}
 
-# 工作流状态跟踪
-async def execute_workflow_with_status(client_id: str, workflow_name: str, payload: dict, audio_data=None):
-    """将工作流请求转发到编排服务并通过WebSocket发送状态更新"""
+    # 通知开始处理工作流
+    await manager.send_status(client_id, {
+        "status": "start",
+        "message": "开始处理工作流 process_audio"
+    })
+
+    # 编排服务只把任务放入队列即返回，因此这里直接等待结果：网关不持有在途的后台任务，
+    # 队列已满时把503返回给客户端。截止时间随任务进入队列，超时未执行的任务不再执行
+    try:
+        orchestrator_response = await http_pool.client("orchestrator").post(
+            f"{ORCHESTRATOR_URL}/api/v1/process_audio",
+            content=audio_data,
+            headers={"X-Client-ID": client_id, **deadline.headers()},
+            timeout=deadline.timeout(30.0)
+        )
+    except httpx.RequestError as e:
+        logger.error(f"调用编排服务失败: {str(e)}")
+        await manager.send_status(client_id, {
+            "status": "error",
+            "message": f"处理错误: {str(e)}"
+        })
+        raise HTTPException(status_code=503, detail="编排服务暂时不可用")
+
+    if orchestrator_response.status_code != 200:
+        logger.error(f"编排服务拒绝客户端 {client_id} 的请求，状态码: {orchestrator_response.status_code}")
+        await manager.send_status(client_id, {
+            "status": "error",
+            "message": f"处理错误: {orchestrator_response.text}"
+        })
+        headers = orchestrator_response.headers
+        return Response(
+            content=orchestrator_response.content,
+            status_code=orchestrator_response.status_code,
+            media_type=headers.get("content-type", "application/json"),
+            headers={"Retry-After": headers["retry-after"]} if "retry-after" in headers else None
+        )
+
+    return orchestrator_response.json()
+
+async def _iter_audio_queue(audio_queue: asyncio.Queue):
+    """逐块读取队列中的音频帧，读到 None 时结束"""
+    while True:
+        chunk = await audio_queue.get()
+        if chunk is None:
+            break
+        yield chunk
+
+async def execute_stream_workflow_with_status(client_id: str, audio_queue: asyncio.Queue, content_type: str):
+    """将WebSocket推送的音频帧逐块转发到编排服务，不在网关缓存整段音频"""
     try:
-        # 通知开始处理工作流
         await manager.send_status(client_id, {
             "status": "start",
-            "message": f"开始处理工作流 {workflow_name}"
+            "message": "开始处理流式音频工作流"
         })
-        
-        # 根据工作流名称转发到不同的编排服务端点
-        if workflow_name == "process_audio" and audio_data:
-            # 转发音频数据到编排服务
-            async with httpx.AsyncClient(timeout=90.0) as client:  # 增加超时时间
-                try:
-                    orchestrator_response = await call_service_with_retry(
-                        client,
-                        f"{ORCHESTRATOR_URL}/api/v1/process_audio",
-                        content=audio_data,
-                        headers={"X-Client-ID": client_id}
-                    )
-                    logger.info(f"成功调用编排服务，状态码: {orchestrator_response.status_code}")
-                except Exception as e:
-                    logger.error(f"调用编排服务失败: {str(e)}")
-                    raise
-        else:
-            # 对于其他类型的工作流，可以在这里添加处理逻辑
-            await manager.send_status(client_id, {
-                "status": "error",
-                "message": f"未知的工作流类型: {workflow_name}"
-            })
+
+        # 截止时间从开始推送音频时计算，随请求传给编排服务，语音结束后的工作流沿用同一截止时间
+        deadline = Deadline.after(GATEWAY_WORKFLOW_TIMEOUT)
+        # 流式请求体只能被消费一次，因此这里不经过重试装饰器
+        orchestrator_response = await http_pool.client("orchestrator").post(
+            f"{ORCHESTRATOR_URL}/api/v1/process_audio_stream",
+            content=_iter_audio_queue(audio_queue),
+            headers={"X-Client-ID": client_id, "Content-Type": content_type, **deadline.headers()},
+            timeout=deadline.timeout(GATEWAY_WORKFLOW_TIMEOUT)
+        )
+        orchestrator_response.raise_for_status()
+        logger.info(f"成功调用编排服务流式接口，状态码: {orchestrator_response.status_code}")
     except Exception as e:
-        logger.error(f"工作流执行错误: {str(e)}", exc_info=True)
-        # 通知错误
+        logger.error(f"流式工作流执行错误: {str(e)}", exc_info=True)
         await manager.send_status(client_id, {
             "status": "error",
             "message": f"处理错误: {str(e)}"
         })
+    finally:
+        # 丢弃未消费的帧，避免WebSocket接收循环阻塞在已满的队列上
+        while not audio_queue.empty():
+            audio_queue.get_nowait()
 
 # OpenAI兼容API路由
-@app.post("/v1/completions")
-async def openai_completions(request: Request):
-    """OpenAI兼容的completions API"""
-    payload = await request.json()
-    
-    # 转发到LLM服务
+async def _close_stream(response: httpx.Response, ticket: Admission):
     try:
-        response = await http_client.post(
-            f"{SERVICE_URLS['llm']}/v1/completions",
-            json=payload,
-            timeout=60.0
-        )
-        return Response(
-            content=response.content,
+        await response.aclose()
+    finally:
+        ticket.release()
+
+async def proxy_llm_request(path: str, request: Request) -> Response:
+    """
+    转发到LLM服务；"stream": true 时逐块转发SSE事件，不在网关缓存完整响应
+
+    非流式请求和流式请求的首个响应受请求截止时间限制；流式响应在发送完毕（或客户端断开）后才归还LLM服务的并发名额
+    """
+    deadline = request_deadline(request, GATEWAY_REQUEST_TIMEOUT)
+    ticket = await admit(request, "llm", deadline)
+    streaming = False
+    try:
+        payload = await request.json()
+        url = f"{SERVICE_URLS['llm']}{path}"
+        client = http_pool.client("llm")
+        try:
+            if not payload.get("stream"):
+                response = await client.post(
+                    url, json=payload, headers=deadline.headers(), timeout=deadline.timeout(GATEWAY_REQUEST_TIMEOUT)
+                )
+                return Response(
+                    content=response.content,
+                    status_code=response.status_code,
+                    media_type=response.headers.get("content-type", "application/json")
+                )
+
+            # 流式生成的总时长不固定：建立连接和收到响应头须在截止时间前完成，之后只限制相邻两块数据之间的等待时间
+            upstream_request = client.build_request(
+                "POST", url, json=payload, headers=deadline.headers(),
+                timeout=httpx.Timeout(60.0, connect=deadline.timeout(60.0))
+            )
+            response = await asyncio.wait_for(
+                client.send(upstream_request, stream=True), timeout=deadline.remaining()
+            )
+        except (httpx.TimeoutException, asyncio.TimeoutError) as e:
+            logger.error(f"请求LLM服务超时: {str(e)}")
+            raise HTTPException(status_code=504, detail="LLM服务处理超时")
+        except httpx.RequestError as e:
+            logger.error(f"请求LLM服务出错: {str(e)}")
+            raise HTTPException(status_code=503, detail="LLM服务暂时不可用")
+
+        if response.status_code != 200:
+            content = await response.aread()
+            await response.aclose()
+            return Response(
+                content=content,
+                status_code=response.status_code,
+                media_type=response.headers.get("content-type", "application/json")
+            )
+
+        streaming = True
+        return StreamingResponse(
+            response.aiter_raw(),
             status_code=response.status_code,
-            media_type=response.headers.get("content-type", "application/json")
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(_close_stream, response, ticket)
         )
-    except httpx.RequestError as e:
-        logger.error(f"请求LLM服务出错: {str(e)}")
-        raise HTTPException(status_code=503, detail="LLM服务暂时不可用")
+    finally:
+        if not streaming:
+            ticket.release()
+
+@app.post("/v1/completions")
+async def openai_completions(request: Request):
+    """OpenAI兼容的completions API"""
+    return await proxy_llm_request("/v1/completions", request)
 
 @app.post("/v1/chat/completions")
 async def openai_chat_completions(request: Request):
     """OpenAI兼容的chat completions API"""
-    payload = await request.json()
-    
-    # 转发到LLM服务
+    return await proxy_llm_request("/v1/chat/completions", request)
+
+# 合成音频下载，转发 Range 请求头以支持分段加载
+@app.get("/api/v1/tts/audio/{audio_id}")
+async def get_tts_audio(audio_id: str, request: Request):
+    headers = {name: request.headers[name] for name in ("range", "if-none-match") if name in request.headers}
     try:
-        response = await http_client.post(
-            f"{SERVICE_URLS['llm']}/v1/chat/completions",
-            json=payload,
-            timeout=60.0
-        )
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
-            media_type=response.headers.get("content-type", "application/json")
+        response = await http_pool.client("tts").get(
+            f"{SERVICE_URLS['tts']}/audio/{audio_id}", headers=headers, timeout=30.0
         )
     except httpx.RequestError as e:
-        logger.error(f"请求LLM服务出错: {str(e)}")
-        raise HTTPException(status_code=503, detail="LLM服务暂时不可用")
+        logger.error(f"请求TTS服务出错: {str(e)}")
+        raise HTTPException(status_code=503, detail="TTS服务暂时不可用")
+    forwarded = ("accept-ranges", "content-range", "cache-control", "etag")
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+        headers={name: response.headers[name] for name in forwarded if name in response.headers}
+    )
 
 # 健康检查
 @app.get("/health")
 async def health_check():
     """API网关健康检查"""
-    return {"status": "ok", "services": SERVICE_URLS}
+    return {
+        "status": "ok",
+        "services": SERVICE_URLS,
+        "http_pool": http_pool.stats(),
+        "event_bus": event_bus.stats(),
+        "websocket": manager.stats(),
+        "admission": admission.stats(),
+        "retry_budget": retry_budget.stats()
+    }
 
 # 获取可用服务列表
 @app.get("/api/v1/services")
@@ -252,7 +428,7 @@ async def list_services():
     
     for service_name, service_url in SERVICE_URLS.items():
         try:
-            response = await http_client.get(f"{service_url}/health")
+            response = await http_pool.client(service_name).get(f"{service_url}/health")
             if response.status_code == 200:
                 service_info = response.json()
                 services.append({
@@ -280,24 +456,32 @@ async def list_services():
 @app.post("/api/v1/workflows/{workflow_name}")
 async def execute_workflow(workflow_name: str, request: Request):
     """执行指定工作流"""
-    payload = await request.json()
-    client_id = request.headers.get("X-Client-ID", str(uuid.uuid4()))
-    payload["client_id"] = client_id
-    
+    deadline = request_deadline(request, GATEWAY_WORKFLOW_TIMEOUT)
+    ticket = await admit(request, "orchestrator", deadline)
     try:
-        response = await http_client.post(
+        payload = await request.json()
+        client_id = request.headers.get("X-Client-ID", str(uuid.uuid4()))
+        payload["client_id"] = client_id
+
+        response = await http_pool.client("orchestrator").post(
             f"{ORCHESTRATOR_URL}/api/v1/{workflow_name}",
             json=payload,
-            timeout=120.0
+            headers=deadline.headers(),
+            timeout=deadline.timeout(GATEWAY_WORKFLOW_TIMEOUT)
         )
         return Response(
             content=response.content,
             status_code=response.status_code,
             media_type=response.headers.get("content-type", "application/json")
         )
+    except httpx.TimeoutException as e:
+        logger.error(f"请求编排服务超时: {str(e)}")
+        raise HTTPException(status_code=504, detail="编排服务处理超时")
     except httpx.RequestError as e:
         logger.error(f"请求编排服务出错: {str(e)}")
         raise HTTPException(status_code=503, detail="编排服务暂时不可用")
+    finally:
+        ticket.release()
 
 # 应用启动和关闭事件
 @app.on_event("startup")
@@ -308,5 +492,6 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     """应用关闭时的清理操作"""
-    await http_client.aclose()
+    await http_pool.aclose()
+    await event_bus.close()
     logger.info("API网关服务已关闭") 
\ No newline at end of file
@@ -27,7 +27,16 @@ RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "guest") # Default password
 
 # Specific service configurations (examples)
 class VADConfig:
+    DEFAULT_PROVIDER = os.getenv("VAD_PROVIDER", "silero") # or "onnx"
     MODEL_PATH = os.getenv("VAD_MODEL_PATH", "/app/models/vad/silero_vad.onnx")
+    JIT_MODEL_PATH = os.getenv("VAD_JIT_MODEL_PATH", "/app/models/vad/silero_vad.jit")
+    # 模型文件的 SHA-256，为空时读取模型文件旁的 <模型文件>.sha256
+    MODEL_SHA256 = os.getenv("VAD_MODEL_SHA256", "")
+    # 本地模型文件缺失时是否允许从 torch.hub 下载（使用 hub 缓存，不强制重新下载）
+    ALLOW_HUB_DOWNLOAD = os.getenv("VAD_ALLOW_HUB_DOWNLOAD", "False").lower() == "true"
+    # ONNX Runtime 线程数，每个副本（或工作进程）各自生效
+    ONNX_INTRA_OP_THREADS = int(os.getenv("VAD_ONNX_INTRA_OP_THREADS", 1))
+    ONNX_INTER_OP_THREADS = int(os.getenv("VAD_ONNX_INTER_OP_THREADS", 1))
     # Add other VAD specific settings
 
 class ASRConfig:
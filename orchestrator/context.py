@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符大致每个字一个token，其他字符大致每4个一个token
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+# 记忆中的消息类型与对话角色的对应关系
+MESSAGE_ROLES = {"user_message": "user", "assistant_message": "assistant"}
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数，不依赖具体模型的分词器"""
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk - text.count(" ")
+    return cjk + math.ceil(max(other, 0) / 4)
+
+
+def message_tokens(content: str) -> int:
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class ConversationContext:
+    """单个客户端已组装好的历史对话，按时间先后排列，只在末尾追加、从开头淘汰"""
+    messages: Deque[Tuple[Dict[str, str], int]] = field(default_factory=deque)
+    tokens: int = 0
+    fetched_at: float = 0.0
+
+    def append(self, message: Dict[str, str]):
+        tokens = message_tokens(message["content"])
+        self.messages.append((message, tokens))
+        self.tokens += tokens
+
+    def trim(self, high_water: int, low_water: int):
+        """超过 high_water 时一次淘汰到 low_water 以下，使之后若干轮的历史前缀保持不变"""
+        if self.tokens <= high_water:
+            return
+        while self.messages and self.tokens > low_water:
+            _, tokens = self.messages.popleft()
+            self.tokens -= tokens
+
+
+class ContextBuilder:
+    """
+    为LLM请求组装对话上下文
+
+    上下文由系统提示、最近的历史对话、与本轮输入语义相关的较早记忆和本轮输入组成，总token数不超过 token_budget。
+    最近的历史对话按客户端缓存：首次请求（或缓存过期）时从记忆服务拉取，之后每轮只在末尾追加新消息，
+    超出预算时从最早的消息开始淘汰。相关记忆每轮检索，放在历史对话之后，不影响历史对话前缀的稳定。
+    记忆服务不可用时只使用本地缓存的历史，不中断对话。
+    """
+
+    def __init__(
+        self,
+        fetch_history: Callable[[str, int], Awaitable[List[Dict[str, Any]]]],
+        search_memory: Callable[[str, str, int], Awaitable[List[Dict[str, Any]]]],
+        token_budget: int = 2048,
+        relevant_ratio: float = 0.25,
+        history_limit: int = 50,
+        relevant_limit: int = 5,
+        min_relevance: float = 0.3,
+        cache_ttl: float = 300.0,
+        max_clients: int = 1000,
+        system_prompt: str = "",
+    ):
+        self.fetch_history = fetch_history
+        self.search_memory = search_memory
+        self.token_budget = token_budget
+        self.relevant_ratio = relevant_ratio
+        self.history_limit = history_limit
+        self.relevant_limit = relevant_limit
+        self.min_relevance = min_relevance
+        self.cache_ttl = cache_ttl
+        self.max_clients = max_clients
+        self.system_prompt = system_prompt
+        # 历史对话的缓存上限，超过后淘汰到 3/4
+        self.history_budget = int(token_budget * (1 - relevant_ratio))
+        self._contexts: "OrderedDict[str, ConversationContext]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    async def build(self, client_id: str, text: str) -> Dict[str, Any]:
+        """
+        组装本轮的消息列表，并把本轮输入追加到该客户端的历史对话中
+        返回 {"messages": [...], "tokens": 估算的总token数, "history_messages": 条数, "relevant_messages": 条数}
+        """
+        context = self._contexts.get(client_id)
+        cached = context is not None and time.monotonic() - context.fetched_at < self.cache_ttl
+        history_task = None if cached else asyncio.create_task(self._fetch_history(client_id))
+        relevant = await self._search(client_id, text) if self.relevant_limit > 0 and text else []
+        if cached:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            context = await history_task
+            self._contexts[client_id] = context
+        self._contexts.move_to_end(client_id)
+        while len(self._contexts) > self.max_clients:
+            self._contexts.popitem(last=False)
+
+        system = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        user = {"role": "user", "content": text}
+        available = self.token_budget - sum(message_tokens(m["content"]) for m in system) - message_tokens(text)
+
+        # 相关记忆最多占用 relevant_ratio 的预算，剩余预算留给最近的历史对话
+        history_texts = {message["content"] for message, _ in context.messages}
+        relevant_lines, relevant_tokens = [], MESSAGE_OVERHEAD_TOKENS
+        for item in relevant:
+            content = item.get("text")
+            if not content or content == text or content in history_texts or item.get("score", 0) < self.min_relevance:
+                continue
+            tokens = estimate_tokens(content) + 1
+            if relevant_tokens + tokens > available * self.relevant_ratio:
+                break
+            relevant_lines.append(f"- {content}")
+            relevant_tokens += tokens
+        relevant_messages = [{
+            "role": "system",
+            "content": "以下是与当前问题相关的历史对话：\n" + "\n".join(relevant_lines)
+        }] if relevant_lines else []
+        if relevant_messages:
+            available -= message_tokens(relevant_messages[0]["content"])
+
+        # 本轮输入较长时只取能放下的最近的历史对话，不修改缓存
+        history = list(context.messages)
+        skip, history_tokens = 0, context.tokens
+        while skip < len(history) and history_tokens > available:
+            history_tokens -= history[skip][1]
+            skip += 1
+        history_messages = [message for message, _ in history[skip:]]
+
+        messages = system + history_messages + relevant_messages + [user]
+        total = self.token_budget - available + history_tokens
+        context.append(user)
+        context.trim(self.history_budget, self.history_budget * 3 // 4)
+        return {
+            "messages": messages,
+            "tokens": total,
+            "history_messages": len(history_messages),
+            "relevant_messages": len(relevant_lines),
+        }
+
+    def record(self, client_id: str, role: str, text: str):
+        """把本轮的回复追加到缓存的历史对话中"""
+        context = self._contexts.get(client_id)
+        if context is None or not text:
+            return
+        context.append({"role": role, "content": text})
+        context.trim(self.history_budget, self.history_budget * 3 // 4)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._contexts),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "token_budget": self.token_budget,
+        }
+
+    async def _fetch_history(self, client_id: str) -> ConversationContext:
+        context = ConversationContext(fetched_at=time.monotonic())
+        try:
+            items = await self.fetch_history(client_id, self.history_limit)
+        except Exception as e:
+            logger.warning(f"获取客户端 {client_id} 的历史对话失败，不使用历史对话: {str(e)}")
+            # 失败时不缓存太久，下一轮重新拉取
+            context.fetched_at -= self.cache_ttl
+            return context
+        for item in items:
+            role = MESSAGE_ROLES.get(item.get("type"))
+            if role and item.get("text"):
+                context.append({"role": role, "content": item["text"]})
+        context.trim(self.history_budget, self.history_budget)
+        return context
+
+    async def _search(self, client_id: str, text: str) -> List[Dict[str, Any]]:
+        try:
+            return await self.search_memory(client_id, text, self.relevant_limit)
+        except Exception as e:
+            logger.warning(f"检索客户端 {client_id} 的相关记忆失败: {str(e)}")
+            return []
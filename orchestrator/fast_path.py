@@ -0,0 +1,88 @@
+import logging
+from datetime import datetime, tzinfo
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = "一二三四五六日"
+# 询问当前时间或日期的说法
+TIME_QUESTION_KEYWORDS = ("几点", "几号", "星期几", "周几", "礼拜几", "日期")
+# 指代当前的时间实体，其他时间实体（明天、下周、3点等）询问的不是当前时间
+CURRENT_TIME_ENTITIES = {"现在", "今天"}
+
+
+def answer_time(text: str, intent: Dict[str, Any], now: datetime) -> Optional[str]:
+    """
+    回答当前的时间和日期；询问其他日期（“明天几号”）、带有数字或没有询问时间的说法时返回 None
+    """
+    if not any(keyword in text for keyword in TIME_QUESTION_KEYWORDS):
+        return None
+    if any(char.isdigit() for char in text):
+        return None
+    for entity in intent.get("entities", []):
+        if entity.get("type") == "time" and entity.get("value") not in CURRENT_TIME_ENTITIES:
+            return None
+    return f"现在是{now.year}年{now.month}月{now.day}日，星期{WEEKDAYS[now.weekday()]}，{now.hour}点{now.minute}分。"
+
+
+# 可以在本地直接回答的意图；处理函数返回 None 时仍交给LLM
+LOCAL_HANDLERS: Dict[str, Callable[[str, Dict[str, Any], datetime], Optional[str]]] = {
+    "查询时间": answer_time,
+}
+
+
+def load_timezone(name: str) -> Optional[tzinfo]:
+    """时区无效或系统缺少时区数据时使用本机时区"""
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(name)
+    except Exception as e:
+        logger.warning(f"无法加载时区 {name}，使用本机时区: {str(e)}")
+        return None
+
+
+class FastPath:
+    """
+    高置信度意图的快速通道
+
+    意图识别结果置信度足够高、没有同时命中其他意图、且输入较短时，由本地处理函数直接生成回复，不调用LLM。
+    """
+
+    def __init__(
+        self,
+        min_confidence: float = 0.9,
+        max_chars: int = 20,
+        timezone: str = "Asia/Shanghai",
+        handlers: Optional[Dict[str, Callable[[str, Dict[str, Any], datetime], Optional[str]]]] = None,
+    ):
+        self.min_confidence = min_confidence
+        self.max_chars = max_chars
+        self.timezone = load_timezone(timezone)
+        self.handlers = LOCAL_HANDLERS if handlers is None else handlers
+        self.hits: Dict[str, int] = {}
+        self.misses = 0
+
+    def reply(self, text: str, intent: Dict[str, Any]) -> Optional[str]:
+        """返回本地生成的回复，不满足条件时返回 None"""
+        handler = self.handlers.get(intent.get("intent"))
+        if (
+            handler is None
+            or intent.get("confidence", 0) < self.min_confidence
+            or len(intent.get("intents", [])) > 1
+            or len(text.strip()) > self.max_chars
+        ):
+            self.misses += 1
+            return None
+        response = handler(text, intent, datetime.now(self.timezone))
+        if response is None:
+            self.misses += 1
+            return None
+        self.hits[intent["intent"]] = self.hits.get(intent["intent"], 0) + 1
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "min_confidence": self.min_confidence,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+        }
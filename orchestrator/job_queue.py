@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    """一个待执行的工作流：kind 为工作流类型，payload 为其输入（音频数据或UTF-8文本）"""
+    kind: str
+    client_id: str
+    payload: bytes
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    submitted_at: float = field(default_factory=time.time)
+    # 是否为重新投递（消费者中途退出后由队列再次投递）
+    redelivered: bool = False
+    # 请求的截止时间（Unix时间戳），为 None 时不限
+    deadline: Optional[float] = None
+
+
+JobHandler = Callable[[Job], Awaitable[None]]
+
+
+class QueueFull(Exception):
+    """队列已满或暂时不可用，调用方应稍后重试"""
+
+
+class BaseJobQueue:
+    """
+    工作流任务队列
+
+    submit 只把任务放入队列；start 之后由 workers 个消费者并发取出任务调用 handler，
+    handler 正常返回即确认，抛出异常时转入死信，不重新执行（工作流已向客户端推送过部分状态）。
+    """
+
+    def __init__(self, workers: int = 4, max_length: int = 1000):
+        self.workers = workers
+        self.max_length = max_length
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+
+    async def start(self, handler: JobHandler):
+        raise NotImplementedError
+
+    async def submit(self, job: Job):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_length": self.max_length,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def _handle(self, handler: JobHandler, job: Job) -> bool:
+        """执行一个任务，返回是否成功"""
+        self.in_flight += 1
+        try:
+            await handler(job)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"工作流任务 {job.job_id}（{job.kind}，客户端 {job.client_id}）失败，转入死信: {str(e)}")
+            return False
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        return True
+
+
+class InMemoryJobQueue(BaseJobQueue):
+    """进程内的任务队列，用于开发和测试；进程退出时未完成的任务丢失，死信只保留最近的若干条"""
+
+    def __init__(self, workers: int = 4, max_length: int = 1000, max_dead_letters: int = 100):
+        super().__init__(workers=workers, max_length=max_length)
+        self.dead_letters: Deque[Job] = deque(maxlen=max_dead_letters)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_length)
+        self._consumers: List[asyncio.Task] = []
+
+    async def start(self, handler: JobHandler):
+        self._consumers = [asyncio.create_task(self._consume(handler)) for _ in range(self.workers)]
+
+    async def submit(self, job: Job):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull(f"工作流队列已满（{self.max_length}）")
+        self.submitted += 1
+
+    async def _consume(self, handler: JobHandler):
+        while True:
+            job = await self._queue.get()
+            if not await self._handle(handler, job):
+                self.dead_letters.append(job)
+
+    async def close(self):
+        for consumer in self._consumers:
+            consumer.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            **await super().stats(),
+            "backend": "memory",
+            "queued": self._queue.qsize(),
+            "dead_letters": len(self.dead_letters),
+        }
+
+
+class RabbitMQJobQueue(BaseJobQueue):
+    """
+    基于 RabbitMQ 的持久化任务队列
+
+    任务以持久化消息发布到仲裁队列（quorum queue），发布时等待 broker 确认；
+    队列长度达到 max_length 时 broker 拒绝新消息，submit 抛出 QueueFull。
+    每个进程的消费者通道预取 workers 条消息，执行完成后才确认，进程重启后未确认的任务被重新投递；
+    同一任务投递超过 max_deliveries 次（例如每次都导致进程崩溃）或执行失败时转入死信队列 {queue}.dead。
+    死信队列没有消费者，只保留最近的 max_dead_letters 条，每条最多保留 dead_letter_ttl 秒，
+    避免失败任务连同音频数据在 broker 上无限堆积。
+    连接断开后自动重连，连接建立前 submit 抛出 QueueFull。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queue_name: str = "workflows",
+        workers: int = 4,
+        max_length: int = 1000,
+        max_deliveries: int = 3,
+        reconnect_interval: float = 5.0,
+        max_dead_letters: int = 100,
+        dead_letter_ttl: float = 7 * 24 * 3600,
+    ):
+        super().__init__(workers=workers, max_length=max_length)
+        self.url = url
+        self.queue_name = queue_name
+        self.dead_letter_queue = f"{queue_name}.dead"
+        self.max_deliveries = max_deliveries
+        self.reconnect_interval = reconnect_interval
+        self.max_dead_letters = max_dead_letters
+        self.dead_letter_ttl = dead_letter_ttl
+        self._connection = None
+        self._publish_channel = None
+        self._connect_task: Optional[asyncio.Task] = None
+        self._handler: Optional[JobHandler] = None
+
+    async def start(self, handler: JobHandler):
+        self._handler = handler
+        self._connect_task = asyncio.create_task(self._connect())
+
+    async def _connect(self):
+        import aio_pika
+
+        while True:
+            try:
+                self._connection = await aio_pika.connect_robust(self.url)
+                break
+            except Exception as e:
+                logger.warning(f"连接RabbitMQ失败，{self.reconnect_interval}秒后重试: {str(e)}")
+                await asyncio.sleep(self.reconnect_interval)
+
+        self._publish_channel = await self._connection.channel(publisher_confirms=True)
+        # 队列参数不能修改：已存在不带这些参数的死信队列时需要先删除
+        await self._publish_channel.declare_queue(self.dead_letter_queue, durable=True, arguments={
+            "x-max-length": self.max_dead_letters,
+            "x-message-ttl": int(self.dead_letter_ttl * 1000),
+        })
+        await self._publish_channel.declare_queue(self.queue_name, durable=True, arguments={
+            "x-queue-type": "quorum",
+            "x-max-length": self.max_length,
+            "x-overflow": "reject-publish",
+            "x-delivery-limit": self.max_deliveries,
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": self.dead_letter_queue,
+        })
+        if self.workers > 0:
+            consume_channel = await self._connection.channel()
+            await consume_channel.set_qos(prefetch_count=self.workers)
+            queue = await consume_channel.get_queue(self.queue_name)
+            await queue.consume(self._on_message)
+        logger.info(f"已连接RabbitMQ，工作流队列: {self.queue_name}，消费者并发数: {self.workers}")
+
+    async def submit(self, job: Job):
+        import aio_pika
+
+        if self._publish_channel is None:
+            self.rejected += 1
+            raise QueueFull("工作流队列暂不可用")
+        message = aio_pika.Message(
+            body=job.payload,
+            message_id=job.job_id,
+            timestamp=datetime.fromtimestamp(job.submitted_at, tz=timezone.utc),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers={
+                "kind": job.kind,
+                "client_id": job.client_id,
+                **({"deadline": f"{job.deadline:.3f}"} if job.deadline is not None else {}),
+            },
+        )
+        try:
+            await self._publish_channel.default_exchange.publish(message, routing_key=self.queue_name)
+        except aio_pika.exceptions.DeliveryError as e:
+            # reject-publish：队列已满时 broker 否认确认
+            self.rejected += 1
+            raise QueueFull(f"工作流队列已满（{self.max_length}）") from e
+        except (aio_pika.exceptions.AMQPError, ConnectionError) as e:
+            self.rejected += 1
+            raise QueueFull(f"工作流队列暂不可用: {str(e)}") from e
+        self.submitted += 1
+
+    async def _on_message(self, message):
+        headers = {
+            key: value.decode("utf-8") if isinstance(value, bytes) else str(value)
+            for key, value in (message.headers or {}).items()
+        }
+        job = Job(
+            kind=headers.get("kind", ""),
+            client_id=headers.get("client_id", "unknown"),
+            payload=message.body,
+            job_id=message.message_id or uuid.uuid4().hex,
+            submitted_at=message.timestamp.timestamp() if message.timestamp else time.time(),
+            redelivered=bool(message.redelivered),
+            deadline=float(headers["deadline"]) if headers.get("deadline") else None,
+        )
+        if await self._handle(self._handler, job):
+            await message.ack()
+        else:
+            await message.reject(requeue=False)
+
+    async def close(self):
+        if self._connect_task is not None:
+            self._connect_task.cancel()
+        if self._connection is not None:
+            await self._connection.close()
+
+    async def _queue_depth(self, name: str) -> Optional[int]:
+        if self._publish_channel is None:
+            return None
+        try:
+            queue = await self._publish_channel.declare_queue(name, passive=True)
+        except Exception as e:
+            logger.warning(f"获取队列 {name} 的长度失败: {str(e)}")
+            return None
+        return queue.declaration_result.message_count
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            **await super().stats(),
+            "backend": "rabbitmq",
+            "queue": self.queue_name,
+            "connected": self._publish_channel is not None,
+            "queued": await self._queue_depth(self.queue_name),
+            "dead_letters": await self._queue_depth(self.dead_letter_queue),
+        }
+
+
+def create_job_queue(name: str, **kwargs) -> BaseJobQueue:
+    """
+    按名称创建任务队列；RabbitMQ 实现在连接时才导入 aio_pika，使用进程内队列时不需要安装
+    """
+    if name == "memory":
+        return InMemoryJobQueue(workers=kwargs.get("workers", 4), max_length=kwargs.get("max_length", 1000))
+    if name == "rabbitmq":
+        return RabbitMQJobQueue(**kwargs)
+    raise ValueError(f"未知的工作流队列: {name}，可选: memory, rabbitmq")
@@ -4,8 +4,22 @@ import os
 import logging
 import json
 import asyncio
+import websockets
+from dataclasses import dataclass, field
 from typing import Dict, Any, List, Optional
-from tenacity import retry, stop_after_attempt, wait_exponential, RetryError
+from config.global_settings import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD
+from shared.utils.audio_utils import parse_pcm_sample_rate
+from shared.utils.connection_manager import ConnectionManager
+from shared.utils.deadline import Deadline, DeadlineExceeded
+from shared.utils.event_bus import create_event_bus_from_env
+from shared.utils.http_pool import ServiceClientPool
+from shared.utils.retry import RetryBudget, attempt_timeout_for, call_service_with_retry
+from orchestrator.context import ContextBuilder
+from orchestrator.fast_path import FastPath
+from orchestrator.job_queue import Job, QueueFull, create_job_queue
+from orchestrator.streaming import ReplyStream, SentenceSegmenter, iter_chat_deltas
+from orchestrator.workflow import Stage, Workflow
+from orchestrator.write_buffer import WriteBehindBuffer
 
 # Configure logging
 logging.basicConfig(
@@ -28,43 +42,126 @@ TTS_SERVICE_URL = os.getenv("TTS_SERVICE_URL", "http://tts-service:7004")
 MEMORY_SERVICE_URL = os.getenv("MEMORY_SERVICE_URL", "http://memory-service:7005")
 INTENT_SERVICE_URL = os.getenv("INTENT_SERVICE_URL", "http://intent-service:7006")
 
-# 重试装饰器
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-async def call_service_with_retry(client, url, **kwargs):
-    """带重试功能的服务调用"""
-    try:
-        logger.info(f"正在调用服务: {url}")
-        response = await client.post(url, **kwargs)
-        response.raise_for_status()
-        return response
-    except httpx.HTTPStatusError as e:
-        logger.error(f"服务调用失败: {url}, 状态码: {e.response.status_code}, 错误: {e.response.text}")
-        raise
-    except httpx.RequestError as e:
-        logger.error(f"请求错误: {url}, 错误: {str(e)}")
-        raise
+SERVICE_URLS = {
+    "vad": VAD_SERVICE_URL,
+    "asr": ASR_SERVICE_URL,
+    "llm": LLM_SERVICE_URL,
+    "tts": TTS_SERVICE_URL,
+    "memory": MEMORY_SERVICE_URL,
+    "intent": INTENT_SERVICE_URL,
+}
+
+# 进程级连接池：所有工作流复用到各下游服务的长连接
+http_pool = ServiceClientPool(SERVICE_URLS, timeout=120.0)
+
+# 流式音频转发时每一路下游缓存的最大数据块数，队列满时对上游形成背压
+AUDIO_STREAM_QUEUE_SIZE = int(os.getenv("AUDIO_STREAM_QUEUE_SIZE", "32"))
+DEFAULT_STREAM_CONTENT_TYPE = "audio/L16;rate=16000;channels=1"
+# VAD流式会话接口地址及其原生支持的采样率
+VAD_WS_URL = VAD_SERVICE_URL.replace("http", "ws", 1)
+STREAMING_VAD_SAMPLE_RATES = (8000, 16000)
+# 同时进行语音合成的句子数
+TTS_SEGMENT_CONCURRENCY = int(os.getenv("TTS_SEGMENT_CONCURRENCY", "2"))
+# TTS输出方式：url 返回音频地址；stream 流式合成并通过WebSocket直接推送PCM音频帧
+TTS_OUTPUT_MODE = os.getenv("TTS_OUTPUT_MODE", "url")
+TTS_STREAM_SAMPLE_RATE = int(os.getenv("TTS_STREAM_SAMPLE_RATE", "16000"))
+# 记忆写入合并发送：攒够条数或等待超过指定毫秒数后批量写入
+MEMORY_WRITE_BATCH_SIZE = int(os.getenv("MEMORY_WRITE_BATCH_SIZE", "32"))
+MEMORY_WRITE_FLUSH_MS = float(os.getenv("MEMORY_WRITE_FLUSH_MS", "50"))
+# 批量写入记忆的时限（秒），写入合并了多个工作流的数据，不受单个请求截止时间的限制
+MEMORY_WRITE_TIMEOUT = float(os.getenv("MEMORY_WRITE_TIMEOUT", "10"))
+# LLM上下文的token预算，以及组装上下文时读取记忆服务的超时时间
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2048"))
+CONTEXT_FETCH_TIMEOUT = float(os.getenv("CONTEXT_FETCH_TIMEOUT", "1.0"))
+# 意图快速通道：置信度不低于该值（大于1时关闭）且输入不超过指定字数时，可本地回答的意图不调用LLM
+INTENT_FAST_PATH_MIN_CONFIDENCE = float(os.getenv("INTENT_FAST_PATH_MIN_CONFIDENCE", "0.9"))
+INTENT_FAST_PATH_MAX_CHARS = int(os.getenv("INTENT_FAST_PATH_MAX_CHARS", "20"))
+# 工作流任务队列：memory 或 rabbitmq；每个进程同时执行的工作流数，以及排队任务数上限
+WORKFLOW_QUEUE_BACKEND = os.getenv("WORKFLOW_QUEUE_BACKEND", "memory")
+WORKFLOW_WORKERS = int(os.getenv("WORKFLOW_WORKERS", "8"))
+WORKFLOW_QUEUE_MAX_LENGTH = int(os.getenv("WORKFLOW_QUEUE_MAX_LENGTH", "1000"))
+# 请求没有携带截止时间时，工作流的最长执行时间（秒）
+WORKFLOW_TIMEOUT = float(os.getenv("WORKFLOW_TIMEOUT", "120"))
+
+# 按下游服务限制重试总量，下游故障时重试不会成倍放大负载
+retry_budget = RetryBudget()
+
+async def store_memory_batch(items: List[dict]) -> List[dict]:
+    # 批量写入不是幂等的，只在请求确定未被处理时重试
+    response = await call_service_with_retry(
+        http_pool.client("memory"), f"{MEMORY_SERVICE_URL}/store_batch", Deadline.after(MEMORY_WRITE_TIMEOUT),
+        idempotent=False, attempt_timeout=attempt_timeout_for("memory"), retry_budget=retry_budget,
+        json={"items": items}
+    )
+    return response.json()["results"]
+
+async def fetch_history(client_id: str, limit: int) -> List[dict]:
+    response = await http_pool.client("memory").post(
+        f"{MEMORY_SERVICE_URL}/history", json={"client_id": client_id, "limit": limit}, timeout=CONTEXT_FETCH_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()["items"]
 
-# WebSocket管理器
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
+async def search_memory(client_id: str, query: str, limit: int) -> List[dict]:
+    response = await http_pool.client("memory").post(
+        f"{MEMORY_SERVICE_URL}/search", json={"client_id": client_id, "query": query, "limit": limit},
+        timeout=CONTEXT_FETCH_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()["results"]
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
-        logger.info(f"WebSocket client connected: {client_id}")
+# 按客户端缓存历史对话的上下文组装器；读取记忆服务不重试，失败时不使用历史对话
+context_builder = ContextBuilder(
+    fetch_history,
+    search_memory,
+    token_budget=CONTEXT_TOKEN_BUDGET,
+    history_limit=int(os.getenv("CONTEXT_HISTORY_LIMIT", "50")),
+    relevant_limit=int(os.getenv("CONTEXT_RELEVANT_LIMIT", "5")),
+    cache_ttl=float(os.getenv("CONTEXT_CACHE_TTL", "300")),
+    system_prompt=os.getenv("LLM_SYSTEM_PROMPT", ""),
+)
+
+fast_path = FastPath(
+    min_confidence=INTENT_FAST_PATH_MIN_CONFIDENCE,
+    max_chars=INTENT_FAST_PATH_MAX_CHARS,
+    timezone=os.getenv("ASSISTANT_TIMEZONE", "Asia/Shanghai"),
+)
+
+# 所有工作流共用的记忆写入缓冲区，合并并发工作流的写入请求
+memory_writes = WriteBehindBuffer(
+    store_memory_batch, max_batch=MEMORY_WRITE_BATCH_SIZE, max_delay=MEMORY_WRITE_FLUSH_MS / 1000
+)
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            logger.info(f"WebSocket client disconnected: {client_id}")
+# 工作流以任务的形式排队，由固定数量的消费者执行，突发请求只会排队而不会无限制地同时执行
+if WORKFLOW_QUEUE_BACKEND == "rabbitmq":
+    job_queue = create_job_queue(
+        "rabbitmq",
+        url=f"amqp://{RABBITMQ_USER}:{RABBITMQ_PASSWORD}@{RABBITMQ_HOST}:{RABBITMQ_PORT}/",
+        queue_name=os.getenv("WORKFLOW_QUEUE_NAME", "workflows"),
+        workers=WORKFLOW_WORKERS,
+        max_length=WORKFLOW_QUEUE_MAX_LENGTH,
+        max_deliveries=int(os.getenv("WORKFLOW_MAX_DELIVERIES", "3")),
+        max_dead_letters=int(os.getenv("WORKFLOW_DEAD_LETTER_MAX_LENGTH", "100")),
+        dead_letter_ttl=float(os.getenv("WORKFLOW_DEAD_LETTER_TTL", str(7 * 24 * 3600))),
+    )
+else:
+    job_queue = create_job_queue(WORKFLOW_QUEUE_BACKEND, workers=WORKFLOW_WORKERS, max_length=WORKFLOW_QUEUE_MAX_LENGTH)
 
-    async def send_status(self, client_id: str, status: dict):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_json(status)
-            logger.debug(f"Sent status to client {client_id}: {status}")
+# 状态事件总线：工作流状态按 client_id 发布，由持有客户端WebSocket连接的网关副本（或本服务）推送
+event_bus = create_event_bus_from_env()
+# WebSocket连接管理：推送经每个连接自己的发送队列，不阻塞工作流
+manager = ConnectionManager(event_bus)
 
-manager = ConnectionManager()
+@app.on_event("startup")
+async def startup():
+    await job_queue.start(execute_workflow_job)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.close()
+    await memory_writes.aclose()
+    await http_pool.aclose()
+    await event_bus.close()
 
 @app.get("/health")
 async def health_check():
@@ -72,27 +169,26 @@ async def health_check():
     services_status = {}
     
     # 异步检查所有服务的健康状态
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        services = {
-            "vad_service": VAD_SERVICE_URL,
-            "asr_service": ASR_SERVICE_URL,
-            "llm_service": LLM_SERVICE_URL,
-            "tts_service": TTS_SERVICE_URL,
-            "memory_service": MEMORY_SERVICE_URL,
-            "intent_service": INTENT_SERVICE_URL,
-        }
-        
-        for name, url in services.items():
-            try:
-                response = await client.get(f"{url}/health", timeout=2.0)
-                services_status[name] = "available" if response.status_code == 200 else "error"
-            except Exception:
-                services_status[name] = "unavailable"
+    for service, url in SERVICE_URLS.items():
+        name = f"{service}_service"
+        try:
+            response = await http_pool.client(service).get(f"{url}/health", timeout=2.0)
+            services_status[name] = "available" if response.status_code == 200 else "error"
+        except Exception:
+            services_status[name] = "unavailable"
     
     return {
         "status": "ok", 
         "service_name": "orchestrator",
         "dependencies": services_status,
+        "http_pool": http_pool.stats(),
+        "memory_writes": memory_writes.stats(),
+        "context": context_builder.stats(),
+        "fast_path": fast_path.stats(),
+        "event_bus": event_bus.stats(),
+        "websocket": manager.stats(),
+        "workflow_queue": await job_queue.stats(),
+        "retry_budget": retry_budget.stats(),
         "services": {
             "vad_service": VAD_SERVICE_URL,
             "asr_service": ASR_SERVICE_URL,
@@ -106,13 +202,15 @@ async def health_check():
 # WebSocket端点用于状态更新
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+    connection = await manager.connect(websocket, client_id)
     try:
         while True:
             # 保持连接活跃
             await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        pass
+    finally:
+        await manager.disconnect(connection)
 
 # 完整的音频处理工作流
 @app.post("/api/v1/process_audio")
@@ -123,284 +221,630 @@ async def process_audio_workflow(request: Request):
         # 获取音频数据和客户端ID
         audio_data = await request.body()
         client_id = request.headers.get("X-Client-ID", "unknown")
+        deadline = Deadline.from_headers(request.headers, default_timeout=WORKFLOW_TIMEOUT)
         logger.info(f"收到来自客户端 {client_id} 的 {len(audio_data)} 字节的音频数据")
         
-        # 异步执行工作流，这样可以立即返回响应
-        asyncio.create_task(
-            execute_workflow_with_status(client_id, audio_data)
-        )
-        
-        return {"status": "processing", "client_id": client_id}
+        # 工作流进入任务队列后立即返回响应，由队列的消费者在截止时间前执行
+        job = Job("audio", client_id, audio_data, deadline=deadline.at)
+        await job_queue.submit(job)
+
+        return {"status": "processing", "client_id": client_id, "job_id": job.job_id}
+    except QueueFull as e:
+        logger.warning(f"工作流队列拒绝客户端 {client_id} 的请求: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"处理音频工作流时出错: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
-# 实际执行工作流并发送状态更新
-async def execute_workflow_with_status(client_id: str, audio_data: bytes):
-    """执行音频处理工作流并通过WebSocket发送状态更新"""
-    async with httpx.AsyncClient(timeout=120.0) as client:  # 增加超时时间
+# 流式音频处理工作流
+@app.post("/api/v1/process_audio_stream")
+async def process_audio_stream_workflow(request: Request):
+    """边接收音频边转发给VAD和ASR，检测到语音结束后立即在后台继续执行后续工作流"""
+    client_id = request.headers.get("X-Client-ID", "unknown")
+    content_type = request.headers.get("Content-Type", DEFAULT_STREAM_CONTENT_TYPE)
+    # 网关在开始推送音频时设置截止时间，流式识别和语音结束后的工作流共用这一截止时间
+    deadline = Deadline.from_headers(request.headers, default_timeout=WORKFLOW_TIMEOUT)
+    logger.info(f"收到来自客户端 {client_id} 的流式音频工作流请求, 格式: {content_type}")
+
+    await manager.send_status(client_id, {
+        "status": "start",
+        "message": "开始处理流式音频工作流"
+    })
+
+    try:
+        vad_result, asr_result, pump_task = await relay_audio_stream(
+            client_id, request.stream(), content_type, deadline
+        )
+    except DeadlineExceeded as e:
+        await notify_workflow_error(client_id, e)
+        raise HTTPException(status_code=504, detail=f"流式音频处理超时: {str(e)}")
+    except Exception as e:
+        await notify_workflow_error(client_id, e)
+        raise HTTPException(status_code=502, detail=f"流式音频处理失败: {str(e)}")
+
+    if vad_result.get("detected_speech", False):
         try:
-            # 通知开始处理工作流
-            await manager.send_status(client_id, {
-                "status": "start",
-                "message": "开始处理音频工作流"
-            })
-            
-            # 1. 调用VAD服务检测语音
-            await manager.send_status(client_id, {
-                "status": "service_start",
-                "service": "vad",
-                "message": "开始调用VAD服务检测语音活动"
-            })
-            
-            try:
-                vad_response = await call_service_with_retry(
-                    client,
-                    f"{VAD_SERVICE_URL}/v1/detect",
-                    content=audio_data
-                )
-                vad_result = vad_response.json()
-                
-                await manager.send_status(client_id, {
-                    "status": "service_success",
-                    "service": "vad",
-                    "message": "VAD服务处理完成",
-                    "result": vad_result
-                })
-                
-                # 如果没有检测到语音，提前结束工作流
-                if not vad_result.get("detected_speech", False):
+            await job_queue.submit(Job(
+                "text", client_id, asr_result.get("text", "").encode("utf-8"),
+                deadline=deadline.at
+            ))
+        except QueueFull as e:
+            await notify_workflow_error(client_id, e)
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    else:
+        await manager.send_status(client_id, {
+            "status": "complete",
+            "message": "未检测到语音，工作流结束",
+            "result": {"error": "No speech detected"}
+        })
+
+    # 语音结束后上游可能仍在发送音频，读完剩余数据后再响应；
+    # 读取任务被取消或出错（客户端断开）不影响已提交的工作流
+    await asyncio.wait({pump_task})
+    if pump_task.cancelled():
+        logger.info(f"客户端 {client_id} 的流式音频接收已取消")
+    elif pump_task.exception() is not None:
+        logger.warning(f"读取客户端 {client_id} 剩余音频时出错: {str(pump_task.exception())}")
+    else:
+        logger.info(f"客户端 {client_id} 的流式音频接收完成，共 {pump_task.result()} 字节")
+
+    status = "processing" if vad_result.get("detected_speech", False) else "complete"
+    return {"status": status, "client_id": client_id}
+
+async def _iter_audio_queue(audio_queue: asyncio.Queue):
+    """逐块读取队列中的音频数据，读到 None 时结束"""
+    while True:
+        chunk = await audio_queue.get()
+        if chunk is None:
+            break
+        yield chunk
+
+async def relay_audio_stream(client_id: str, chunks, content_type: str, deadline: Deadline):
+    """
+    将上游音频流复制为两路，同时发送给VAD和ASR服务
+
+    原始PCM输入使用VAD流式会话，检测到语音结束后立即截断发给ASR的音频；
+    其他格式以分块传输的方式整体发送给 /v1/detect。
+    两路都需要在 deadline 前完成，否则取消转发并抛出 DeadlineExceeded。
+    返回 (vad_result, asr_result, pump_task)，pump_task 负责读完上游剩余数据。
+    """
+    vad_queue: asyncio.Queue = asyncio.Queue(maxsize=AUDIO_STREAM_QUEUE_SIZE)
+    asr_queue: asyncio.Queue = asyncio.Queue(maxsize=AUDIO_STREAM_QUEUE_SIZE)
+    speech_ended = asyncio.Event()
+    headers = {"Content-Type": content_type, **deadline.headers()}
+
+    async def pump() -> int:
+        total = 0
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            total += len(chunk)
+            # 语音结束后只读取并丢弃剩余音频
+            if not speech_ended.is_set():
+                await vad_queue.put(chunk)
+                await asr_queue.put(chunk)
+        if not speech_ended.is_set():
+            await vad_queue.put(None)
+            await asr_queue.put(None)
+        return total
+
+    def cut_utterance():
+        """在语音结束处截断音频流"""
+        speech_ended.set()
+        try:
+            asr_queue.put_nowait(None)
+        except asyncio.QueueFull:
+            asyncio.create_task(asr_queue.put(None))
+        # 释放VAD队列，避免上游阻塞在已无人消费的队列上
+        while not vad_queue.empty():
+            vad_queue.get_nowait()
+
+    async def post_stream(service: str, url: str, audio_queue: asyncio.Queue) -> dict:
+        await manager.send_status(client_id, {
+            "status": "service_start",
+            "service": service,
+            "message": f"开始向{service.upper()}服务流式发送音频"
+        })
+        # 流式请求体只能被消费一次，因此这里不经过重试装饰器
+        response = await http_pool.client(service).post(
+            url, content=_iter_audio_queue(audio_queue), headers=headers,
+            timeout=deadline.timeout(http_pool.timeout)
+        )
+        response.raise_for_status()
+        result = response.json()
+        await manager.send_status(client_id, {
+            "status": "service_success",
+            "service": service,
+            "message": f"{service.upper()}服务处理完成",
+            "result": result
+        })
+        return result
+
+    async def vad_session_stage(sample_rate: int) -> dict:
+        await manager.send_status(client_id, {
+            "status": "service_start",
+            "service": "vad",
+            "message": "开始流式语音活动检测"
+        })
+        segments = []
+        endpointed = False
+        async with websockets.connect(f"{VAD_WS_URL}/v1/stream?sample_rate={sample_rate}") as vad_ws:
+            while not endpointed:
+                chunk = await vad_queue.get()
+                await vad_ws.send(chunk if chunk is not None else json.dumps({"type": "end"}))
+                reply = json.loads(await vad_ws.recv())
+                for event in reply.get("events", []):
                     await manager.send_status(client_id, {
-                        "status": "complete",
-                        "message": "未检测到语音，工作流结束",
-                        "result": {"error": "No speech detected"}
+                        "status": "vad_event",
+                        "service": "vad",
+                        "message": "检测到语音开始" if event["event"] == "speech_start" else "检测到语音结束",
+                        "result": event
                     })
-                    return
-            except Exception as e:
-                logger.error(f"VAD服务调用失败: {str(e)}", exc_info=True)
-                await manager.send_status(client_id, {
-                    "status": "service_error",
-                    "service": "vad",
-                    "message": f"VAD服务处理失败: {str(e)}"
-                })
-                raise
-                
-            # 2. 调用ASR服务进行语音识别
-            await manager.send_status(client_id, {
-                "status": "service_start",
-                "service": "asr",
-                "message": "开始调用ASR服务进行语音识别"
-            })
-            
-            try:
-                asr_response = await call_service_with_retry(
-                    client,
-                    f"{ASR_SERVICE_URL}/recognize",
-                    content=audio_data
-                )
-                asr_result = asr_response.json()
-                
-                await manager.send_status(client_id, {
-                    "status": "service_success",
-                    "service": "asr",
-                    "message": "ASR服务处理完成",
-                    "result": asr_result
-                })
-                
-                recognized_text = asr_result.get("text", "")
-            except Exception as e:
-                logger.error(f"ASR服务调用失败: {str(e)}", exc_info=True)
-                await manager.send_status(client_id, {
-                    "status": "service_error",
-                    "service": "asr",
-                    "message": f"ASR服务处理失败: {str(e)}"
-                })
-                raise
-            
-            # 3. 调用意图识别服务
-            await manager.send_status(client_id, {
-                "status": "service_start",
-                "service": "intent",
-                "message": "开始调用Intent服务进行意图识别"
-            })
-            
-            try:
-                intent_response = await call_service_with_retry(
-                    client,
-                    f"{INTENT_SERVICE_URL}/detect_intent",
-                    json={"text": recognized_text}
-                )
-                intent_result = intent_response.json()
-                
-                await manager.send_status(client_id, {
-                    "status": "service_success",
-                    "service": "intent",
-                    "message": "Intent服务处理完成",
-                    "result": intent_result
-                })
-            except Exception as e:
-                logger.error(f"Intent服务调用失败: {str(e)}", exc_info=True)
-                await manager.send_status(client_id, {
-                    "status": "service_error",
-                    "service": "intent",
-                    "message": f"Intent服务处理失败: {str(e)}"
-                })
-                raise
-            
-            # 4. 保存到记忆服务
-            await manager.send_status(client_id, {
-                "status": "service_start",
-                "service": "memory",
-                "message": "开始调用Memory服务存储对话"
-            })
-            
-            try:
-                memory_data = {
-                    "client_id": client_id,
-                    "text": recognized_text,
-                    "intent": intent_result.get("intent"),
-                    "type": "user_message"
-                }
-                
-                memory_response = await call_service_with_retry(
-                    client,
-                    f"{MEMORY_SERVICE_URL}/store",
-                    json=memory_data
-                )
-                memory_result = memory_response.json()
-                
-                await manager.send_status(client_id, {
-                    "status": "service_success",
-                    "service": "memory",
-                    "message": "Memory服务处理完成",
-                    "result": memory_result
-                })
-            except Exception as e:
-                logger.error(f"Memory服务调用失败: {str(e)}", exc_info=True)
-                await manager.send_status(client_id, {
-                    "status": "service_error",
-                    "service": "memory",
-                    "message": f"Memory服务处理失败: {str(e)}"
-                })
-                # 这里不中断工作流，继续执行
-                
-            # 5. 调用LLM服务生成回复
-            await manager.send_status(client_id, {
-                "status": "service_start",
-                "service": "llm",
-                "message": "开始调用LLM服务生成回复"
-            })
-            
-            try:
-                llm_payload = {
-                    "input": recognized_text,
-                    "context": {
-                        "intent": intent_result.get("intent"),
-                        "client_id": client_id
-                    }
-                }
-                
-                llm_response = await call_service_with_retry(
-                    client,
-                    f"{LLM_SERVICE_URL}/generate",
-                    json=llm_payload
-                )
-                llm_result = llm_response.json()
-                
-                await manager.send_status(client_id, {
-                    "status": "service_success",
-                    "service": "llm",
-                    "message": "LLM服务处理完成",
-                    "result": llm_result
-                })
-                
-                llm_response_text = llm_result.get("response", "抱歉，我无法生成回复。")
-            except Exception as e:
-                logger.error(f"LLM服务调用失败: {str(e)}", exc_info=True)
-                await manager.send_status(client_id, {
-                    "status": "service_error",
-                    "service": "llm",
-                    "message": f"LLM服务处理失败: {str(e)}"
-                })
-                llm_response_text = "抱歉，我无法生成回复。服务出现问题。"
-            
-            # 6. 将LLM回复保存到记忆
-            try:
-                await call_service_with_retry(
-                    client,
-                    f"{MEMORY_SERVICE_URL}/store",
-                    json={
-                        "client_id": client_id,
-                        "text": llm_response_text,
-                        "type": "assistant_message"
-                    }
-                )
-            except Exception as e:
-                logger.error(f"保存回复到Memory失败: {str(e)}", exc_info=True)
-                # 不中断工作流
-            
-            # 7. 调用TTS服务生成语音
-            await manager.send_status(client_id, {
-                "status": "service_start",
-                "service": "tts",
-                "message": "开始调用TTS服务生成语音"
-            })
-            
+                    if event["event"] == "speech_end":
+                        segments.append({
+                            "start_time": event["start_time"],
+                            "end_time": event["time"],
+                            "duration": event["duration"]
+                        })
+                        endpointed = chunk is not None
+                if chunk is None:
+                    break
+
+        if endpointed:
+            cut_utterance()
+        result = {
+            "status": "success",
+            "detected_speech": len(segments) > 0,
+            "speech_segments": segments,
+            "endpointed": endpointed
+        }
+        await manager.send_status(client_id, {
+            "status": "service_success",
+            "service": "vad",
+            "message": "VAD服务处理完成",
+            "result": result
+        })
+        return result
+
+    sample_rate = parse_pcm_sample_rate(content_type)
+    if sample_rate in STREAMING_VAD_SAMPLE_RATES:
+        vad_stage = vad_session_stage(sample_rate)
+    else:
+        vad_stage = post_stream("vad", f"{VAD_SERVICE_URL}/v1/detect", vad_queue)
+
+    pump_task = asyncio.create_task(pump())
+    stage_tasks = [
+        asyncio.create_task(vad_stage),
+        asyncio.create_task(post_stream("asr", f"{ASR_SERVICE_URL}/recognize", asr_queue)),
+    ]
+    try:
+        # 同时等待上游读取：上游中途出错（如客户端断开）时两路都收不到结束标记，需要立即取消
+        waiting = {pump_task, *stage_tasks}
+        while not all(task.done() for task in stage_tasks):
+            done, waiting = await asyncio.wait(
+                waiting, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise DeadlineExceeded(f"客户端 {client_id} 的流式音频未能在截止时间前完成识别")
+            for task in done:
+                # 已取消的任务调用 exception() 会抛出 CancelledError，转换为普通错误交给调用方处理
+                if task.cancelled():
+                    raise RuntimeError(f"客户端 {client_id} 的流式音频转发已被取消")
+                if task.exception() is not None:
+                    raise task.exception()
+        vad_result, asr_result = (task.result() for task in stage_tasks)
+    except BaseException:
+        # 任意一路失败都取消其余转发，避免另一侧阻塞在已满的队列上；
+        # 等待取消完成并取回各任务的异常，不留下未处理的异常
+        tasks = [pump_task, *stage_tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return vad_result, asr_result, pump_task
+
+@dataclass
+class WorkflowContext:
+    """工作流各阶段共享的调用上下文；各阶段调用下游服务的超时和重试受 deadline 限制"""
+    client_id: str
+    deadline: Deadline = field(default_factory=Deadline)
+
+async def call_stage_service(ctx: WorkflowContext, service: str, start_message: str, url: str, **kwargs) -> dict:
+    """调用一个下游服务并发送开始、完成或失败状态"""
+    await manager.send_status(ctx.client_id, {
+        "status": "service_start",
+        "service": service,
+        "message": start_message
+    })
+    try:
+        response = await call_service_with_retry(
+            http_pool.client_for_url(url), url, ctx.deadline, attempt_timeout=attempt_timeout_for(service),
+            retry_budget=retry_budget, **kwargs
+        )
+        result = response.json()
+    except Exception as e:
+        logger.error(f"{service.upper()}服务调用失败: {str(e)}", exc_info=True)
+        await manager.send_status(ctx.client_id, {
+            "status": "service_error",
+            "service": service,
+            "message": f"{service.upper()}服务处理失败: {str(e)}"
+        })
+        raise
+    await manager.send_status(ctx.client_id, {
+        "status": "service_success",
+        "service": service,
+        "message": f"{service.upper()}服务处理完成",
+        "result": result
+    })
+    return result
+
+# 1. 调用VAD服务检测语音
+async def vad_stage(ctx: WorkflowContext, audio: bytes) -> dict:
+    return await call_stage_service(
+        ctx, "vad", "开始调用VAD服务检测语音活动", f"{VAD_SERVICE_URL}/v1/detect", content=audio
+    )
+
+# 2. 调用ASR服务进行语音识别，与VAD同时投机执行
+async def asr_stage(ctx: WorkflowContext, audio: bytes) -> dict:
+    return await call_stage_service(
+        ctx, "asr", "开始调用ASR服务进行语音识别", f"{ASR_SERVICE_URL}/recognize", content=audio
+    )
+
+async def speech_stage(ctx: WorkflowContext, vad: dict) -> bool:
+    """如果没有检测到语音，提前结束工作流"""
+    if vad.get("detected_speech", False):
+        return True
+    await manager.send_status(ctx.client_id, {
+        "status": "complete",
+        "message": "未检测到语音，工作流结束",
+        "result": {"error": "No speech detected"}
+    })
+    return False
+
+async def text_stage(ctx: WorkflowContext, asr: dict) -> str:
+    return asr.get("text", "")
+
+# 3. 调用意图识别服务
+async def intent_stage(ctx: WorkflowContext, text: str) -> dict:
+    return await call_stage_service(
+        ctx, "intent", "开始调用Intent服务进行意图识别", f"{INTENT_SERVICE_URL}/detect_intent",
+        json={"text": text}
+    )
+
+# 4. 保存到记忆服务，后台执行，不阻塞LLM
+async def memory_user_stage(ctx: WorkflowContext, text: str, intent: dict):
+    memory_data = {
+        "client_id": ctx.client_id,
+        "text": text,
+        "intent": intent.get("intent"),
+        "type": "user_message"
+    }
+    await manager.send_status(ctx.client_id, {
+        "status": "service_start",
+        "service": "memory",
+        "message": "开始调用Memory服务存储对话"
+    })
+    try:
+        result = await memory_writes.add(memory_data)
+    except Exception as e:
+        # 这里不中断工作流，继续执行；批量写入失败的原因已由缓冲区记录
+        await manager.send_status(ctx.client_id, {
+            "status": "service_error",
+            "service": "memory",
+            "message": f"MEMORY服务处理失败: {str(e)}"
+        })
+        return
+    await manager.send_status(ctx.client_id, {
+        "status": "service_success",
+        "service": "memory",
+        "message": "MEMORY服务处理完成",
+        "result": result
+    })
+
+# 组装LLM上下文：最近的历史对话和相关记忆，与意图识别并行
+async def context_stage(ctx: WorkflowContext, text: str) -> dict:
+    context = await context_builder.build(ctx.client_id, text)
+    logger.info(
+        f"客户端 {ctx.client_id} 的上下文: {len(context['messages'])} 条消息，约 {context['tokens']} tokens"
+    )
+    return context
+
+# 5. 调用LLM服务流式生成回复，边生成边按句切分；高置信度的简单意图（如查询时间）直接本地回复
+async def llm_stage(ctx: WorkflowContext, text: str, intent: dict, context: dict) -> ReplyStream:
+    reply = ReplyStream()
+    local_response = fast_path.reply(text, intent)
+    if local_response is not None:
+        reply.start(produce_local_reply(ctx, reply, intent, local_response))
+        return reply
+
+    llm_payload = {
+        "input": text,
+        "messages": context["messages"],
+        "context": {
+            "intent": intent.get("intent"),
+            "client_id": ctx.client_id
+        },
+        "stream": True
+    }
+    reply.start(produce_reply(ctx, reply, llm_payload))
+    return reply
+
+async def produce_local_reply(ctx: WorkflowContext, reply: ReplyStream, intent: dict, response_text: str) -> str:
+    logger.info(f"意图 {intent.get('intent')} 命中快速通道，不调用LLM")
+    reply.put(response_text)
+    await manager.send_status(ctx.client_id, {
+        "status": "service_success",
+        "service": "llm",
+        "message": "意图快速通道直接回复",
+        "result": {"response": response_text, "fast_path": intent.get("intent")}
+    })
+    return response_text
+
+async def produce_reply(ctx: WorkflowContext, reply: ReplyStream, llm_payload: dict) -> str:
+    """读取LLM的token流，每完成一句就交给TTS，返回完整回复"""
+    await manager.send_status(ctx.client_id, {
+        "status": "service_start",
+        "service": "llm",
+        "message": "开始调用LLM服务生成回复"
+    })
+    segmenter = SentenceSegmenter()
+    parts: List[str] = []
+    try:
+        # 流式响应无法在中途重试，因此不经过重试装饰器
+        async with http_pool.client("llm").stream(
+            "POST", f"{LLM_SERVICE_URL}/generate", json=llm_payload, headers=ctx.deadline.headers(),
+            timeout=ctx.deadline.timeout(attempt_timeout_for("llm") or http_pool.timeout)
+        ) as response:
+            response.raise_for_status()
+            async for delta in iter_chat_deltas(response):
+                parts.append(delta)
+                for segment in segmenter.feed(delta):
+                    reply.put(segment)
+    except Exception as e:
+        logger.error(f"LLM服务调用失败: {str(e)}", exc_info=True)
+        await manager.send_status(ctx.client_id, {
+            "status": "service_error",
+            "service": "llm",
+            "message": f"LLM服务处理失败: {str(e)}"
+        })
+        if not parts:
+            reply.put("抱歉，我无法生成回复。服务出现问题。")
+            return "抱歉，我无法生成回复。服务出现问题。"
+        # 已生成的部分照常合成语音
+
+    for segment in segmenter.flush():
+        reply.put(segment)
+    response_text = "".join(parts)
+    if not response_text:
+        response_text = "抱歉，我无法生成回复。"
+        reply.put(response_text)
+
+    await manager.send_status(ctx.client_id, {
+        "status": "service_success",
+        "service": "llm",
+        "message": "LLM服务处理完成",
+        "result": {"response": response_text}
+    })
+    return response_text
+
+# 6. 将LLM回复保存到记忆，后台执行，不阻塞TTS
+async def memory_assistant_stage(ctx: WorkflowContext, llm: ReplyStream):
+    try:
+        reply_text = await llm.text()
+        context_builder.record(ctx.client_id, "assistant", reply_text)
+        await memory_writes.add({
+            "client_id": ctx.client_id,
+            "text": reply_text,
+            "type": "assistant_message"
+        })
+    except Exception as e:
+        logger.error(f"保存回复到Memory失败: {str(e)}")
+        # 不中断工作流
+
+# 7. 每收到一句回复立即调用TTS服务生成语音，按句子顺序推送给客户端
+async def tts_stage(ctx: WorkflowContext, llm: ReplyStream) -> dict:
+    await manager.send_status(ctx.client_id, {
+        "status": "service_start",
+        "service": "tts",
+        "message": "开始调用TTS服务生成语音"
+    })
+    slots = asyncio.Semaphore(TTS_SEGMENT_CONCURRENCY)
+    stream_audio = TTS_OUTPUT_MODE == "stream"
+
+    async def synthesize(segment: str) -> dict:
+        async with slots:
             try:
-                tts_payload = {
-                    "text": llm_response_text
-                }
-                
-                tts_response = await call_service_with_retry(
-                    client,
-                    f"{TTS_SERVICE_URL}/synthesize",
-                    json=tts_payload
+                response = await call_service_with_retry(
+                    http_pool.client("tts"), f"{TTS_SERVICE_URL}/synthesize", ctx.deadline,
+                    attempt_timeout=attempt_timeout_for("tts"), retry_budget=retry_budget, json={"text": segment}
                 )
-                tts_result = tts_response.json()
-                
-                await manager.send_status(client_id, {
-                    "status": "service_success",
-                    "service": "tts",
-                    "message": "TTS服务处理完成",
-                    "result": tts_result
-                })
+                return response.json()
             except Exception as e:
                 logger.error(f"TTS服务调用失败: {str(e)}", exc_info=True)
-                await manager.send_status(client_id, {
-                    "status": "service_error",
-                    "service": "tts",
-                    "message": f"TTS服务处理失败: {str(e)}"
-                })
-                tts_result = {"audio_url": None}
-            
-            # 8. 通知工作流处理完成
-            final_result = {
-                "recognized_text": recognized_text,
-                "intent": intent_result.get("intent") if 'intent_result' in locals() else None,
-                "response_text": llm_response_text,
-                "audio_url": tts_result.get("audio_url")
-            }
-            
-            await manager.send_status(client_id, {
-                "status": "complete",
-                "message": "工作流处理完成",
-                "result": final_result
-            })
-            
-        except httpx.HTTPStatusError as e:
-            error_message = f"调用服务出错: {e.response.status_code} - {e.response.text}"
-            logger.error(error_message)
-            await manager.send_status(client_id, {
-                "status": "error",
-                "message": error_message
-            })
+                return {"audio_url": None, "error": str(e)}
+
+    async def synthesize_stream(segment: str, frames: asyncio.Queue) -> dict:
+        """流式合成一句，音频帧写入队列，以 None 结束"""
+        size = 0
+        try:
+            async with slots:
+                async with http_pool.client("tts").stream(
+                    "POST", f"{TTS_SERVICE_URL}/synthesize",
+                    json={"text": segment, "stream": True, "format": "pcm", "sample_rate": TTS_STREAM_SAMPLE_RATE},
+                    headers=ctx.deadline.headers(),
+                    timeout=ctx.deadline.timeout(attempt_timeout_for("tts") or http_pool.timeout)
+                ) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        frames.put_nowait(chunk)
+            return {"audio_url": None, "bytes": size}
         except Exception as e:
-            error_message = f"工作流执行出错: {str(e)}"
-            logger.error(error_message, exc_info=True)
-            await manager.send_status(client_id, {
-                "status": "error",
-                "message": error_message
+            logger.error(f"TTS服务流式合成失败: {str(e)}", exc_info=True)
+            return {"audio_url": None, "bytes": size, "error": str(e)}
+        finally:
+            frames.put_nowait(None)
+
+    async def push_stream(index: int, segment: str, frames: asyncio.Queue, task: asyncio.Task) -> dict:
+        """按顺序把一句的音频帧推送给客户端，前后各发送一条状态消息"""
+        await manager.send_status(ctx.client_id, {
+            "status": "tts_audio_start",
+            "service": "tts",
+            "result": {"index": index, "text": segment, "format": "pcm_s16le",
+                       "sample_rate": TTS_STREAM_SAMPLE_RATE, "channels": 1}
+        })
+        while True:
+            chunk = await frames.get()
+            if chunk is None:
+                break
+            await manager.send_audio(ctx.client_id, chunk)
+        result = await task
+        await manager.send_status(ctx.client_id, {
+            "status": "tts_audio_end",
+            "service": "tts",
+            "result": {"index": index, "bytes": result["bytes"]}
+        })
+        return result
+
+    # 合成任务按句子到达的顺序排队，并发执行，按顺序取结果
+    pending: asyncio.Queue = asyncio.Queue()
+
+    async def dispatch():
+        async for segment in llm.segments():
+            if stream_audio:
+                frames: asyncio.Queue = asyncio.Queue()
+                pending.put_nowait((segment, asyncio.create_task(synthesize_stream(segment, frames)), frames))
+            else:
+                pending.put_nowait((segment, asyncio.create_task(synthesize(segment)), None))
+        pending.put_nowait(None)
+
+    dispatcher = asyncio.create_task(dispatch())
+    segments = []
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            segment, task, frames = item
+            if frames is not None:
+                result = await push_stream(len(segments), segment, frames, task)
+            else:
+                result = await task
+            segments.append({"text": segment, **result})
+            await manager.send_status(ctx.client_id, {
+                "status": "tts_segment",
+                "service": "tts",
+                "message": f"第{len(segments)}句语音合成完成",
+                "result": {"index": len(segments) - 1, "text": segment, "audio_url": result.get("audio_url")}
             })
+    finally:
+        # 工作流被取消时同时停止LLM生成和尚未完成的合成任务
+        dispatcher.cancel()
+        llm.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if item is not None:
+                item[1].cancel()
+
+    audio_urls = [s["audio_url"] for s in segments if s.get("audio_url")]
+    if any("error" in s for s in segments):
+        await manager.send_status(ctx.client_id, {
+            "status": "service_error",
+            "service": "tts",
+            "message": "TTS服务部分语音合成失败"
+        })
+    else:
+        await manager.send_status(ctx.client_id, {
+            "status": "service_success",
+            "service": "tts",
+            "message": "TTS服务处理完成",
+            "result": {"segments": len(segments)}
+        })
+    return {"audio_url": audio_urls[0] if audio_urls else None, "segments": segments}
+
+# 8. 通知工作流处理完成
+async def complete_stage(ctx: WorkflowContext, text: str, intent: dict, llm: ReplyStream, tts: dict) -> dict:
+    final_result = {
+        "recognized_text": text,
+        "intent": intent.get("intent"),
+        "response_text": await llm.text(),
+        "audio_url": tts.get("audio_url"),
+        "audio_segments": [segment.get("audio_url") for segment in tts.get("segments", [])]
+    }
+    await manager.send_status(ctx.client_id, {
+        "status": "complete",
+        "message": "工作流处理完成",
+        "result": final_result
+    })
+    return final_result
+
+# 从识别文本开始的阶段：记忆写入不在关键路径上，LLM在意图识别完成后立即开始，
+# LLM阶段返回回复流，TTS边读取边合成
+TEXT_STAGES = [
+    Stage("intent", intent_stage, inputs=["text"]),
+    Stage("memory_user", memory_user_stage, inputs=["text", "intent"], background=True),
+    Stage("context", context_stage, inputs=["text"]),
+    Stage("llm", llm_stage, inputs=["text", "intent", "context"]),
+    Stage("memory_assistant", memory_assistant_stage, inputs=["llm"], background=True),
+    Stage("tts", tts_stage, inputs=["llm"]),
+    Stage("complete", complete_stage, inputs=["text", "intent", "llm", "tts"]),
+]
+
+text_workflow = Workflow("text", TEXT_STAGES, inputs=["text"])
+
+# VAD和ASR读取同一段音频，ASR与VAD并行投机执行，未检测到语音时取消
+audio_workflow = Workflow("audio", [
+    Stage("vad", vad_stage, inputs=["audio"]),
+    Stage("asr", asr_stage, inputs=["audio"], speculative=True),
+    Stage("speech", speech_stage, inputs=["vad"]),
+    Stage("text", text_stage, inputs=["asr"], when="speech"),
+    *TEXT_STAGES,
+], inputs=["audio"])
+
+# 任务队列的消费者：执行一个工作流并发送状态更新
+async def execute_workflow_job(job: Job):
+    """失败时通知客户端后抛出异常，由任务队列转入死信"""
+    context = WorkflowContext(job.client_id, Deadline(job.deadline))
+    if job.redelivered:
+        logger.warning(f"工作流任务 {job.job_id} 被重新投递，重新执行")
+    if context.deadline.expired:
+        # 排队时间超过了请求的截止时间，客户端已不再等待结果
+        logger.warning(f"工作流任务 {job.job_id} 在执行前已超过截止时间，不再执行")
+        await manager.send_status(job.client_id, {
+            "status": "error",
+            "message": "请求已超时，请重试"
+        })
+        return
+    try:
+        if job.kind == "audio":
+            # 通知开始处理工作流
+            await manager.send_status(job.client_id, {
+                "status": "start",
+                "message": "开始处理音频工作流"
+            })
+            await audio_workflow.run(context, audio=job.payload)
+        elif job.kind == "text":
+            # 从识别文本开始执行后续工作流（流式音频入口在ASR完成后提交）
+            await text_workflow.run(context, text=job.payload.decode("utf-8"))
+        else:
+            raise ValueError(f"未知的工作流类型: {job.kind}")
+    except Exception as e:
+        await notify_workflow_error(job.client_id, e)
+        raise
+
+async def notify_workflow_error(client_id: str, e: Exception):
+    """记录工作流异常并通知客户端"""
+    if isinstance(e, httpx.HTTPStatusError):
+        error_message = f"调用服务出错: {e.response.status_code} - {e.response.text}"
+        logger.error(error_message)
+    else:
+        error_message = f"工作流执行出错: {str(e)}"
+        logger.error(error_message, exc_info=True)
+    await manager.send_status(client_id, {
+        "status": "error",
+        "message": error_message
+    })
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 句末标点，遇到即切分
+SENTENCE_ENDINGS = set("。！？；!?;…\n")
+# 分句标点，片段达到 MIN_CLAUSE_CHARS 个字符后才在此切分，避免过短的片段
+CLAUSE_ENDINGS = set("，、：,:")
+MIN_CLAUSE_CHARS = 6
+
+
+class SentenceSegmenter:
+    """
+    将流式输出的文本按标点切分为句子或分句
+
+    英文句点只有在后面不是数字时才视为句末（避免切开 3.14），因此以句点结尾时等待下一个 token 再判断。
+    """
+
+    def __init__(self, min_clause_chars: int = MIN_CLAUSE_CHARS):
+        self.min_clause_chars = min_clause_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """追加一段文本，返回新完成的片段"""
+        self._buffer += text
+        segments = []
+        start = 0
+        for index, char in enumerate(self._buffer):
+            if char == ".":
+                if index + 1 >= len(self._buffer):
+                    break
+                if self._buffer[index + 1].isdigit() or self._buffer[index + 1] == ".":
+                    continue
+            elif char not in SENTENCE_ENDINGS and not (
+                char in CLAUSE_ENDINGS and index + 1 - start >= self.min_clause_chars
+            ):
+                continue
+            segment = self._buffer[start:index + 1].strip()
+            if segment:
+                segments.append(segment)
+            start = index + 1
+        self._buffer = self._buffer[start:]
+        return segments
+
+    def flush(self) -> List[str]:
+        """文本结束时返回剩余内容"""
+        segment, self._buffer = self._buffer.strip(), ""
+        return [segment] if segment else []
+
+
+async def iter_sse_json(response: httpx.Response) -> AsyncIterator[dict]:
+    """逐个解析 Server-Sent Events 中的 JSON 数据，读到 [DONE] 时结束"""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        yield json.loads(data)
+
+
+async def iter_chat_deltas(response: httpx.Response) -> AsyncIterator[str]:
+    """从 chat.completion.chunk 流中取出增量文本"""
+    async for chunk in iter_sse_json(response):
+        for choice in chunk.get("choices", []):
+            content = choice.get("delta", {}).get("content")
+            if content:
+                yield content
+
+
+class ReplyStream:
+    """
+    LLM 回复流
+
+    生产者逐句写入片段，消费者（TTS）边生成边读取；完整回复在生成结束后通过 text() 获取。
+    """
+
+    def __init__(self):
+        self._segments: asyncio.Queue = asyncio.Queue()
+        self._text: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, producer):
+        """在后台运行生产者协程，生产者返回完整回复文本"""
+        self._task = asyncio.create_task(producer)
+        self._task.add_done_callback(self._finish)
+
+    def put(self, segment: str):
+        self._segments.put_nowait(segment)
+
+    async def segments(self) -> AsyncIterator[str]:
+        """按顺序读取片段，直到生成结束"""
+        while True:
+            segment = await self._segments.get()
+            if segment is None:
+                break
+            yield segment
+
+    async def text(self) -> str:
+        return await asyncio.shield(self._text)
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def _finish(self, task: asyncio.Task):
+        self._segments.put_nowait(None)
+        if task.cancelled():
+            self._text.cancel()
+        elif task.exception() is not None:
+            self._text.set_exception(task.exception())
+        else:
+            self._text.set_result(task.result())
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 被跳过的阶段的结果，依赖它的阶段也会被跳过
+SKIPPED = object()
+
+
+@dataclass
+class Stage:
+    """
+    工作流中的一个阶段
+
+    func 以 func(context, **inputs) 的形式调用，inputs 中的每一项是同名上游阶段（或工作流输入）的结果。
+    when: 守卫阶段名，先于其他输入等待，其结果为假时跳过本阶段，不再等待其余输入
+    speculative: 投机执行的阶段，没有下游需要它的结果时在工作流结束时被取消
+    background: 后台阶段（如记忆写入），不阻塞下游阶段，失败只记录日志
+    """
+    name: str
+    func: Callable[..., Awaitable[Any]]
+    inputs: List[str] = field(default_factory=list)
+    when: Optional[str] = None
+    speculative: bool = False
+    background: bool = False
+
+    @property
+    def dependencies(self) -> List[str]:
+        return ([self.when] if self.when else []) + self.inputs
+
+
+class Workflow:
+    """
+    基于有向无环图的工作流引擎
+
+    每个阶段在其依赖全部完成后立即启动，相互独立的阶段并发执行。
+    前台阶段的异常会沿依赖向下游传播，任一前台阶段失败时取消其余前台阶段并抛出该异常。
+    run 在前台阶段完成后仍会等待后台阶段结束，保证它们使用的连接等资源在此期间有效。
+    """
+
+    def __init__(self, name: str, stages: Iterable[Stage], inputs: Iterable[str] = ()):
+        self.name = name
+        self.inputs = list(inputs)
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages or stage.name in self.inputs:
+                raise ValueError(f"工作流 {name} 中阶段名重复: {stage.name}")
+            self.stages[stage.name] = stage
+        self._validate()
+
+    def _validate(self):
+        known = set(self.inputs) | set(self.stages)
+        for stage in self.stages.values():
+            unknown = [dep for dep in stage.dependencies if dep not in known]
+            if unknown:
+                raise ValueError(f"工作流 {self.name} 的阶段 {stage.name} 依赖未定义的阶段: {unknown}")
+
+        # 检查环：深度优先遍历，visiting 中的节点再次出现即成环
+        visited, visiting = set(), set()
+
+        def visit(name: str):
+            if name in visited or name not in self.stages:
+                return
+            if name in visiting:
+                raise ValueError(f"工作流 {self.name} 中存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in self.stages[name].dependencies:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    async def run(self, context: Any, **inputs) -> Dict[str, Any]:
+        """
+        执行工作流，返回各阶段的结果（被跳过的阶段结果为 SKIPPED，被取消的投机阶段不包含在内）
+        """
+        missing = [name for name in self.inputs if name not in inputs]
+        if missing:
+            raise ValueError(f"工作流 {self.name} 缺少输入: {missing}")
+
+        loop = asyncio.get_running_loop()
+        futures: Dict[str, asyncio.Future] = {}
+        for name in self.inputs:
+            futures[name] = loop.create_future()
+            futures[name].set_result(inputs[name])
+
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self._topological_order():
+            tasks[name] = futures[name] = asyncio.create_task(
+                self._run_stage(self.stages[name], context, futures), name=f"{self.name}:{name}"
+            )
+
+        foreground = [task for name, task in tasks.items()
+                      if not self.stages[name].background and not self.stages[name].speculative]
+        try:
+            await asyncio.gather(*foreground)
+        except BaseException:
+            for name, task in tasks.items():
+                if not self.stages[name].background:
+                    task.cancel()
+            raise
+        finally:
+            await self._finish_detached(tasks)
+
+        return {
+            name: task.result() for name, task in tasks.items()
+            if task.done() and not task.cancelled() and task.exception() is None
+        }
+
+    def _topological_order(self) -> List[str]:
+        order, seen = [], set(self.inputs)
+
+        def visit(name: str):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self.stages[name].dependencies:
+                visit(dep)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    async def _run_stage(self, stage: Stage, context: Any, futures: Dict[str, asyncio.Future]) -> Any:
+        # 守卫先于其他输入等待，条件不满足时无需等待投机执行的上游
+        if stage.when:
+            guard = await futures[stage.when]
+            if guard is SKIPPED or not guard:
+                return SKIPPED
+
+        values = await asyncio.gather(*(futures[name] for name in stage.inputs))
+        if any(value is SKIPPED for value in values):
+            return SKIPPED
+        return await stage.func(context, **dict(zip(stage.inputs, values)))
+
+    async def _finish_detached(self, tasks: Dict[str, asyncio.Task]):
+        """取消没有被使用的投机阶段，等待后台阶段结束并记录其异常"""
+        detached = []
+        for name, task in tasks.items():
+            stage = self.stages[name]
+            if stage.speculative and not task.done():
+                logger.info(f"工作流 {self.name} 取消未被使用的投机阶段: {name}")
+                task.cancel()
+            if stage.background or stage.speculative:
+                detached.append(name)
+
+        results = await asyncio.gather(*(tasks[name] for name in detached), return_exceptions=True)
+        for name, result in zip(detached, results):
+            # 投机阶段的异常已经传播给使用它的下游阶段；上游失败导致的异常已由上游记录
+            if not self.stages[name].background or not isinstance(result, Exception):
+                continue
+            upstream = [tasks[dep] for dep in self.stages[name].dependencies if dep in tasks]
+            if not any(not t.cancelled() and t.exception() is not None for t in upstream):
+                logger.error(f"工作流 {self.name} 的后台阶段 {name} 失败: {str(result)}", exc_info=result)
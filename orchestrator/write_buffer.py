@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    合并写入缓冲区
+
+    多个并发工作流的写入先进入缓冲区，攒够 max_batch 条或第一条等待超过 max_delay 秒后一次性发送。
+    add 返回的 Future 在所在批次写入完成后得到该条写入的结果，写入失败时得到异常。
+    flush 接收一批数据，返回与之一一对应的结果列表。
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[List[Any]]], max_batch: int = 32, max_delay: float = 0.05):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    def add(self, item: Any) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return future
+
+    async def aclose(self):
+        """发送缓冲区中剩余的数据并等待所有批次完成"""
+        if self._pending:
+            self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "in_flight": len(self._flushing),
+            "batches": self.batches,
+            "items": self.items,
+            "failed_batches": self.failed_batches,
+        }
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._send(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _send(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.flush([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"批量写入返回 {len(results)} 条结果，期望 {len(batch)} 条")
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"批量写入 {len(batch)} 条数据失败: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Request
+from shared.utils.deadline import DeadlineMiddleware
 import logging
 
 # Configure logging
@@ -6,6 +7,8 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="ASR Service", version="1.0.0")
+# 调用方设置的截止时间已过的请求直接返回504，不再处理
+app.add_middleware(DeadlineMiddleware)
 
 @app.get("/health")
 async def health_check():
@@ -13,11 +16,15 @@ async def health_check():
 
 @app.post("/recognize")
 async def recognize_speech(request: Request):
-    """将音频转换为文本"""
-    audio_data = await request.body()
+    """将音频转换为文本，支持分块传输的流式音频"""
+    # 逐块读取请求体，上游边录音边发送时可以在音频结束前开始处理
+    logger.info("ASR服务开始接收音频数据")
+    received_bytes = 0
+    async for chunk in request.stream():
+        received_bytes += len(chunk)
     
     # 记录服务的处理状态
-    logger.info(f"ASR服务开始处理 {len(audio_data)} 字节的音频数据")
+    logger.info(f"ASR服务共接收 {received_bytes} 字节的音频数据")
     logger.info("ASR服务处理中...")
     logger.info("ASR服务处理完毕")
     
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.intent_service.cache import ResultCache
+from services.intent_service.matcher import AhoCorasick
+
+logger = logging.getLogger(__name__)
+
+# 句末的标点和空白不影响意图，去掉后作为缓存键，使“现在几点？”和“现在几点”共用一条缓存
+CACHE_KEY_TRAILING_CHARS = " \t\r\n。！？!?.，,、~～…"
+
+
+def normalize_text(text: str) -> str:
+    """全角转半角、统一大小写，规则中的关键词和待匹配文本使用相同的规范化"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def intent_cache_key(text: str) -> str:
+    """只去掉末尾的字符，缓存的实体位置对同一键的其他文本仍然有效"""
+    return normalize_text(text).rstrip(CACHE_KEY_TRAILING_CHARS)
+
+
+@dataclass
+class IntentRule:
+    name: str
+    confidence: float
+    order: int
+    function: Optional[Dict[str, Any]] = None
+
+
+class RuleSet:
+    """
+    编译后的意图规则
+
+    所有意图和实体的关键词编译成一个 Aho-Corasick 自动机，所有正则编译成一个带命名分组的组合正则，
+    每段文本只需各扫描一遍，匹配耗时与规则数量无关。
+    """
+
+    def __init__(self, config: Dict[str, Any], version: int = 0):
+        self.version = version
+        default = config.get("default_intent", {})
+        self.default_intent = default.get("name", "闲聊")
+        self.default_confidence = float(default.get("confidence", 0.6))
+
+        keywords: List[Tuple[str, Tuple[str, Any]]] = []
+        patterns: List[Tuple[str, Tuple[str, Any]]] = []
+        self.intents: List[IntentRule] = []
+        for order, rule in enumerate(config.get("intents", [])):
+            self.intents.append(IntentRule(
+                name=rule["name"],
+                confidence=float(rule.get("confidence", 0.5)),
+                order=order,
+                function=rule.get("function"),
+            ))
+            keywords += [(normalize_text(k), ("intent", order)) for k in rule.get("keywords", [])]
+            patterns += [(p, ("intent", order)) for p in rule.get("patterns", [])]
+        for entity_type, rule in config.get("entities", {}).items():
+            keywords += [(normalize_text(k), ("entity", entity_type)) for k in rule.get("keywords", [])]
+            patterns += [(p, ("entity", entity_type)) for p in rule.get("patterns", [])]
+
+        self.keyword_count = len(keywords)
+        self.pattern_count = len(patterns)
+        self._automaton = AhoCorasick(keywords)
+        self._pattern_targets = {f"p{i}": target for i, (_, target) in enumerate(patterns)}
+        for pattern, target in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"规则 {target[1]} 的正则无效: {pattern}, 错误: {str(e)}")
+        self._regex = re.compile("|".join(
+            f"(?P<p{i}>{pattern})" for i, (pattern, _) in enumerate(patterns)
+        )) if patterns else None
+
+    @classmethod
+    def from_file(cls, path: str, version: int = 0) -> "RuleSet":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), version=version)
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        """返回按置信度排列的全部命中意图和抽取出的实体"""
+        normalized = normalize_text(text)
+        hits: Dict[int, List[str]] = {}
+        candidates: List[Tuple[int, int, str]] = []
+
+        matches = [(start, end, target) for start, end, target in self._automaton.iter_matches(normalized)]
+        if self._regex is not None:
+            matches += [
+                (m.start(), m.end(), self._pattern_targets[m.lastgroup])
+                for m in self._regex.finditer(normalized) if m.end() > m.start()
+            ]
+        for start, end, (kind, key) in matches:
+            if kind == "intent":
+                hits.setdefault(key, []).append(normalized[start:end])
+            else:
+                candidates.append((start, end, key))
+
+        intents = sorted(
+            ({
+                "intent": self.intents[order].name,
+                "confidence": self.intents[order].confidence,
+                "matches": sorted(set(words)),
+                "order": order,
+            } for order, words in hits.items()),
+            key=lambda item: (-item["confidence"], item["order"])
+        )
+        for item in intents:
+            del item["order"]
+        # 规范化不改变长度时实体取原文，保留大小写
+        source = text if len(text) == len(normalized) else normalized
+        return {"intents": intents, "entities": self._resolve_entities(source, candidates)}
+
+    def function_call(self, intent: str, entities: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """按意图规则中的函数定义生成函数调用，参数可以取自抽取出的实体"""
+        rule = next((rule for rule in self.intents if rule.name == intent), None)
+        if rule is None or not rule.function:
+            return None
+        arguments = {}
+        for name, spec in rule.function.get("arguments", {}).items():
+            if isinstance(spec, dict) and "entity" in spec:
+                value = next((e["value"] for e in entities if e["type"] == spec["entity"]), None)
+                arguments[name] = value if value is not None else spec.get("default")
+            else:
+                arguments[name] = spec
+        return {"name": rule.function["name"], "arguments": arguments}
+
+    @staticmethod
+    def _resolve_entities(text: str, candidates: List[Tuple[int, int, str]]) -> List[Dict[str, Any]]:
+        # 重叠的候选取最靠前、最长的一个
+        entities, last_end = [], 0
+        for start, end, entity_type in sorted(candidates, key=lambda c: (c[0], c[0] - c[1])):
+            if start < last_end:
+                continue
+            entities.append({"type": entity_type, "value": text[start:end], "start": start, "end": end})
+            last_end = end
+        return entities
+
+
+class IntentEngine:
+    """
+    从配置文件加载意图规则并支持热更新
+
+    定期检查规则文件的修改时间，变化后重新编译，新规则编译成功才替换，编译失败时继续使用旧规则。
+    识别结果按规范化后的文本缓存，规则替换时清空缓存。
+    """
+
+    def __init__(
+        self, rules_path: str, reload_interval: float = 2.0, cache_size: int = 10000, cache_ttl: float = 300.0
+    ):
+        self.rules_path = rules_path
+        self.reload_interval = reload_interval
+        self._mtime = os.path.getmtime(rules_path)
+        self.rules = RuleSet.from_file(rules_path, version=1)
+        self.reload_error: Optional[str] = None
+        self.cache = ResultCache(cache_size, cache_ttl)
+
+    def detect(self, text: str) -> Dict[str, Any]:
+        """返回 intent、confidence、intents、entities，以及结果是否来自缓存（cached）"""
+        key = intent_cache_key(text)
+        result = self.cache.get(key)
+        if result is not None:
+            return {**result, "cached": True}
+        rules = self.rules
+        analysis = rules.analyze(text)
+        top = analysis["intents"][0] if analysis["intents"] else None
+        result = {
+            "intent": top["intent"] if top else rules.default_intent,
+            "confidence": top["confidence"] if top else rules.default_confidence,
+            "intents": analysis["intents"],
+            "entities": analysis["entities"],
+        }
+        self.cache.put(key, result)
+        return {**result, "cached": False}
+
+    def function_call(self, text: str) -> Optional[Dict[str, Any]]:
+        rules = self.rules
+        result = self.detect(text)
+        return rules.function_call(result["intent"], result["entities"])
+
+    def reload(self, force: bool = False) -> bool:
+        """规则文件有变化（或 force）时重新加载，返回是否加载了新规则；编译失败时抛出异常"""
+        mtime = os.path.getmtime(self.rules_path)
+        if not force and mtime == self._mtime:
+            return False
+        try:
+            rules = RuleSet.from_file(self.rules_path, version=self.rules.version + 1)
+        except Exception as e:
+            self._mtime = mtime
+            self.reload_error = str(e)
+            raise
+        self.rules, self._mtime, self.reload_error = rules, mtime, None
+        self.cache.clear()
+        logger.info(f"意图规则已重新加载: 版本 {rules.version}，{len(rules.intents)} 个意图，{rules.keyword_count} 个关键词")
+        return True
+
+    async def watch(self):
+        """后台任务：定期检查规则文件"""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"意图规则重新加载失败，继续使用版本 {self.rules.version}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules_path": self.rules_path,
+            "version": self.rules.version,
+            "intents": len(self.rules.intents),
+            "keywords": self.rules.keyword_count,
+            "patterns": self.rules.pattern_count,
+            "reload_error": self.reload_error,
+            "cache": self.cache.stats(),
+        }
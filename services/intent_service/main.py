@@ -1,56 +1,80 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
+from services.intent_service.engine import IntentEngine
+from shared.utils.deadline import DeadlineMiddleware
+import asyncio
 import logging
-from typing import Dict, List, Any
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Intent Service", version="1.0.0")
+# 调用方设置的截止时间已过的请求直接返回504，不再处理
+app.add_middleware(DeadlineMiddleware)
+
+# 意图和实体规则从配置文件加载，文件修改后自动重新加载（间隔为0时不检查）
+INTENT_RULES_PATH = os.getenv("INTENT_RULES_PATH", os.path.join(os.path.dirname(__file__), "intents.json"))
+INTENT_RULES_RELOAD_INTERVAL = float(os.getenv("INTENT_RULES_RELOAD_INTERVAL", "2"))
+# 识别结果缓存：按规范化文本缓存的条数和有效期（秒），条数为0时不缓存
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "10000"))
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "300"))
+
+intent_engine = IntentEngine(
+    INTENT_RULES_PATH,
+    reload_interval=INTENT_RULES_RELOAD_INTERVAL,
+    cache_size=INTENT_CACHE_SIZE,
+    cache_ttl=INTENT_CACHE_TTL,
+)
+reload_task = None
+
+@app.on_event("startup")
+async def startup():
+    global reload_task
+    if INTENT_RULES_RELOAD_INTERVAL > 0:
+        reload_task = asyncio.create_task(intent_engine.watch())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if reload_task is not None:
+        reload_task.cancel()
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service_name": "intent-service"}
+    return {"status": "ok", "service_name": "intent-service", "rules": intent_engine.stats()}
+
+@app.post("/reload")
+async def reload_rules():
+    """立即重新加载意图规则"""
+    try:
+        intent_engine.reload(force=True)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"意图规则加载失败: {str(e)}")
+    return {"status": "success", "rules": intent_engine.stats()}
 
 @app.post("/detect_intent")
 async def detect_intent(request: Request):
     """检测用户文本中的意图"""
     payload = await request.json()
     text = payload.get("text", "")
-    
+
     # 记录服务的处理状态
     logger.info(f"Intent服务开始处理文本: {text}")
     logger.info("Intent服务处理中...")
-    
-    # 简单的意图检测逻辑，实际项目中可以使用NLP模型
-    intent = "unknown"
-    confidence = 0.0
-    
-    # 模拟一些简单的意图匹配
-    if "天气" in text or "温度" in text:
-        intent = "查询天气"
-        confidence = 0.95
-    elif "时间" in text or "几点" in text:
-        intent = "查询时间"
-        confidence = 0.90
-    elif "播放" in text or "音乐" in text or "歌曲" in text:
-        intent = "播放音乐"
-        confidence = 0.85
-    elif "新闻" in text or "热点" in text:
-        intent = "获取新闻"
-        confidence = 0.80
-    else:
-        intent = "闲聊"
-        confidence = 0.60
-    
+
+    # 按规则匹配意图并抽取实体，未命中任何意图时为闲聊
+    result = intent_engine.detect(text)
+
     logger.info("Intent服务处理完毕")
-    
+
     return {
         "status": "success",
-        "intent": intent,
-        "confidence": confidence,
+        "intent": result["intent"],
+        "confidence": result["confidence"],
         "text": text,
-        "entities": []  # 在实际应用中，这里可能包含识别出的实体
+        "entities": result["entities"],
+        "intents": result["intents"],
+        "cached": result["cached"]
     }
 
 @app.post("/function_call")
@@ -58,37 +82,18 @@ async def function_call(request: Request):
     """生成函数调用格式的意图"""
     payload = await request.json()
     text = payload.get("text", "")
-    
+
     # 记录服务的处理状态
     logger.info(f"Intent服务开始处理函数调用: {text}")
     logger.info("Intent服务处理中...")
-    
-    # 模拟函数调用决策
-    function_call = None
-    
-    if "天气" in text:
-        function_call = {
-            "name": "get_weather",
-            "arguments": {
-                "location": "北京",
-                "unit": "celsius"
-            }
-        }
-    elif "播放" in text and "音乐" in text:
-        function_call = {
-            "name": "play_music",
-            "arguments": {
-                "genre": "流行",
-                "artist": "未指定"
-            }
-        }
-    
+
+    # 命中的意图定义了函数时生成函数调用，参数取自抽取出的实体
+    function_call = intent_engine.function_call(text)
+
     logger.info("Intent服务处理完毕")
-    
+
     return {
         "status": "success",
         "function_call": function_call,
         "text": text
     }
-
-# TODO: Add Intent specific endpoints, e.g., /detect_intent 
\ No newline at end of file
@@ -0,0 +1,64 @@
+from collections import deque
+from typing import Dict, Generic, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class AhoCorasick(Generic[T]):
+    """
+    Aho-Corasick 多模式匹配自动机
+
+    所有关键词编译成一个自动机，对文本只扫描一遍即可找出全部关键词的所有出现位置，
+    耗时与文本长度加匹配数成正比，与关键词数量无关。每个关键词可附带任意数据。
+    """
+
+    def __init__(self, patterns: List[Tuple[str, T]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态结束的关键词：(关键词长度, 附带数据)
+        self._outputs: List[List[Tuple[int, T]]] = [[]]
+        for pattern, value in patterns:
+            if pattern:
+                self._insert(pattern, value)
+        self._build_failure_links()
+
+    def __len__(self) -> int:
+        return sum(len(outputs) for outputs in self._outputs)
+
+    def _insert(self, pattern: str, value: T):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((len(pattern), value))
+
+    def _build_failure_links(self):
+        # 广度优先：失败指针指向当前状态对应字符串的最长真后缀所在的状态，
+        # 根节点的子状态失败指针均为根节点（构造时已为0），从第二层开始计算
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # 合并后缀状态的输出，扫描时不必沿失败指针查找
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, T]]:
+        """返回所有匹配的 (起始位置, 结束位置, 附带数据)，结束位置不包含在匹配内"""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, value in self._outputs[state]:
+                yield index + 1 - length, index + 1, value
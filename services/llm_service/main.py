@@ -1,12 +1,55 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 import logging
-from typing import Dict, Any
+import os
+import time
+import uuid
+from typing import Dict, Any, AsyncIterator
+from shared.utils.deadline import DeadlineMiddleware
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="LLM Service", version="1.0.0")
+# 调用方设置的截止时间已过的请求直接返回504，不再处理
+app.add_middleware(DeadlineMiddleware)
+
+# 模拟生成时每个token的间隔（毫秒）；默认不等待，压测或演示流式效果时再设置
+MOCK_TOKEN_DELAY_MS = float(os.getenv("MOCK_TOKEN_DELAY_MS", "0"))
+MOCK_CHAT_RESPONSE = "这是来自模拟LLM的响应示例。"
+
+# SSE 响应头：禁止缓存和反向代理缓冲，保证每个事件立即送达客户端
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def generate_tokens(text: str) -> AsyncIterator[str]:
+    """模拟逐token生成，每个字符作为一个token"""
+    for token in text:
+        if MOCK_TOKEN_DELAY_MS > 0:
+            await asyncio.sleep(MOCK_TOKEN_DELAY_MS / 1000)
+        yield token
+
+def sse_event(data: Any) -> str:
+    """编码一个 Server-Sent Events 事件"""
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+    return f"data: {data}\n\n"
+
+async def stream_chat_chunks(model: str, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """按 OpenAI chat.completion.chunk 格式逐个输出增量内容，以 [DONE] 结束"""
+    chunk = {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+    }
+    yield sse_event({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}]})
+    async for token in tokens:
+        yield sse_event({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+    yield sse_event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+    yield sse_event("[DONE]")
 
 @app.get("/health")
 async def health_check():
@@ -22,11 +65,24 @@ async def generate_text(request: Request):
     logger.info("LLM服务处理中...")
     logger.info("LLM服务处理完毕")
     
+    # 编排服务会附带组装好的对话上下文（OpenAI messages 格式），最后一条为本轮输入
+    messages = payload.get("messages") or []
+    if messages:
+        logger.info(f"LLM服务收到上下文 {len(messages)} 条消息")
+
     # 这里只是模拟处理，返回一个固定的结果
-    input_text = payload.get("input", "")
+    input_text = payload.get("input") or (messages[-1].get("content", "") if messages else "")
+    response_text = f"这是对'{input_text}'的LLM响应示例。"
+    if payload.get("stream"):
+        # 流式输出与 chat 接口相同的 chat.completion.chunk 事件
+        return StreamingResponse(
+            stream_chat_chunks("mock-model", generate_tokens(response_text)),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
     return {
         "status": "success",
-        "response": f"这是对'{input_text}'的LLM响应示例。",
+        "response": response_text,
         "model": "mock-model"
     }
 
@@ -35,6 +91,14 @@ async def chat_completions(request: Request):
     """OpenAI兼容的chat接口"""
     payload = await request.json()
     
+    if payload.get("stream"):
+        logger.info("LLM服务开始流式处理聊天请求")
+        return StreamingResponse(
+            stream_chat_chunks("mock-model", generate_tokens(MOCK_CHAT_RESPONSE)),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS
+        )
+
     # 记录服务的处理状态
     logger.info(f"LLM服务开始处理聊天请求")
     logger.info("LLM服务处理中...")
@@ -51,7 +115,7 @@ async def chat_completions(request: Request):
                 "index": 0,
                 "message": {
                     "role": "assistant",
-                    "content": "这是来自模拟LLM的响应示例。"
+                    "content": MOCK_CHAT_RESPONSE
                 },
                 "finish_reason": "stop"
             }
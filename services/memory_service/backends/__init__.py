@@ -0,0 +1,17 @@
+"""
+Memory storage backends package
+"""
+from .base import BaseMemoryBackend
+
+
+def create_backend(name: str, **kwargs) -> BaseMemoryBackend:
+    """
+    按名称创建记忆存储后端；Redis 实现延迟导入，使用进程内存储时不需要安装 redis
+    """
+    if name == "memory":
+        from .memory import InMemoryBackend
+        return InMemoryBackend(**kwargs)
+    if name == "redis":
+        from .redis_backend import RedisBackend
+        return RedisBackend(**kwargs)
+    raise ValueError(f"未知的记忆存储后端: {name}，可选: memory, redis")
@@ -0,0 +1,55 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class BaseMemoryBackend(ABC):
+    """
+    记忆存储后端接口
+
+    记忆按 client_id 分组、按写入时间排序，带向量写入的记忆可按相似度检索。
+    每个客户端的记忆条数和保留时间有上限，由各实现负责淘汰。
+    """
+
+    @abstractmethod
+    async def add(self, client_id: str, data: Dict[str, Any], embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """写入一条记忆，返回带 id 和 timestamp 的完整记忆"""
+        pass
+
+    async def add_many(
+        self, entries: List[Tuple[str, Dict[str, Any], Optional[np.ndarray]]]
+    ) -> List[Dict[str, Any]]:
+        """批量写入 (client_id, data, embedding)，按顺序返回写入的记忆"""
+        return [await self.add(client_id, data, embedding=embedding) for client_id, data, embedding in entries]
+
+    @abstractmethod
+    async def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    async def get_many(self, memory_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """按顺序返回记忆，不存在的为 None"""
+        return [await self.get(memory_id) for memory_id in memory_ids]
+
+    @abstractmethod
+    async def recent(self, client_id: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """跳过最新的 offset 条后取 limit 条，按时间先后顺序返回，同时返回该客户端的记忆总数"""
+        pass
+
+    @abstractmethod
+    async def search(self, client_id: str, embedding: np.ndarray, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """返回与查询向量最相似的 k 条记忆及相似度"""
+        pass
+
+    @abstractmethod
+    async def clear(self, client_id: str) -> int:
+        """删除客户端的全部记忆，返回删除的条数"""
+        pass
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        pass
+
+    async def close(self):
+        """释放连接等资源"""
+        pass
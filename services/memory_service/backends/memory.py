@@ -0,0 +1,31 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.memory_service.store import ConversationStore
+from .base import BaseMemoryBackend
+
+
+class InMemoryBackend(BaseMemoryBackend):
+    """进程内存储，数据只在当前副本中可见，重启后丢失"""
+
+    def __init__(self, **store_options):
+        self.store = ConversationStore(**store_options)
+
+    async def add(self, client_id: str, data: Dict[str, Any], embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        return self.store.add(client_id, data, embedding=embedding)
+
+    async def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(memory_id)
+
+    async def recent(self, client_id: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        return self.store.recent(client_id, limit=limit, offset=offset)
+
+    async def search(self, client_id: str, embedding: np.ndarray, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        return self.store.search(client_id, embedding, k=k)
+
+    async def clear(self, client_id: str) -> int:
+        return self.store.clear(client_id)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self.store.stats()}
@@ -0,0 +1,206 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import redis.asyncio as redis
+
+from services.memory_service.store import new_memory_item
+from services.memory_service.vector_index import VectorIndex
+from .base import BaseMemoryBackend
+
+logger = logging.getLogger(__name__)
+
+# 检索时多取的候选数，用于补足已被其他副本淘汰的记忆
+SEARCH_OVERFETCH = 2
+
+
+class RedisBackend(BaseMemoryBackend):
+    """
+    Redis 存储，多个副本共享同一份数据
+
+    键结构（prefix 默认为 mem）：
+    - {prefix}:item:{id}     记忆内容（JSON）
+    - {prefix}:vec:{id}      记忆向量（float32 原始字节）
+    - {prefix}:client:{cid}  有序集合，成员为记忆ID，分数为写入时间
+
+    写入（包括批量写入）通过一次 pipeline 完成记忆、向量和索引的写入以及按条数、时间的淘汰；
+    按时间淘汰同时依赖键的过期时间，不需要后台清理任务。
+    相似度检索在每个副本本地维护向量索引，检索前比对有序集合中的记忆ID，只拉取本地索引缺少的向量。
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        max_connections: int = 50,
+        prefix: str = "mem",
+        max_items_per_client: int = 1000,
+        max_age_seconds: float = 0,
+        max_cached_indexes: int = 1000,
+        index_factory: Optional[Callable[[], VectorIndex]] = None,
+        client: Optional[redis.Redis] = None,
+    ):
+        if client is None:
+            pool = redis.ConnectionPool(
+                host=host, port=port, db=db, password=password,
+                max_connections=max_connections, decode_responses=False,
+            )
+            client = redis.Redis(connection_pool=pool)
+        self.redis = client
+        self.prefix = prefix
+        self.max_items_per_client = max_items_per_client
+        self.max_age_seconds = max_age_seconds
+        self.max_cached_indexes = max_cached_indexes
+        self.index_factory = index_factory
+        self._indexes: "OrderedDict[str, VectorIndex]" = OrderedDict()
+
+    def _item_key(self, memory_id: str) -> str:
+        return f"{self.prefix}:item:{memory_id}"
+
+    def _vec_key(self, memory_id: str) -> str:
+        return f"{self.prefix}:vec:{memory_id}"
+
+    def _client_key(self, client_id: str) -> str:
+        return f"{self.prefix}:client:{client_id}"
+
+    def _min_score(self) -> float:
+        return time.time() - self.max_age_seconds if self.max_age_seconds > 0 else float("-inf")
+
+    def _ttl(self) -> Optional[int]:
+        return int(self.max_age_seconds) + 1 if self.max_age_seconds > 0 else None
+
+    async def add(self, client_id: str, data: Dict[str, Any], embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        return (await self.add_many([(client_id, data, embedding)]))[0]
+
+    async def add_many(
+        self, entries: List[Tuple[str, Dict[str, Any], Optional[np.ndarray]]]
+    ) -> List[Dict[str, Any]]:
+        """所有记忆在同一个 pipeline 中写入，每个涉及的客户端只做一次淘汰"""
+        items = [new_memory_item(client_id, data) for client_id, data, _ in entries]
+        client_keys = list(dict.fromkeys(self._client_key(item["client_id"]) for item in items))
+        ttl = self._ttl()
+
+        pipe = self.redis.pipeline(transaction=False)
+        overflow_positions = []
+        for item, (_, _, embedding) in zip(items, entries):
+            pipe.set(self._item_key(item["id"]), json.dumps(item, ensure_ascii=False), ex=ttl)
+            if embedding is not None:
+                pipe.set(self._vec_key(item["id"]), np.asarray(embedding, dtype=np.float32).tobytes(), ex=ttl)
+            pipe.zadd(self._client_key(item["client_id"]), {item["id"]: item["created_at"]})
+        for client_key in client_keys:
+            if self.max_age_seconds > 0:
+                pipe.zremrangebyscore(client_key, "-inf", f"({self._min_score()}")
+                pipe.expire(client_key, ttl)
+            # 超出条数上限的最早的记忆：先取出ID，再从有序集合中删除
+            overflow_positions.append(len(pipe))
+            pipe.zrange(client_key, 0, -(self.max_items_per_client + 1))
+            pipe.zremrangebyrank(client_key, 0, -(self.max_items_per_client + 1))
+        results = await pipe.execute()
+
+        overflow = [member.decode() for position in overflow_positions for member in results[position]]
+        if overflow:
+            await self.redis.delete(*[self._item_key(m) for m in overflow], *[self._vec_key(m) for m in overflow])
+        return items
+
+    async def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        value = await self.redis.get(self._item_key(memory_id))
+        return json.loads(value) if value is not None else None
+
+    async def get_many(self, memory_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        return await self._load_items(memory_ids)
+
+    async def recent(self, client_id: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        client_key, min_score = self._client_key(client_id), self._min_score()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrevrangebyscore(client_key, "+inf", min_score, start=offset, num=limit)
+        pipe.zcount(client_key, min_score, "+inf")
+        members, total = await pipe.execute()
+        items = await self._load_items([member.decode() for member in reversed(members)])
+        return [item for item in items if item is not None], total
+
+    async def search(self, client_id: str, embedding: np.ndarray, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        if self.index_factory is None:
+            return []
+        index = await self._sync_index(client_id)
+        matches = index.search(embedding, k * SEARCH_OVERFETCH)
+        items = await self._load_items([memory_id for memory_id, _ in matches])
+
+        results, min_score = [], self._min_score()
+        for (memory_id, score), item in zip(matches, items):
+            # 已被淘汰或过期的记忆同时从本地索引中删除
+            if item is None or item["created_at"] < min_score:
+                index.remove(memory_id)
+                continue
+            results.append((item, score))
+        return results[:k]
+
+    async def clear(self, client_id: str) -> int:
+        self._indexes.pop(client_id, None)
+        client_key = self._client_key(client_id)
+        members = [member.decode() for member in await self.redis.zrange(client_key, 0, -1)]
+        pipe = self.redis.pipeline(transaction=False)
+        for start in range(0, len(members), 500):
+            batch = members[start:start + 500]
+            pipe.delete(*[self._item_key(m) for m in batch], *[self._vec_key(m) for m in batch])
+        pipe.delete(client_key)
+        await pipe.execute()
+        return len(members)
+
+    async def stats(self) -> Dict[str, Any]:
+        pool = self.redis.connection_pool
+        started = time.perf_counter()
+        await self.redis.ping()
+        return {
+            "backend": "redis",
+            "ping_ms": round((time.perf_counter() - started) * 1000, 3),
+            "cached_indexes": len(self._indexes),
+            "indexed": sum(len(index) for index in self._indexes.values()),
+            "max_items_per_client": self.max_items_per_client,
+            "max_age_seconds": self.max_age_seconds,
+            "pool_max_connections": getattr(pool, "max_connections", None),
+        }
+
+    async def close(self):
+        await self.redis.aclose()
+
+    async def _load_items(self, memory_ids: List[str]) -> List[Optional[Dict[str, Any]]]:
+        if not memory_ids:
+            return []
+        values = await self.redis.mget([self._item_key(m) for m in memory_ids])
+        return [json.loads(value) if value is not None else None for value in values]
+
+    async def _sync_index(self, client_id: str) -> VectorIndex:
+        """
+        按记忆ID同步本地索引：加入有序集合中有而本地没有的向量，删除已被淘汰或过期的记忆
+
+        不按写入时间增量同步：写入时间由各副本按本机时钟设置，提交较晚或时钟较慢的副本写入的记忆
+        可能早于已同步的时间，增量同步会永久漏掉它们。
+        """
+        index = self._indexes.get(client_id)
+        if index is None:
+            index = self.index_factory()
+        self._indexes[client_id] = index
+        self._indexes.move_to_end(client_id)
+        while len(self._indexes) > self.max_cached_indexes:
+            self._indexes.popitem(last=False)
+
+        members = [member.decode() for member in await self.redis.zrangebyscore(
+            self._client_key(client_id), self._min_score(), "+inf"
+        )]
+        current = set(members)
+        for memory_id in index.ids():
+            if memory_id not in current:
+                index.remove(memory_id)
+
+        missing = [memory_id for memory_id in members if memory_id not in index]
+        if missing:
+            vectors = await self.redis.mget([self._vec_key(m) for m in missing])
+            for memory_id, vector in zip(missing, vectors):
+                if vector is not None:
+                    index.add(memory_id, np.frombuffer(vector, dtype=np.float32))
+        return index
@@ -0,0 +1,74 @@
+import hashlib
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import numpy as np
+
+
+class BaseEmbedder(ABC):
+    """文本向量化接口，返回 L2 归一化的 float32 向量，内积即余弦相似度"""
+
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """返回形状为 (len(texts), dim) 的向量矩阵"""
+        pass
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class HashingEmbedder(BaseEmbedder):
+    """
+    字符 n-gram 哈希向量，不依赖模型文件
+
+    中文按字和相邻两字、英文按单词切分后哈希到固定维度，只能反映字面重合程度，
+    用于开发测试或没有嵌入模型的部署。
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        chars = [c for c in text.lower() if not c.isspace()]
+        features = chars + [a + b for a, b in zip(chars, chars[1:])]
+        return features + text.lower().split()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return _normalize(vectors)
+
+
+class SentenceTransformerEmbedder(BaseEmbedder):
+    """本地 CPU 运行的 sentence-transformers 模型"""
+
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 32):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device=device)
+        self.batch_size = batch_size
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return vectors.astype(np.float32, copy=False)
+
+
+def create_embedder(name: str, model_name: Optional[str] = None, dim: int = 256) -> BaseEmbedder:
+    """按名称创建向量化实现；sentence-transformers 延迟导入，使用哈希向量时不加载 PyTorch"""
+    if name == "hashing":
+        return HashingEmbedder(dim=dim)
+    if name == "sentence_transformers":
+        if not model_name:
+            raise ValueError("使用 sentence_transformers 时需要设置模型名称或路径")
+        return SentenceTransformerEmbedder(model_name)
+    raise ValueError(f"未知的向量化实现: {name}，可选: hashing, sentence_transformers")
@@ -1,47 +1,110 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from functools import partial
+from services.memory_service.backends import create_backend
+from services.memory_service.embeddings import create_embedder
+from services.memory_service.vector_index import VectorIndex
+from shared.utils.deadline import DeadlineMiddleware
 import logging
-from typing import Dict, List, Any, Optional
-from datetime import datetime
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Memory Service", version="1.0.0")
+# 调用方设置的截止时间已过的请求直接返回504，不再处理
+app.add_middleware(DeadlineMiddleware)
 
-# 内存中的简单存储，实际应用中会使用Redis或数据库
-memory_store = {}
+DEFAULT_CLIENT_ID = "default"
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+DEFAULT_SEARCH_LIMIT = 5
+MAX_BATCH_SIZE = int(os.getenv("MEMORY_MAX_BATCH_SIZE", "500"))
+
+# 文本向量化：默认使用不依赖模型的哈希向量，可配置为本地 sentence-transformers 模型
+embedder = create_embedder(
+    os.getenv("MEMORY_EMBEDDER", "hashing"),
+    model_name=os.getenv("MEMORY_EMBEDDING_MODEL"),
+    dim=int(os.getenv("MEMORY_EMBEDDING_DIM", "256")),
+)
+
+# 按客户端分组的记忆存储，每个客户端的记忆条数和保留时间有上限
+# memory: 进程内存储（默认）；redis: 多个副本共享，重启后数据不丢失
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "memory")
+store_options = dict(
+    max_items_per_client=int(os.getenv("MEMORY_MAX_ITEMS_PER_CLIENT", "1000")),
+    max_age_seconds=float(os.getenv("MEMORY_MAX_AGE_SECONDS", str(7 * 24 * 3600))),
+    index_factory=partial(
+        VectorIndex,
+        embedder.dim,
+        ivf_threshold=int(os.getenv("MEMORY_IVF_THRESHOLD", "4096")),
+        nprobe=int(os.getenv("MEMORY_IVF_NPROBE", "8")),
+    ),
+)
+if MEMORY_BACKEND == "redis":
+    store_options.update(
+        host=os.getenv("REDIS_HOST", "redis"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+        max_connections=int(os.getenv("MEMORY_REDIS_MAX_CONNECTIONS", "50")),
+        prefix=os.getenv("MEMORY_REDIS_PREFIX", "mem"),
+    )
+else:
+    store_options.update(max_clients=int(os.getenv("MEMORY_MAX_CLIENTS", "10000")))
+memory_store = create_backend(MEMORY_BACKEND, **store_options)
+
+async def embed_text(text: str):
+    """在线程池中计算向量，避免模型推理阻塞事件循环"""
+    return (await run_in_threadpool(embedder.embed, [text]))[0]
+
+async def embed_texts(texts):
+    """批量计算向量，非文本或空文本的位置为 None"""
+    indexes = [i for i, text in enumerate(texts) if isinstance(text, str) and text]
+    embeddings = [None] * len(texts)
+    if indexes:
+        vectors = await run_in_threadpool(embedder.embed, [texts[i] for i in indexes])
+        for i, vector in zip(indexes, vectors):
+            embeddings[i] = vector
+    return embeddings
+
+def page_size(value, default: int) -> int:
+    return max(1, min(int(value or default), MAX_PAGE_SIZE))
+
+@app.on_event("shutdown")
+async def shutdown():
+    await memory_store.close()
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service_name": "memory-service"}
+    try:
+        store_stats = await memory_store.stats()
+    except Exception as e:
+        logger.error(f"记忆存储不可用: {str(e)}")
+        return JSONResponse(status_code=503, content={"status": "error", "service_name": "memory-service", "message": str(e)})
+    return {"status": "ok", "service_name": "memory-service", "store": store_stats}
 
 @app.post("/store")
 async def store_memory(request: Request):
     """存储记忆数据"""
     payload = await request.json()
-    
+    client_id = payload.pop("client_id", None) or DEFAULT_CLIENT_ID
+
     # 记录服务的处理状态
     logger.info(f"Memory服务开始存储数据: {payload}")
     logger.info("Memory服务处理中...")
-    
-    # 简单实现，为内存项添加时间戳和ID
-    memory_id = f"mem_{len(memory_store) + 1}"
-    timestamp = datetime.now().isoformat()
-    
-    memory_item = {
-        **payload,
-        "timestamp": timestamp,
-        "id": memory_id
-    }
-    
-    memory_store[memory_id] = memory_item
+
+    text = payload.get("text")
+    embedding = await embed_text(text) if isinstance(text, str) and text else None
+    memory_item = await memory_store.add(client_id, payload, embedding=embedding)
     logger.info("Memory服务处理完毕")
-    
+
     return {
         "status": "success",
-        "memory_id": memory_id,
-        "timestamp": timestamp
+        "memory_id": memory_item["id"],
+        "timestamp": memory_item["timestamp"]
     }
 
 @app.post("/retrieve")
@@ -49,13 +112,13 @@ async def retrieve_memory(request: Request):
     """检索记忆数据"""
     payload = await request.json()
     memory_id = payload.get("memory_id")
-    
+
     # 记录服务的处理状态
     logger.info(f"Memory服务开始检索数据: {memory_id}")
     logger.info("Memory服务处理中...")
-    
-    if memory_id in memory_store:
-        result = memory_store[memory_id]
+
+    result = await memory_store.get(memory_id)
+    if result is not None:
         logger.info("Memory服务处理完毕，找到记忆")
         return {
             "status": "success",
@@ -68,24 +131,91 @@ async def retrieve_memory(request: Request):
             "message": f"Memory ID {memory_id} not found"
         }
 
+@app.post("/store_batch")
+async def store_memory_batch(request: Request):
+    """批量存储记忆数据，items 中每一项与 /store 的请求体相同，按顺序返回结果"""
+    payload = await request.json()
+    items = payload.get("items", [])
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"单次最多写入 {MAX_BATCH_SIZE} 条记忆")
+
+    logger.info(f"Memory服务开始批量存储 {len(items)} 条数据")
+    client_ids = [item.pop("client_id", None) or DEFAULT_CLIENT_ID for item in items]
+    embeddings = await embed_texts([item.get("text") for item in items])
+    stored = await memory_store.add_many(list(zip(client_ids, items, embeddings)))
+    logger.info("Memory服务批量存储完毕")
+
+    return {
+        "status": "success",
+        "results": [{"memory_id": item["id"], "timestamp": item["timestamp"]} for item in stored]
+    }
+
+@app.post("/retrieve_batch")
+async def retrieve_memory_batch(request: Request):
+    """批量检索记忆数据，memories 与 memory_ids 一一对应，未找到的为 null"""
+    payload = await request.json()
+    memory_ids = payload.get("memory_ids", [])
+    if len(memory_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"单次最多检索 {MAX_BATCH_SIZE} 条记忆")
+
+    memories = await memory_store.get_many(memory_ids) if memory_ids else []
+    return {
+        "status": "success",
+        "memories": memories,
+        "not_found": [memory_id for memory_id, memory in zip(memory_ids, memories) if memory is None]
+    }
+
+@app.post("/history")
+async def get_history(request: Request):
+    """
+    分页获取客户端的对话记录，按时间先后排列
+    offset 为从最新一条往前跳过的条数，next_offset 为空表示没有更早的记录
+    """
+    payload = await request.json()
+    client_id = payload.get("client_id") or DEFAULT_CLIENT_ID
+    limit = page_size(payload.get("limit"), DEFAULT_PAGE_SIZE)
+    offset = max(0, int(payload.get("offset", 0)))
+
+    items, total = await memory_store.recent(client_id, limit=limit, offset=offset)
+    next_offset = offset + len(items)
+    return {
+        "status": "success",
+        "client_id": client_id,
+        "items": items,
+        "total": total,
+        "next_offset": next_offset if next_offset < total else None
+    }
+
 @app.post("/search")
 async def search_memory(request: Request):
-    """搜索记忆数据"""
+    """按语义相似度搜索客户端的记忆；query 为空时返回最新的几条记忆"""
     payload = await request.json()
     query = payload.get("query", "")
-    
+    client_id = payload.get("client_id") or DEFAULT_CLIENT_ID
+    limit = page_size(payload.get("limit"), DEFAULT_SEARCH_LIMIT)
+
     # 记录服务的处理状态
     logger.info(f"Memory服务开始搜索数据: {query}")
     logger.info("Memory服务处理中...")
-    
-    # 简单实现，只返回最新的几条记忆
-    results = list(memory_store.values())[-5:]
-    
+
+    if query:
+        matches = await memory_store.search(client_id, await embed_text(query), k=limit)
+        results = [{**item, "score": score} for item, score in matches]
+    else:
+        results, _ = await memory_store.recent(client_id, limit=limit)
+
     logger.info("Memory服务处理完毕")
-    
+
     return {
         "status": "success",
         "results": results
     }
 
-# TODO: Add Memory specific endpoints, e.g., /store, /retrieve, /search 
\ No newline at end of file
+@app.post("/clear")
+async def clear_memory(request: Request):
+    """清除客户端的全部记忆"""
+    payload = await request.json()
+    client_id = payload.get("client_id") or DEFAULT_CLIENT_ID
+    removed = await memory_store.clear(client_id)
+    logger.info(f"Memory服务已清除客户端 {client_id} 的 {removed} 条记忆")
+    return {"status": "success", "removed": removed}
@@ -0,0 +1,141 @@
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.memory_service.vector_index import VectorIndex
+
+
+def new_memory_id() -> str:
+    """全局唯一的记忆ID，多个并发请求（或多个副本）之间不会冲突"""
+    return f"mem_{uuid.uuid4().hex}"
+
+
+def new_memory_item(client_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        **data,
+        "client_id": client_id,
+        "id": new_memory_id(),
+        "timestamp": datetime.fromtimestamp(now).isoformat(),
+        "created_at": now,
+    }
+
+
+class ConversationStore:
+    """
+    按 client_id 分组的对话记忆存储
+
+    每个客户端一个按时间顺序排列的环形缓冲区，超过 max_items_per_client 条或早于 max_age_seconds 的记忆被淘汰；
+    客户端数超过 max_clients 时淘汰最久未活跃的客户端。另外维护 memory_id 到记忆的索引用于按ID检索。
+    读取最近 k 条记忆只访问该客户端缓冲区末尾的 k 项，与总数据量无关。
+    带向量写入的记忆同时加入该客户端的向量索引，淘汰时一并删除。
+    """
+
+    def __init__(self, max_items_per_client: int = 1000, max_age_seconds: float = 0, max_clients: int = 10000,
+                 index_factory: Optional[Callable[[], VectorIndex]] = None):
+        self.max_items_per_client = max_items_per_client
+        self.max_age_seconds = max_age_seconds
+        self.max_clients = max_clients
+        self.index_factory = index_factory
+        self._clients: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._indexes: Dict[str, VectorIndex] = {}
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self.evicted = 0
+
+    def add(self, client_id: str, data: Dict[str, Any], embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        item = new_memory_item(client_id, data)
+        history = self._clients.get(client_id)
+        if history is None:
+            history = self._clients[client_id] = deque()
+            self._evict_clients()
+        self._clients.move_to_end(client_id)
+
+        history.append(item)
+        self._items[item["id"]] = item
+        if embedding is not None and self.index_factory is not None:
+            if client_id not in self._indexes:
+                self._indexes[client_id] = self.index_factory()
+            self._indexes[client_id].add(item["id"], embedding)
+        while len(history) > self.max_items_per_client:
+            self._drop(history.popleft())
+        self._expire(history, item["created_at"])
+        return item
+
+    def get(self, memory_id: str) -> Optional[Dict[str, Any]]:
+        item = self._items.get(memory_id)
+        if item is None:
+            return None
+        history = self._clients[item["client_id"]]
+        self._expire(history, time.time())
+        return self._items.get(memory_id)
+
+    def recent(self, client_id: str, limit: int = 20, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        分页读取客户端的记忆：跳过最新的 offset 条后取 limit 条，按时间先后顺序返回
+        同时返回该客户端的记忆总数
+        """
+        history = self._clients.get(client_id)
+        if history is None:
+            return [], 0
+        self._expire(history, time.time())
+        page = []
+        # 从缓冲区末尾向前遍历，只访问 offset + limit 项
+        for index, item in enumerate(reversed(history)):
+            if index >= offset + limit:
+                break
+            if index >= offset:
+                page.append(item)
+        page.reverse()
+        return page, len(history)
+
+    def search(self, client_id: str, embedding: np.ndarray, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """返回与查询向量最相似的 k 条记忆及相似度"""
+        history = self._clients.get(client_id)
+        index = self._indexes.get(client_id)
+        if history is None or index is None:
+            return []
+        self._expire(history, time.time())
+        return [(self._items[item_id], score) for item_id, score in index.search(embedding, k)]
+
+    def clear(self, client_id: str) -> int:
+        self._indexes.pop(client_id, None)
+        history = self._clients.pop(client_id, None) or deque()
+        for item in history:
+            self._items.pop(item["id"], None)
+        return len(history)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "items": len(self._items),
+            "indexed": sum(len(index) for index in self._indexes.values()),
+            "ivf_indexes": sum(1 for index in self._indexes.values() if index.uses_ivf),
+            "evicted": self.evicted,
+            "max_items_per_client": self.max_items_per_client,
+            "max_age_seconds": self.max_age_seconds,
+            "max_clients": self.max_clients,
+        }
+
+    def _expire(self, history: Deque[Dict[str, Any]], now: float):
+        if self.max_age_seconds <= 0:
+            return
+        while history and now - history[0]["created_at"] > self.max_age_seconds:
+            self._drop(history.popleft())
+
+    def _evict_clients(self):
+        while len(self._clients) > self.max_clients:
+            client_id, history = self._clients.popitem(last=False)
+            self._indexes.pop(client_id, None)
+            for item in history:
+                self._drop(item)
+
+    def _drop(self, item: Dict[str, Any]):
+        self._items.pop(item["id"], None)
+        index = self._indexes.get(item["client_id"])
+        if index is not None:
+            index.remove(item["id"])
+        self.evicted += 1
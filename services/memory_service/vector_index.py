@@ -0,0 +1,146 @@
+import math
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+INITIAL_CAPACITY = 64
+KMEANS_ITERATIONS = 10
+# 训练聚类中心时每个中心采样的向量数
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+class VectorIndex:
+    """
+    单个客户端的向量索引，向量须已 L2 归一化，按内积（余弦相似度）排序
+
+    向量数较少时对全部向量做一次矩阵乘法（暴力检索）；达到 ivf_threshold 后训练倒排索引（IVF），
+    检索时只计算与查询最接近的 nprobe 个聚类中的向量，耗时不再随向量总数线性增长。
+    向量数比上次训练时翻倍后重新训练。删除只做标记，已删除的行超过一半时压缩。
+    """
+
+    def __init__(self, dim: int, ivf_threshold: int = 4096, nprobe: int = 8):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self._vectors = np.zeros((INITIAL_CAPACITY, dim), dtype=np.float32)
+        self._alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    def ids(self) -> List[str]:
+        return list(self._rows)
+
+    @property
+    def uses_ivf(self) -> bool:
+        return self._centroids is not None
+
+    def add(self, item_id: str, vector: np.ndarray):
+        if item_id in self._rows:
+            self.remove(item_id)
+        row = len(self._ids)
+        if row == len(self._vectors):
+            self._grow()
+        self._vectors[row] = vector
+        self._alive[row] = True
+        self._ids.append(item_id)
+        self._rows[item_id] = row
+
+        if self._centroids is not None:
+            self._lists[int(np.argmax(self._centroids @ vector))].append(row)
+        if len(self._rows) >= self.ivf_threshold and len(self._rows) >= 2 * self._trained_size:
+            self._train()
+
+    def remove(self, item_id: str):
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return
+        self._alive[row] = False
+        self._ids[row] = None
+        dead = len(self._ids) - len(self._rows)
+        if dead > len(self._rows) and dead > INITIAL_CAPACITY:
+            self._compact()
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """返回最相似的 k 个 (id, 相似度)，按相似度从高到低排列"""
+        k = min(k, len(self._rows))
+        if k <= 0:
+            return []
+        rows = self._candidate_rows(query, k)
+        if rows is None:
+            scores = self._vectors[:len(self._ids)] @ query
+            scores[~self._alive[:len(self._ids)]] = -np.inf
+            rows = np.arange(len(self._ids))
+        else:
+            scores = self._vectors[rows] @ query
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[rows[i]], float(scores[i])) for i in top]
+
+    def _candidate_rows(self, query: np.ndarray, k: int) -> Optional[np.ndarray]:
+        """IVF 检索的候选行；未训练或候选不足 k 个时返回 None，改用暴力检索"""
+        if self._centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.fromiter(chain.from_iterable(self._lists[p] for p in probes), dtype=np.int64)
+        rows = rows[self._alive[rows]]
+        return rows if len(rows) >= k else None
+
+    def _grow(self):
+        capacity = len(self._vectors) * 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._vectors)] = self._vectors
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._vectors, self._alive = vectors, alive
+
+    def _compact(self):
+        keep = np.flatnonzero(self._alive[:len(self._ids)])
+        count = len(keep)
+        capacity = max(INITIAL_CAPACITY, 1 << math.ceil(math.log2(max(count, 1) * 2)))
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:count] = self._vectors[keep]
+        self._vectors = vectors
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._alive[:count] = True
+        self._ids = [self._ids[row] for row in keep]
+        self._rows = {item_id: row for row, item_id in enumerate(self._ids)}
+        if self._centroids is not None:
+            if count >= self.ivf_threshold:
+                self._train()
+            else:
+                self._centroids, self._lists, self._trained_size = None, [], 0
+
+    def _train(self):
+        """球面 k-means 训练聚类中心，并重新分配全部向量"""
+        rows = np.flatnonzero(self._alive[:len(self._ids)])
+        vectors = self._vectors[rows]
+        nlist = max(1, min(int(math.sqrt(len(rows))), 1024))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self._lists = [[] for _ in range(nlist)]
+        for row, cluster in zip(rows.tolist(), assign.tolist()):
+            self._lists[cluster].append(row)
+        self._centroids = centroids.astype(np.float32)
+        self._trained_size = len(rows)
@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Union
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# 磁盘缓存文件的扩展名；文件内容为 Content-Type + 换行 + 音频数据
+DISK_SUFFIX = ".audio"
+
+
+@dataclass
+class CachedAudio:
+    # 内存层为 bytes；磁盘层为文件内存映射上的 memoryview，读取时不复制音频数据
+    data: Union[bytes, memoryview]
+    content_type: str
+
+
+class InvalidCacheFile(ValueError):
+    """磁盘缓存文件不完整或文件头无效"""
+
+
+def audio_cache_key(text: str, voice: str, audio_format: str, sample_rate: int) -> str:
+    """按合成参数计算内容寻址的缓存键，同时作为音频ID"""
+    digest = hashlib.sha256()
+    for part in (text, voice, audio_format, str(sample_rate)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class AudioCache:
+    """
+    合成音频的两级缓存
+
+    内存层为按字节数限制容量的LRU；磁盘层（可选）每个条目一个文件，同样按总字节数淘汰最久未访问的文件。
+    磁盘命中时返回文件内存映射上的视图，不复制到进程内存，常用的文件由操作系统的页缓存保留在内存中；
+    文件头无效（写入中断、文件损坏）时视为未命中并删除文件。
+    异步接口 aget / aput 在线程池中读写文件，不阻塞事件循环；索引只在事件循环中修改。
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, CachedAudio]" = OrderedDict()
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str) -> Optional[CachedAudio]:
+        entry = self._get_memory(key)
+        if entry is None and key in self._disk_entries:
+            entry = self._finish_read(key, self._try_read_file(key))
+        if entry is None:
+            self.misses += 1
+        return entry
+
+    async def aget(self, key: str) -> Optional[CachedAudio]:
+        entry = self._get_memory(key)
+        if entry is None and key in self._disk_entries:
+            entry = self._finish_read(key, await run_in_threadpool(self._try_read_file, key))
+        if entry is None:
+            self.misses += 1
+        return entry
+
+    def put(self, key: str, data: bytes, content_type: str):
+        entry = self._put_memory(key, data, content_type)
+        if self.disk_dir and key not in self._disk_entries:
+            self._finish_write(key, self._try_write_file(key, entry))
+
+    async def aput(self, key: str, data: bytes, content_type: str):
+        entry = self._put_memory(key, data, content_type)
+        if self.disk_dir and key not in self._disk_entries:
+            self._finish_write(key, await run_in_threadpool(self._try_write_file, key, entry))
+
+    def stats(self) -> Dict[str, int]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "disk_entries": len(self._disk_entries),
+            "disk_bytes": self.disk_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def _get_memory(self, key: str) -> Optional[CachedAudio]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def _put_memory(self, key: str, data: bytes, content_type: str) -> CachedAudio:
+        entry = CachedAudio(data=bytes(data), content_type=content_type)
+        # 超过内存层容量的条目只保存在磁盘层
+        if len(entry.data) > self.max_bytes:
+            return entry
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= len(previous.data)
+        self._entries[key] = entry
+        self.bytes += len(entry.data)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted.data)
+        return entry
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key + DISK_SUFFIX)
+
+    def _load_disk_index(self):
+        """启动时按最近访问时间重建磁盘层索引"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(DISK_SUFFIX):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                files.append((stat.st_mtime, name[:-len(DISK_SUFFIX)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+        logger.info(f"TTS磁盘缓存已加载 {len(self._disk_entries)} 个条目，共 {self.disk_bytes} 字节")
+
+    @staticmethod
+    def _read_file(path: str) -> CachedAudio:
+        """
+        映射缓存文件并返回音频数据的视图；映射在最后一个视图释放后关闭。
+        文件头无效时抛出 InvalidCacheFile
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = mapped.find(b"\n", 0, 256)
+        try:
+            content_type = mapped[:header_end].decode("ascii") if header_end > 0 else ""
+        except UnicodeDecodeError:
+            content_type = ""
+        if not content_type.startswith("audio/"):
+            mapped.close()
+            raise InvalidCacheFile(f"缓存文件头无效: {path}")
+        return CachedAudio(data=memoryview(mapped)[header_end + 1:], content_type=content_type)
+
+    def _try_read_file(self, key: str) -> Union[CachedAudio, Exception]:
+        """在线程池中执行，只读取文件，不修改索引"""
+        path = self._disk_path(key)
+        try:
+            entry = self._read_file(path)
+            os.utime(path)
+            return entry
+        except (OSError, ValueError) as e:
+            return e
+
+    def _finish_read(self, key: str, result: Union[CachedAudio, Exception]) -> Optional[CachedAudio]:
+        if isinstance(result, Exception):
+            logger.warning(f"读取TTS磁盘缓存失败，按未命中处理: {key}, 错误: {str(result)}")
+            self._remove_disk(key)
+            return None
+        if key in self._disk_entries:
+            self._disk_entries.move_to_end(key)
+        self.disk_hits += 1
+        return result
+
+    def _try_write_file(self, key: str, entry: CachedAudio) -> Union[int, OSError]:
+        """在线程池中执行：先写临时文件再原子替换，避免并发读取到写了一半的文件"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(entry.content_type.encode("ascii") + b"\n")
+                f.write(entry.data)
+                size = f.tell()
+            os.replace(tmp_path, self._disk_path(key))
+            return size
+        except OSError as e:
+            return e
+
+    def _finish_write(self, key: str, result: Union[int, OSError]):
+        if isinstance(result, OSError):
+            logger.warning(f"写入TTS磁盘缓存失败: {key}, 错误: {str(result)}")
+            return
+        # 同一条目可能被并发写入两次，文件已被替换，只计一次大小
+        self.disk_bytes += result - self._disk_entries.pop(key, 0)
+        self._disk_entries[key] = result
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.disk_max_bytes and self._disk_entries:
+            self._remove_disk(next(iter(self._disk_entries)))
+
+    def _remove_disk(self, key: str):
+        self.disk_bytes -= self._disk_entries.pop(key, 0)
+        try:
+            os.remove(self._disk_path(key))
+        except FileNotFoundError:
+            pass
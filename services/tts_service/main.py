@@ -1,46 +1,183 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import StreamingResponse
+from array import array
+from typing import AsyncIterator, Dict, Optional, Tuple, Union
+from services.tts_service.cache import AudioCache, audio_cache_key
+from shared.utils.audio_utils import wav_header
+from shared.utils.deadline import DeadlineMiddleware
+import asyncio
 import logging
+import math
+import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="TTS Service", version="1.0.0")
+# 调用方设置的截止时间已过的请求直接返回504，不再处理
+app.add_middleware(DeadlineMiddleware)
+
+# 流式输出的默认采样率，以及模拟合成时每个字符的语音时长和实时率（合成耗时/语音时长）
+DEFAULT_SAMPLE_RATE = int(os.getenv("TTS_SAMPLE_RATE", "16000"))
+MOCK_CHAR_DURATION_MS = 120
+MOCK_REAL_TIME_FACTOR = float(os.getenv("TTS_MOCK_RTF", "0.1"))
+STREAM_FORMATS = ("pcm", "wav")
+DEFAULT_VOICE = os.getenv("TTS_DEFAULT_VOICE", "default")
+# 从缓存流式输出时每块的字节数
+CACHE_STREAM_CHUNK_BYTES = 32 * 1024
+AUDIO_URL_PREFIX = "/api/v1/tts/audio/"
+
+# 合成音频缓存：内存层按字节数限制容量，设置 TTS_CACHE_DIR 时启用磁盘层
+audio_cache = AudioCache(
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.getenv("TTS_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))),
+)
+
+async def synthesize_frames(text: str, sample_rate: int) -> AsyncIterator[bytes]:
+    """
+    模拟流式合成：每合成一个字符产出一帧16位单声道PCM，边合成边输出
+    在实际应用中，这里会逐块读取TTS模型的输出
+    """
+    samples_per_char = sample_rate * MOCK_CHAR_DURATION_MS // 1000
+    for char in text:
+        await asyncio.sleep(MOCK_CHAR_DURATION_MS / 1000 * MOCK_REAL_TIME_FACTOR)
+        if char.isspace():
+            yield bytes(2 * samples_per_char)
+            continue
+        frequency = 200 + (ord(char) % 10) * 20
+        frame = array("h", (
+            int(6000 * math.sin(2 * math.pi * frequency * n / sample_rate)) for n in range(samples_per_char)
+        ))
+        yield frame.tobytes()
+
+def audio_content_type(audio_format: str, sample_rate: int) -> str:
+    if audio_format == "wav":
+        return "audio/wav"
+    return f"audio/L16;rate={sample_rate};channels=1"
+
+def encode_audio(pcm: bytes, audio_format: str, sample_rate: int) -> bytes:
+    if audio_format == "wav":
+        return wav_header(sample_rate, data_size=len(pcm)) + pcm
+    return pcm
+
+async def synthesize_audio(text: str, audio_format: str, sample_rate: int) -> bytes:
+    frames = [frame async for frame in synthesize_frames(text, sample_rate)]
+    return encode_audio(b"".join(frames), audio_format, sample_rate)
+
+async def stream_audio(key: str, text: str, audio_format: str, sample_rate: int) -> AsyncIterator[bytes]:
+    """
+    WAV 格式先输出长度未知的流式文件头，随后与 PCM 相同逐帧输出
+    合成完整结束后写入缓存，客户端中途断开时不缓存不完整的音频
+    """
+    if audio_format == "wav":
+        yield wav_header(sample_rate)
+    frames = []
+    async for frame in synthesize_frames(text, sample_rate):
+        frames.append(frame)
+        yield frame
+    pcm = b"".join(frames)
+    await audio_cache.aput(key, encode_audio(pcm, audio_format, sample_rate), audio_content_type(audio_format, sample_rate))
+    logger.info(f"TTS服务流式输出完毕，共 {len(pcm)} 字节")
+
+async def stream_cached(data: Union[bytes, memoryview]) -> AsyncIterator[bytes]:
+    view = memoryview(data)
+    for start in range(0, len(view), CACHE_STREAM_CHUNK_BYTES):
+        yield bytes(view[start:start + CACHE_STREAM_CHUNK_BYTES])
+
+def cached_response(data: Union[bytes, memoryview], media_type: str, headers: Dict[str, str],
+                    status_code: int = 200) -> Response:
+    """磁盘缓存的音频是文件映射上的视图，分块发送而不是整体复制到进程内存"""
+    if isinstance(data, bytes):
+        return Response(content=data, status_code=status_code, media_type=media_type, headers=headers)
+    return StreamingResponse(
+        stream_cached(data), status_code=status_code, media_type=media_type,
+        headers={**headers, "Content-Length": str(len(data))}
+    )
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单个字节范围 bytes=start-end / bytes=start- / bytes=-suffix，返回闭区间 (start, end)
+    格式不支持（如多个范围）时返回 None，按完整内容响应；范围无法满足时抛出416
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="请求的范围无效", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service_name": "tts-service"}
+    return {"status": "ok", "service_name": "tts-service", "cache": audio_cache.stats()}
 
 @app.post("/synthesize")
 async def synthesize_speech(request: Request):
-    """将文本转换为语音"""
+    """
+    将文本转换为语音；"stream": true 时以分块传输逐帧返回音频
+    合成结果按 (text, voice, format, sample_rate) 缓存，命中时不再合成
+    """
     payload = await request.json()
     text = payload.get("text", "")
-    
+    voice = payload.get("voice", DEFAULT_VOICE)
+    audio_format = payload.get("format", "pcm" if payload.get("stream") else "wav")
+    if audio_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的音频格式: {audio_format}，可选: {STREAM_FORMATS}")
+    sample_rate = int(payload.get("sample_rate", DEFAULT_SAMPLE_RATE))
+    key = audio_cache_key(text, voice, audio_format, sample_rate)
+    cached = await audio_cache.aget(key)
+
     # 记录服务的处理状态
-    logger.info(f"TTS服务开始处理文本: {text}")
-    logger.info("TTS服务处理中...")
-    logger.info("TTS服务处理完毕")
-    
-    # 这里只是模拟处理，返回一个假的音频内容
-    # 在实际应用中，这里会返回真实合成的音频数据
-    mock_audio_data = b"MOCK_AUDIO_DATA"
-    
-    # 返回包含音频数据的响应
+    logger.info(f"TTS服务开始处理文本: {text}，缓存{'命中' if cached else '未命中'}")
+
+    if payload.get("stream"):
+        content = stream_cached(cached.data) if cached else stream_audio(key, text, audio_format, sample_rate)
+        return StreamingResponse(
+            content,
+            media_type=audio_content_type(audio_format, sample_rate),
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Audio-Id": key}
+        )
+
+    if cached is None:
+        logger.info("TTS服务处理中...")
+        audio_data = await synthesize_audio(text, audio_format, sample_rate)
+        await audio_cache.aput(key, audio_data, audio_content_type(audio_format, sample_rate))
+        logger.info("TTS服务处理完毕")
+
+    # 返回音频地址，音频内容通过 /audio/{audio_id} 获取
     return {
         "status": "success",
         "text": text,
-        "audio_url": "/api/v1/tts/audio/mock-123",  # 在真实场景中这可能是一个下载URL
-        "format": "wav"
+        "audio_url": f"{AUDIO_URL_PREFIX}{key}",
+        "audio_id": key,
+        "format": audio_format,
+        "cached": cached is not None
     }
 
 @app.get("/audio/{audio_id}")
-async def get_audio(audio_id: str):
-    """获取合成的音频文件"""
-    # 这里只是模拟返回音频内容
+async def get_audio(audio_id: str, request: Request):
+    """获取合成的音频文件，支持 Range 请求"""
     logger.info(f"TTS服务返回音频ID: {audio_id}")
-    mock_audio_data = b"MOCK_AUDIO_DATA"
-    
-    return Response(content=mock_audio_data, media_type="audio/wav")
+    cached = await audio_cache.aget(audio_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="音频不存在或已过期")
+
+    size = len(cached.data)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "public, max-age=86400, immutable", "ETag": f'"{audio_id}"'}
+    byte_range = parse_range(request.headers["range"], size) if "range" in request.headers else None
+    if byte_range is None:
+        return cached_response(cached.data, cached.content_type, headers)
 
-# TODO: Add TTS specific endpoints, e.g., /synthesize 
\ No newline at end of file
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return cached_response(cached.data[start:end + 1], cached.content_type, headers, status_code=206)
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from providers.base import BaseVADProvider
+from providers.streaming import StreamingVADSession
+
+logger = logging.getLogger(__name__)
+
+# 同一批次内最长音频与最短音频的长度比上限，超过则拆成多个批次，避免短请求被补零到长音频的长度
+MAX_LENGTH_RATIO = 2.0
+
+
+@dataclass
+class DetectJob:
+    audio_data: bytes
+    sample_rate: Optional[int]
+    future: asyncio.Future
+
+
+@dataclass
+class FrameJob:
+    session: Any
+    pcm_data: bytes
+    future: asyncio.Future
+
+
+def run_frame_batch(provider: BaseVADProvider, sessions: List[StreamingVADSession], frames: List[bytes]) -> List[List[Dict]]:
+    """
+    按时间步推进多个会话：每一步把各会话的同一序号窗口拼成一个批次送入模型
+    """
+    windows = [session.take_windows(pcm_data) for session, pcm_data in zip(sessions, frames)]
+    events: List[List[Dict]] = [[] for _ in sessions]
+    max_steps = max((len(w) for w in windows), default=0)
+
+    for step in range(max_steps):
+        active: Dict[int, List[int]] = {}
+        for index, session in enumerate(sessions):
+            if len(windows[index]) > step:
+                active.setdefault(session.sample_rate, []).append(index)
+
+        # 不同采样率的窗口长度不同，按采样率分别组批
+        for sample_rate, indices in active.items():
+            batch = np.stack([windows[index][step] for index in indices])
+            probs, states = provider.stream_forward_batch(
+                batch, [sessions[index].state for index in indices], sample_rate
+            )
+            for index, prob, state in zip(indices, probs, states):
+                session = sessions[index]
+                session.state = state
+                event = session.endpointer.update(float(prob))
+                if event:
+                    events[index].append(event)
+    return events
+
+
+class LocalEngine:
+    """
+    在当前进程内推理，流式帧和整段检测各用一个推理线程
+
+    模型在后台线程中加载并预热，加载完成前HTTP服务即可响应健康检查
+    """
+
+    concurrency = 1
+
+    def __init__(self, provider_factory: Callable[[], BaseVADProvider]):
+        self.provider_factory = provider_factory
+        self.provider: Optional[BaseVADProvider] = None
+        self.load_error: Optional[str] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._detect_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad-detect")
+        self._frame_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vad-stream")
+
+    def start(self):
+        self._ready = asyncio.get_running_loop().create_future()
+        asyncio.create_task(self._load())
+
+    async def _load(self):
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            provider = await loop.run_in_executor(self._detect_executor, self.provider_factory)
+            await loop.run_in_executor(self._detect_executor, provider.warmup)
+        except Exception as e:
+            logger.error(f"VAD模型加载失败: {str(e)}", exc_info=True)
+            self.load_error = str(e)
+            self._ready.set_exception(e)
+            # 避免未被等待的异常产生告警
+            self._ready.exception()
+            return
+        self.provider = provider
+        self._ready.set_result(None)
+        logger.info(f"VAD模型加载并预热完成，耗时 {time.monotonic() - started:.2f}s")
+
+    def is_ready(self) -> bool:
+        return self.provider is not None
+
+    async def wait_ready(self):
+        await asyncio.shield(self._ready)
+
+    async def stop(self):
+        self._detect_executor.shutdown(wait=False)
+        self._frame_executor.shutdown(wait=False)
+
+    async def detect_batch(self, items: List[Tuple[bytes, Optional[int]]]) -> List[Dict]:
+        await self.wait_ready()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._detect_executor, self.provider.detect_batch, items)
+
+    async def open_session(self, **params) -> StreamingVADSession:
+        await self.wait_ready()
+        # 复制模型状态的开销不占用事件循环
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self.provider.create_session, **params))
+
+    async def push_frames(self, sessions: List[StreamingVADSession], frames: List[bytes]) -> List[List[Dict]]:
+        await self.wait_ready()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._frame_executor, run_frame_batch, self.provider, sessions, frames
+        )
+
+    async def close_session(self, session: StreamingVADSession) -> List[Dict]:
+        return session.flush()
+
+    def stats(self) -> Dict:
+        return {"mode": "local", "ready": self.is_ready(), "error": self.load_error}
+
+
+class VADBatcher:
+    """
+    VAD 微批调度器
+
+    在 max_wait_ms 时间窗口内收集并发请求，合并为批次交给推理引擎执行，不阻塞事件循环。
+    流式会话帧和整段检测分别使用独立的队列，长音频不会阻塞实时音频流；
+    引擎正忙时新请求在队列中累积，下一批次自然变大。
+    """
+
+    def __init__(self, engine, max_batch_size: int = 16, max_wait_ms: float = 5.0):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = {"detect_batches": 0, "detect_items": 0, "frame_batches": 0, "frame_items": 0}
+        self._detect_queue: Optional[asyncio.Queue] = None
+        self._frame_queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self.engine.start()
+        self._detect_queue = asyncio.Queue()
+        self._frame_queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._run_detect()),
+            asyncio.create_task(self._run_frames()),
+        ]
+        logger.info(f"VAD批处理调度器已启动，批大小上限 {self.max_batch_size}，等待窗口 {self.max_wait * 1000:.1f}ms")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.engine.stop()
+
+    async def detect(self, audio_data: bytes, sample_rate: Optional[int] = None) -> Dict:
+        """提交整段音频检测任务"""
+        future = asyncio.get_running_loop().create_future()
+        await self._detect_queue.put(DetectJob(audio_data, sample_rate, future))
+        return await future
+
+    async def push(self, session, pcm_data: bytes) -> List[Dict]:
+        """提交流式会话的新音频帧，返回新产生的事件"""
+        future = asyncio.get_running_loop().create_future()
+        await self._frame_queue.put(FrameJob(session, pcm_data, future))
+        return await future
+
+    async def open_session(self, **params):
+        """创建流式会话"""
+        return await self.engine.open_session(**params)
+
+    async def close_session(self, session) -> List[Dict]:
+        """关闭流式会话，返回补发的结束事件"""
+        return await self.engine.close_session(session)
+
+    async def _collect(self, queue: asyncio.Queue, jobs: list) -> list:
+        """在时间窗口内继续收集任务，直到达到批大小上限"""
+        if not jobs:
+            jobs.append(await queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(jobs) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                jobs.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return jobs
+
+    async def _run_detect(self):
+        slots = asyncio.Semaphore(self.engine.concurrency)
+        while True:
+            jobs = await self._collect(self._detect_queue, [])
+            for group in self._split_by_length(jobs):
+                # 引擎的并发批次已满时在这里等待，期间新请求继续在队列中累积
+                await slots.acquire()
+                task = asyncio.create_task(self._detect_group(group))
+                task.add_done_callback(lambda _: slots.release())
+
+    async def _detect_group(self, group: List[DetectJob]):
+        try:
+            results = await self.engine.detect_batch([(job.audio_data, job.sample_rate) for job in group])
+        except Exception as e:
+            logger.error(f"VAD批量检测失败: {str(e)}", exc_info=True)
+            self._fail(group, e)
+            return
+        for job, result in zip(group, results):
+            if not job.future.done():
+                job.future.set_result(result)
+        self.stats["detect_batches"] += 1
+        self.stats["detect_items"] += len(group)
+
+    async def _run_frames(self):
+        slots = asyncio.Semaphore(self.engine.concurrency)
+        deferred: List[FrameJob] = []
+        while True:
+            jobs = await self._collect(self._frame_queue, deferred)
+            # 同一会话的帧必须按顺序处理，同一批次中每个会话只取最早的一帧
+            batch, deferred, seen = [], [], set()
+            for job in jobs:
+                if id(job.session) in seen:
+                    deferred.append(job)
+                else:
+                    seen.add(id(job.session))
+                    batch.append(job)
+
+            await slots.acquire()
+            task = asyncio.create_task(self._push_batch(batch))
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _push_batch(self, batch: List[FrameJob]):
+        try:
+            results = await self.engine.push_frames(
+                [job.session for job in batch], [job.pcm_data for job in batch]
+            )
+        except Exception as e:
+            logger.error(f"VAD流式批处理失败: {str(e)}", exc_info=True)
+            self._fail(batch, e)
+            return
+        for job, events in zip(batch, results):
+            if not job.future.done():
+                job.future.set_result(events)
+        self.stats["frame_batches"] += 1
+        self.stats["frame_items"] += len(batch)
+
+    @staticmethod
+    def _split_by_length(jobs: List[DetectJob]) -> List[List[DetectJob]]:
+        """按音频长度排序并分组，短音频优先提交"""
+        groups: List[List[DetectJob]] = []
+        for job in sorted(jobs, key=lambda job: len(job.audio_data)):
+            if groups and len(job.audio_data) <= MAX_LENGTH_RATIO * max(len(groups[-1][0].audio_data), 1):
+                groups[-1].append(job)
+            else:
+                groups.append([job])
+        return groups
+
+    @staticmethod
+    def _fail(jobs: list, e: Exception):
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(e)
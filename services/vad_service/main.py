@@ -1,31 +1,105 @@
-from fastapi import FastAPI, UploadFile, File, Request
-from providers.silero.silero import SileroVADProvider
+from fastapi import FastAPI, UploadFile, File, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from providers import create_provider
+from batching import LocalEngine, VADBatcher
+from worker_pool import ProcessPoolEngine
+from shared.utils.audio_utils import parse_pcm_sample_rate
+from config.global_settings import VADConfig
+from functools import partial
+from typing import Any, Dict, Mapping
+from shared.utils.deadline import DeadlineMiddleware
 import logging
+import os
+import time
+import uuid
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="VAD Service", version="1.0.0")
+# 调用方设置的截止时间已过的请求直接返回504，不再处理
+app.add_middleware(DeadlineMiddleware)
+
+# 推理工作进程数，0 表示在HTTP服务进程内推理
+VAD_NUM_WORKERS = int(os.getenv("VAD_NUM_WORKERS", "0"))
+
+# 从本地模型文件加载，校验通过后预热；加载在后台进行，不阻塞服务启动
+if VADConfig.DEFAULT_PROVIDER == "onnx":
+    provider_factory = partial(
+        create_provider,
+        "onnx",
+        model_path=VADConfig.MODEL_PATH,
+        expected_sha256=VADConfig.MODEL_SHA256 or None,
+        intra_op_threads=VADConfig.ONNX_INTRA_OP_THREADS,
+        inter_op_threads=VADConfig.ONNX_INTER_OP_THREADS
+    )
+else:
+    provider_factory = partial(
+        create_provider,
+        "silero",
+        model_path=VADConfig.JIT_MODEL_PATH,
+        expected_sha256=VADConfig.MODEL_SHA256 or None,
+        allow_hub_download=VADConfig.ALLOW_HUB_DOWNLOAD
+    )
 
 # Initialize VAD provider
-vad_provider = SileroVADProvider()
+if VAD_NUM_WORKERS > 0:
+    # 模型只在工作进程中加载，主进程只运行HTTP服务
+    engine = ProcessPoolEngine(
+        provider_factory,
+        num_workers=VAD_NUM_WORKERS,
+        max_queue_depth=int(os.getenv("VAD_WORKER_QUEUE_DEPTH", "4"))
+    )
+else:
+    engine = LocalEngine(provider_factory)
+
+# 微批调度：在等待窗口内合并并发请求，交给推理引擎执行
+batcher = VADBatcher(
+    engine,
+    max_batch_size=int(os.getenv("VAD_BATCH_MAX_SIZE", "16")),
+    max_wait_ms=float(os.getenv("VAD_BATCH_WAIT_MS", "5"))
+)
+
+# 流式会话空闲超过该秒数后被回收
+SESSION_IDLE_TIMEOUT = float(os.getenv("VAD_SESSION_IDLE_TIMEOUT", "60"))
+sessions: Dict[str, Any] = {}
+
+@app.on_event("startup")
+async def startup():
+    batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await batcher.stop()
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "service_name": "vad-service"}
+    # 模型加载并预热完成前返回503，编排器和负载均衡不会把流量导向未就绪的实例
+    ready = engine.is_ready()
+    content = {
+        "status": "ok" if ready else "loading",
+        "service_name": "vad-service",
+        "batching": batcher.stats,
+        "engine": engine.stats(),
+        "active_sessions": len(sessions)
+    }
+    if not ready:
+        return JSONResponse(status_code=503, content=content)
+    return content
 
 @app.post("/v1/detect")
 async def detect_voice(request: Request):
     """检测音频中的语音活动"""
     try:
         audio_data = await request.body()
+        sample_rate = parse_pcm_sample_rate(request.headers.get("Content-Type"))
         
         # 记录服务的处理状态
         logger.info(f"VAD服务开始处理 {len(audio_data)} 字节的音频数据")
         
         # 使用 SileroVAD 处理音频
-        result = vad_provider.detect(audio_data)
+        result = await batcher.detect(audio_data, sample_rate=sample_rate)
         
         logger.info(f"VAD服务处理完毕，检测到 {len(result['speech_segments'])} 个语音片段")
         return result
@@ -37,4 +111,109 @@ async def detect_voice(request: Request):
             "error": str(e)
         }
 
-# TODO: Add VAD specific endpoints, e.g., /detect 
\ No newline at end of file
+async def create_session(params: Mapping):
+    """根据请求参数创建流式会话，参数非法时返回400"""
+    try:
+        return await batcher.open_session(
+            sample_rate=int(params.get("sample_rate", 16000)),
+            threshold=float(params.get("threshold", 0.5)),
+            min_silence_duration_ms=int(params.get("min_silence_duration_ms", 300)),
+            min_speech_duration_ms=int(params.get("min_speech_duration_ms", 500)),
+            speech_pad_ms=int(params.get("speech_pad_ms", 30)),
+        )
+    except (TypeError, ValueError, NotImplementedError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def evict_idle_sessions():
+    """回收长时间没有新音频的会话，防止客户端异常断开后泄漏模型状态"""
+    deadline = time.monotonic() - SESSION_IDLE_TIMEOUT
+    for session_id in [sid for sid, s in sessions.items() if s.last_active < deadline]:
+        await batcher.close_session(sessions.pop(session_id))
+        logger.info(f"VAD会话 {session_id} 空闲超时，已回收")
+
+def get_session(session_id: str):
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail=f"VAD会话 {session_id} 不存在")
+    return sessions[session_id]
+
+@app.post("/v1/sessions")
+async def open_session(request: Request):
+    """
+    打开流式检测会话
+    请求体(可选): {"sample_rate": 16000, "threshold": 0.5, "min_silence_duration_ms": 300,
+                 "min_speech_duration_ms": 500, "speech_pad_ms": 30}
+    """
+    body = await request.body()
+    params = await request.json() if body else {}
+    await evict_idle_sessions()
+
+    session = await create_session(params)
+    session_id = uuid.uuid4().hex
+    sessions[session_id] = session
+    logger.info(f"VAD会话 {session_id} 已创建，采样率 {session.sample_rate}")
+    return {
+        "status": "success",
+        "session_id": session_id,
+        "sample_rate": session.sample_rate,
+        "window_size": session.window_size
+    }
+
+@app.post("/v1/sessions/{session_id}/frames")
+async def push_frames(session_id: str, request: Request):
+    """推送一段16位单声道PCM音频帧，返回新产生的语音起止事件"""
+    session = get_session(session_id)
+    events = await batcher.push(session, await request.body())
+    return {
+        "status": "success",
+        "events": events,
+        "in_speech": session.triggered,
+        "processed_duration": session.processed_duration
+    }
+
+@app.delete("/v1/sessions/{session_id}")
+async def close_session(session_id: str):
+    """关闭会话，若仍处于语音段内则返回补发的结束事件"""
+    session = get_session(session_id)
+    del sessions[session_id]
+    events = await batcher.close_session(session)
+    logger.info(f"VAD会话 {session_id} 已关闭")
+    return {
+        "status": "success",
+        "events": events,
+        "processed_duration": session.processed_duration
+    }
+
+@app.websocket("/v1/stream")
+async def stream_detect(websocket: WebSocket):
+    """
+    WebSocket流式检测，会话参数通过查询字符串传入
+
+    每收到一个二进制PCM帧回复一条 {"events": [...], "in_speech": bool}；
+    收到文本 {"type": "end"} 时回复补发的结束事件并关闭连接
+    """
+    await websocket.accept()
+    try:
+        session = await create_session(websocket.query_params)
+    except HTTPException as e:
+        await websocket.close(code=1003, reason=e.detail)
+        return
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                events = await batcher.push(session, message["bytes"])
+                await websocket.send_json({"events": events, "in_speech": session.triggered})
+            else:
+                events = await batcher.close_session(session)
+                session = None
+                await websocket.send_json({"events": events, "in_speech": False})
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if session is not None:
+            await batcher.close_session(session) 
\ No newline at end of file
@@ -1,3 +1,17 @@
 """
 VAD providers package
-""" 
\ No newline at end of file
+"""
+from .base import BaseVADProvider
+
+
+def create_provider(name: str, **kwargs) -> BaseVADProvider:
+    """
+    按名称创建 VAD provider；各实现延迟导入，使用 ONNX 时进程中不会加载 PyTorch
+    """
+    if name == "silero":
+        from .silero.silero import SileroVADProvider
+        return SileroVADProvider(**kwargs)
+    if name == "onnx":
+        from .onnx.onnx import OnnxVADProvider
+        return OnnxVADProvider(**kwargs)
+    raise ValueError(f"未知的 VAD provider: {name}，可选: silero, onnx")
@@ -0,0 +1,143 @@
+import math
+import struct
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional
+
+import numpy as np
+import soundfile as sf
+
+# 重采样低通滤波器参数，与 torchaudio 的 sinc_interp_hann 默认值一致
+LOWPASS_FILTER_WIDTH = 6
+ROLLOFF = 0.99
+
+
+# 可直接解析的 WAV 采样格式：(格式标签, 位深) -> numpy dtype
+WAV_FORMAT_PCM = 1
+WAV_FORMAT_IEEE_FLOAT = 3
+WAV_FORMAT_EXTENSIBLE = 0xFFFE
+WAV_DTYPES = {
+    (WAV_FORMAT_PCM, 16): np.dtype('<i2'),
+    (WAV_FORMAT_PCM, 32): np.dtype('<i4'),
+    (WAV_FORMAT_IEEE_FLOAT, 32): np.dtype('<f4'),
+}
+
+
+def parse_wav(audio_data: bytes) -> Optional[tuple]:
+    """
+    解析 WAV 文件头，返回 (采样数组, 采样率)；采样数组是 audio_data 上的只读视图，形状为 (帧数, 声道数)。
+    不是 WAV 或采样格式不在 WAV_DTYPES 中时返回 None，由 soundfile 兜底解码
+    """
+    view = memoryview(audio_data)
+    if len(view) < 12 or view[0:4] != b'RIFF' or view[8:12] != b'WAVE':
+        return None
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size, = struct.unpack_from('<I', view, offset + 4)
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            format_tag, channels, sample_rate = struct.unpack_from('<HHI', view, body)
+            bits_per_sample, = struct.unpack_from('<H', view, body + 14)
+            if format_tag == WAV_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # 子格式 GUID 的前两个字节即实际的格式标签
+                format_tag, = struct.unpack_from('<H', view, body + 24)
+            fmt = (format_tag, channels, sample_rate, bits_per_sample)
+        elif chunk_id == b'data':
+            if fmt is None:
+                return None
+            format_tag, channels, sample_rate, bits_per_sample = fmt
+            dtype = WAV_DTYPES.get((format_tag, bits_per_sample))
+            if dtype is None or channels == 0:
+                return None
+            # 流式写出的 WAV 头中数据长度可能是 0 或 0xFFFFFFFF，此时取到文件末尾
+            end = len(view) if chunk_size in (0, 0xFFFFFFFF) else min(body + chunk_size, len(view))
+            frame_bytes = dtype.itemsize * channels
+            num_frames = (end - body) // frame_bytes
+            samples = np.frombuffer(view, dtype=dtype, count=num_frames * channels, offset=body)
+            return samples.reshape(num_frames, channels), sample_rate
+        # 块按偶数字节对齐
+        offset = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+def to_mono_float32(samples: np.ndarray) -> np.ndarray:
+    """
+    (帧数, 声道数) 的采样转换为 float32 单声道，整数采样归一化到 [-1, 1)；
+    单声道 float32 直接返回原视图，其余情况只分配一次输出数组
+    """
+    if samples.shape[1] == 1:
+        mono = samples[:, 0]
+        if mono.dtype == np.float32:
+            return mono
+        audio = mono.astype(np.float32)
+    else:
+        audio = samples.mean(axis=1, dtype=np.float32)
+    if samples.dtype.kind == 'i':
+        audio *= 1.0 / (1 << (8 * samples.dtype.itemsize - 1))
+    return audio
+
+
+def decode_audio(audio_data: bytes, sample_rate: Optional[int] = None) -> tuple:
+    """
+    将音频解码为 float32 单声道采样
+    Args:
+        audio_data: 音频数据（字节格式）
+        sample_rate: 若提供，audio_data 为该采样率的16位单声道原始PCM；否则按音频文件格式解码
+    Returns:
+        tuple: (采样数组, 采样率)
+    """
+    if sample_rate is not None:
+        # 原始16位PCM，丢弃不完整的末尾字节
+        samples = np.frombuffer(audio_data, dtype='<i2', count=len(audio_data) // 2)
+        return to_mono_float32(samples[:, None]), sample_rate
+
+    # 常见的 PCM WAV 直接在原始字节上解析，不经过 BytesIO 和 float64 中间数组
+    parsed = parse_wav(audio_data)
+    if parsed is not None:
+        samples, sample_rate = parsed
+        return to_mono_float32(samples), sample_rate
+
+    with BytesIO(audio_data) as audio_buffer:
+        samples, sample_rate = sf.read(audio_buffer, dtype='float32', always_2d=True)
+    return to_mono_float32(samples), sample_rate
+
+
+@lru_cache(maxsize=32)
+def sinc_resample_kernel(orig_rate: int, new_rate: int) -> tuple:
+    """
+    计算多相 sinc 重采样核，形状为 (new_rate, 2 * width + orig_rate)，采样率已约去最大公约数
+
+    结果按采样率对缓存，同一采样率的请求只计算一次；返回的数组只读，由所有调用方共享
+    """
+    base_freq = min(orig_rate, new_rate) * ROLLOFF
+    width = math.ceil(LOWPASS_FILTER_WIDTH * orig_rate / base_freq)
+    idx = np.arange(-width, width + orig_rate, dtype=np.float64) / orig_rate
+    t = (np.arange(0, -new_rate, -1, dtype=np.float64)[:, None] / new_rate + idx[None, :]) * base_freq
+    t = np.clip(t, -LOWPASS_FILTER_WIDTH, LOWPASS_FILTER_WIDTH)
+    window = np.cos(t * math.pi / LOWPASS_FILTER_WIDTH / 2) ** 2
+    t *= math.pi
+    scale = base_freq / orig_rate
+    kernel = np.where(t == 0, 1.0, np.sin(t) / np.where(t == 0, 1.0, t)) * window * scale
+    kernel = kernel.astype(np.float32)
+    kernel.flags.writeable = False
+    return kernel, width
+
+
+def resample(audio: np.ndarray, orig_rate: int, new_rate: int) -> np.ndarray:
+    """
+    多相 sinc 重采样，只依赖 numpy
+    """
+    if orig_rate == new_rate:
+        return audio
+    gcd = math.gcd(orig_rate, new_rate)
+    orig, new = orig_rate // gcd, new_rate // gcd
+    kernel, width = sinc_resample_kernel(orig, new)
+
+    padded = np.pad(audio, (width, width + orig))
+    # 每隔 orig 个采样取一帧，帧是原数组的视图，不复制数据
+    frames = np.lib.stride_tricks.sliding_window_view(padded, kernel.shape[1])[::orig]
+    output = (frames @ kernel.T).reshape(-1)
+    return output[:math.ceil(new * len(audio) / orig)]
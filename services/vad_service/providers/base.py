@@ -1,17 +1,26 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
+from .streaming import SpeechEndpointer, StreamingVADSession
+
+# 整段检测参数
+THRESHOLD = 0.5                  # 检测阈值
+MIN_SPEECH_DURATION_MS = 500     # 最小语音片段时长
+MIN_SILENCE_DURATION_MS = 300    # 最小静音时长
 
 class BaseVADProvider(ABC):
     @abstractmethod
-    def detect(self, audio_data: bytes) -> Dict:
+    def detect(self, audio_data: bytes, sample_rate: Optional[int] = None) -> Dict:
         """
         检测音频中的语音活动
         Args:
             audio_data: 音频数据（字节格式）
+            sample_rate: 若提供，audio_data 为该采样率的16位单声道原始PCM；
+                否则按音频文件格式解码
         Returns:
             Dict: {
                 "status": str,
+                "detected_speech": bool,
                 "speech_segments": List[Dict],
                 "metadata": Dict
             }
@@ -21,4 +30,120 @@ class BaseVADProvider(ABC):
     @abstractmethod
     def get_supported_formats(self) -> List[str]:
         """获取支持的音频格式"""
-        pass 
\ No newline at end of file
+        pass 
+
+    def warmup(self):
+        """
+        用一秒静音跑一遍完整的检测流程，提前完成图优化和内存分配，
+        使第一个真实请求不承担冷启动开销
+        """
+        sample_rate = 16000
+        result = self.detect_batch([(bytes(2 * sample_rate), sample_rate)])[0]
+        if result.get("status") != "success":
+            raise RuntimeError(f"模型预热失败: {result.get('error')}")
+
+    def get_stream_sample_rates(self) -> List[int]:
+        """获取流式检测支持的采样率"""
+        return []
+
+    def get_window_size(self, sample_rate: int) -> int:
+        """流式检测时每次送入模型的采样点数"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持流式检测")
+
+    def create_stream_state(self, sample_rate: int) -> Any:
+        """为一个新的音频流创建独立的模型循环状态"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持流式检测")
+
+    def stream_forward(self, window: np.ndarray, state: Any, sample_rate: int) -> Tuple[float, Any]:
+        """
+        对单个窗口运行模型
+        Args:
+            window: float32 音频窗口，长度为 get_window_size(sample_rate)
+            state: create_stream_state 返回的会话状态
+        Returns:
+            Tuple[float, Any]: (语音概率, 更新后的会话状态)
+        """
+        raise NotImplementedError(f"{type(self).__name__} 不支持流式检测")
+
+    def detect_batch(self, items: List[Tuple[bytes, Optional[int]]]) -> List[Dict]:
+        """
+        批量检测多段音频，默认逐条调用 detect；支持批推理的实现应覆盖此方法
+        Args:
+            items: [(audio_data, sample_rate), ...]，含义同 detect
+        """
+        return [self.detect(audio_data, sample_rate=sample_rate) for audio_data, sample_rate in items]
+
+    def stream_forward_batch(self, windows: np.ndarray, states: List[Any], sample_rate: int) -> Tuple[List[float], List[Any]]:
+        """
+        对多个会话各一个窗口运行模型，默认逐个调用 stream_forward
+        Args:
+            windows: 形状为 (B, window_size) 的 float32 数组，每行属于一个会话
+            states: 与 windows 各行对应的会话状态
+        Returns:
+            Tuple[List[float], List[Any]]: (各会话的语音概率, 更新后的会话状态)
+        """
+        probs, new_states = [], []
+        for window, state in zip(windows, states):
+            prob, state = self.stream_forward(window, state, sample_rate)
+            probs.append(prob)
+            new_states.append(state)
+        return probs, new_states
+
+    def create_session(self, sample_rate: int = 16000, **params) -> StreamingVADSession:
+        """创建流式检测会话"""
+        return StreamingVADSession(self, sample_rate=sample_rate, **params)
+
+    def _build_result(self, num_samples: int, sample_rate: int, window_size: int, window_probs: np.ndarray) -> Dict:
+        """
+        根据整段音频的逐窗口语音概率生成语音片段和元数据
+        """
+        endpointer = SpeechEndpointer(
+            sample_rate,
+            window_size,
+            threshold=THRESHOLD,
+            min_silence_duration_ms=MIN_SILENCE_DURATION_MS,
+            min_speech_duration_ms=MIN_SPEECH_DURATION_MS
+        )
+        events = []
+        for prob in window_probs:
+            event = endpointer.update(float(prob))
+            if event:
+                events.append(event)
+        events.extend(endpointer.flush())
+
+        segments = []
+        for event in events:
+            if event["event"] != "speech_end":
+                continue
+            first = int(event["start_time"] * sample_rate) // window_size
+            last = max(int(event["time"] * sample_rate) // window_size, first + 1)
+            segments.append({
+                "start_time": event["start_time"],
+                "end_time": event["time"],
+                "duration": event["duration"],
+                "confidence": float(window_probs[first:last].mean())  # 片段内的平均语音概率
+            })
+
+        total_duration = num_samples / sample_rate
+        speech_duration = sum(s["duration"] for s in segments)
+
+        return {
+            "status": "success",
+            "detected_speech": len(segments) > 0,
+            "speech_segments": segments,
+            "metadata": {
+                "total_duration": total_duration,
+                "speech_ratio": speech_duration / total_duration if total_duration > 0 else 0,
+                "num_segments": len(segments)
+            }
+        }
+
+    @staticmethod
+    def _error_result(e: Exception) -> Dict:
+        return {
+            "status": "error",
+            "error": str(e),
+            "detected_speech": False,
+            "speech_segments": [],
+            "metadata": {}
+        }
@@ -0,0 +1,52 @@
+import hashlib
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLoadError(RuntimeError):
+    """模型文件缺失或校验失败"""
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def expected_checksum(path: str, expected_sha256: Optional[str] = None) -> Optional[str]:
+    """
+    获取期望的校验和：优先使用配置值，其次读取模型文件旁的 .sha256 文件（sha256sum 输出格式）
+    """
+    if expected_sha256:
+        return expected_sha256.strip().lower()
+    sidecar = f"{path}.sha256"
+    if os.path.isfile(sidecar):
+        with open(sidecar) as f:
+            content = f.read().split()
+        if content:
+            return content[0].lower()
+    return None
+
+
+def verify_model_file(path: str, expected_sha256: Optional[str] = None) -> str:
+    """
+    检查本地模型文件存在且校验和匹配，返回文件的实际校验和
+    """
+    if not os.path.isfile(path):
+        raise ModelLoadError(f"模型文件不存在: {path}")
+
+    actual = sha256_file(path)
+    expected = expected_checksum(path, expected_sha256)
+    if expected is None:
+        logger.warning(f"未配置模型校验和，跳过校验: {path} (sha256={actual})")
+    elif actual != expected:
+        raise ModelLoadError(f"模型文件校验失败: {path}，期望 {expected}，实际 {actual}")
+    else:
+        logger.info(f"模型文件校验通过: {path}")
+    return actual
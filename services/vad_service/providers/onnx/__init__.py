@@ -0,0 +1,3 @@
+"""
+ONNX Runtime VAD provider implementation
+"""
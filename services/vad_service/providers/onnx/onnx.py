@@ -0,0 +1,167 @@
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import onnxruntime as ort
+
+from ..audio import decode_audio, resample
+from ..base import BaseVADProvider
+from ..model_loader import ModelLoadError, verify_model_file
+
+logger = logging.getLogger(__name__)
+
+# Silero 模型在各采样率下要求的窗口长度，以及每次拼接在窗口前的上一窗口末尾采样数
+WINDOW_SIZES = {8000: 256, 16000: 512}
+CONTEXT_SIZES = {8000: 32, 16000: 64}
+
+# 循环状态形状为 (2, batch, STATE_SIZE)
+STATE_SIZE = 128
+
+
+@dataclass
+class OnnxStreamState:
+    """
+    单个音频流的循环状态，ONNX 模型本身无状态，状态随每次推理显式传入和返回
+    """
+    state: np.ndarray    # (2, STATE_SIZE)
+    context: np.ndarray  # (context_size,)
+
+
+class OnnxVADProvider(BaseVADProvider):
+    """
+    基于 ONNX Runtime 的 Silero VAD（v5 ONNX 模型）
+
+    整段检测和所有流式会话共用同一个 InferenceSession，不依赖 PyTorch。
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        expected_sha256: Optional[str] = None,
+        intra_op_threads: int = 1,
+        inter_op_threads: int = 1
+    ):
+        self.sample_rate = 16000
+        if not os.path.isfile(model_path):
+            raise ModelLoadError(f"ONNX 模型文件不存在: {model_path}")
+        verify_model_file(model_path, expected_sha256)
+
+        options = ort.SessionOptions()
+        # 单次推理只有一个窗口，算子内并行收益有限，线程数需按每个节点的副本数规划
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+        input_names = {i.name for i in self.session.get_inputs()}
+        if input_names != {"input", "state", "sr"}:
+            raise ModelLoadError(f"不支持的 ONNX 模型输入: {sorted(input_names)}，需要 Silero VAD v5 模型")
+        logger.info(
+            f"从本地加载 ONNX VAD 模型: {model_path}，"
+            f"intra_op_threads={intra_op_threads}，inter_op_threads={inter_op_threads}"
+        )
+
+    def detect(self, audio_data: bytes, sample_rate: Optional[int] = None) -> Dict:
+        """
+        使用 ONNX Runtime 检测语音活动
+        """
+        return self.detect_batch([(audio_data, sample_rate)])[0]
+
+    def detect_batch(self, items: List[Tuple[bytes, Optional[int]]]) -> List[Dict]:
+        """
+        将多段音频补零到相同长度后按窗口批量推理，每个时间步只调用一次模型
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        waveforms: Dict[int, np.ndarray] = {}
+
+        # 1. 加载音频，单条解码失败不影响同批次的其他请求
+        for index, (audio_data, sample_rate) in enumerate(items):
+            try:
+                audio, sample_rate = decode_audio(audio_data, sample_rate)
+                waveforms[index] = resample(audio, sample_rate, self.sample_rate)
+            except Exception as e:
+                results[index] = self._error_result(e)
+
+        if waveforms:
+            try:
+                # 2. 批量检测语音
+                probs = self._batch_probs(list(waveforms.values()))
+                # 3. 处理结果
+                for (index, waveform), window_probs in zip(waveforms.items(), probs):
+                    results[index] = self._build_result(
+                        len(waveform), self.sample_rate, WINDOW_SIZES[self.sample_rate], window_probs
+                    )
+            except Exception as e:
+                for index in waveforms:
+                    results[index] = self._error_result(e)
+
+        return results
+
+    def _batch_probs(self, waveforms: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        计算每段音频逐窗口的语音概率，形状为 (B, T) 的批次按时间步送入模型
+        """
+        window_size = WINDOW_SIZES[self.sample_rate]
+        num_windows = [max(math.ceil(len(waveform) / window_size), 1) for waveform in waveforms]
+        max_windows = max(num_windows)
+
+        batch = np.zeros((len(waveforms), max_windows * window_size), dtype=np.float32)
+        for row, waveform in enumerate(waveforms):
+            batch[row, :len(waveform)] = waveform
+
+        states = np.zeros((2, len(waveforms), STATE_SIZE), dtype=np.float32)
+        contexts = np.zeros((len(waveforms), CONTEXT_SIZES[self.sample_rate]), dtype=np.float32)
+        probs = np.empty((len(waveforms), max_windows), dtype=np.float32)
+        for step in range(max_windows):
+            chunk = batch[:, step * window_size:(step + 1) * window_size]
+            probs[:, step], states, contexts = self._run(chunk, states, contexts, self.sample_rate)
+
+        return [probs[row, :count] for row, count in enumerate(num_windows)]
+
+    def _run(self, windows: np.ndarray, states: np.ndarray, contexts: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        对 (B, window_size) 的窗口运行一步模型，返回 (概率, 新状态, 新上下文)
+        """
+        x = np.concatenate([contexts, windows], axis=1)
+        output, new_states = self.session.run(
+            None, {"input": x, "state": states, "sr": np.array(sample_rate, dtype=np.int64)}
+        )
+        return output.reshape(-1), new_states, x[:, -contexts.shape[1]:]
+
+    def get_supported_formats(self) -> List[str]:
+        """获取支持的音频格式"""
+        return ['.wav', '.flac', '.ogg']
+
+    def get_stream_sample_rates(self) -> List[int]:
+        return list(WINDOW_SIZES)
+
+    def get_window_size(self, sample_rate: int) -> int:
+        return WINDOW_SIZES[sample_rate]
+
+    def create_stream_state(self, sample_rate: int) -> OnnxStreamState:
+        return OnnxStreamState(
+            state=np.zeros((2, STATE_SIZE), dtype=np.float32),
+            context=np.zeros(CONTEXT_SIZES[sample_rate], dtype=np.float32)
+        )
+
+    def stream_forward(self, window: np.ndarray, state: OnnxStreamState, sample_rate: int) -> Tuple[float, OnnxStreamState]:
+        probs, states = self.stream_forward_batch(window[None, :], [state], sample_rate)
+        return probs[0], states[0]
+
+    def stream_forward_batch(self, windows: np.ndarray, states: List[OnnxStreamState], sample_rate: int) -> Tuple[List[float], List[OnnxStreamState]]:
+        """
+        状态是显式张量，多个会话的窗口和状态直接拼成一个批次，一次推理完成
+        """
+        batch_states = np.stack([s.state for s in states], axis=1)
+        contexts = np.stack([s.context for s in states])
+        probs, new_states, new_contexts = self._run(
+            windows.astype(np.float32, copy=False), batch_states, contexts, sample_rate
+        )
+        return probs.tolist(), [
+            OnnxStreamState(state=new_states[:, row], context=new_contexts[row])
+            for row in range(len(states))
+        ]
@@ -1,93 +1,133 @@
+import copy
+import logging
+import math
+import os
 import torch
-import torchaudio
 import numpy as np
-import soundfile as sf
-from io import BytesIO
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from ..audio import decode_audio, resample
 from ..base import BaseVADProvider
+from ..model_loader import ModelLoadError, verify_model_file
+
+logger = logging.getLogger(__name__)
+
+# Silero 模型在各采样率下要求的窗口长度
+WINDOW_SIZES = {8000: 256, 16000: 512}
 
 class SileroVADProvider(BaseVADProvider):
-    def __init__(self):
-        self.model = torch.hub.load(
-            repo_or_dir='snakers4/silero-vad',
-            model='silero_vad',
-            force_reload=True
-        )
+    def __init__(
+        self,
+        model_path: Optional[str] = None,
+        expected_sha256: Optional[str] = None,
+        allow_hub_download: bool = False
+    ):
         self.sample_rate = 16000
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = self._load_model(model_path, expected_sha256, allow_hub_download)
         self.model = self.model.to(self.device)
+        self.model.eval()
+        # 流式会话从未参与推理的模板复制状态，与整段检测并发运行时互不干扰
+        self._stream_template = copy.deepcopy(self.model)
+
+    def _load_model(self, model_path: Optional[str], expected_sha256: Optional[str], allow_hub_download: bool) -> torch.nn.Module:
+        """
+        优先从本地 TorchScript 文件加载模型；仅在显式允许时才回退到 torch.hub
+        """
+        if model_path and os.path.isfile(model_path):
+            verify_model_file(model_path, expected_sha256)
+            logger.info(f"从本地加载 Silero VAD 模型: {model_path}")
+            return torch.jit.load(model_path, map_location=self.device)
+
+        if not allow_hub_download:
+            raise ModelLoadError(f"本地模型文件不存在: {model_path}，且未允许从 torch.hub 下载")
 
-    def detect(self, audio_data: bytes) -> Dict:
+        logger.warning(f"本地模型文件不存在: {model_path}，从 torch.hub 缓存加载")
+        model, _ = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad')
+        return model
+
+    def detect(self, audio_data: bytes, sample_rate: Optional[int] = None) -> Dict:
         """
         使用 Silero VAD 检测语音活动
         """
-        try:
-            # 1. 加载音频
-            waveform = self._load_audio(audio_data)
-            
-            # 2. 检测语音
-            speech_timestamps = self.model(
-                waveform,
-                self.sample_rate,
-                min_speech_duration_ms=500,    # 最小语音片段时长
-                min_silence_duration_ms=300,   # 最小静音时长
-                threshold=0.5                  # 检测阈值
-            )
-            
-            # 3. 处理结果
-            segments = []
-            for start, end in speech_timestamps:
-                segments.append({
-                    "start_time": start / 1000,  # 转换为秒
-                    "end_time": end / 1000,
-                    "duration": (end - start) / 1000,
-                    "confidence": 0.95  # Silero 不直接提供置信度
-                })
-            
-            # 4. 计算元数据
-            total_duration = len(waveform) / self.sample_rate
-            speech_duration = sum(s["duration"] for s in segments)
-            
-            return {
-                "status": "success",
-                "speech_segments": segments,
-                "metadata": {
-                    "total_duration": total_duration,
-                    "speech_ratio": speech_duration / total_duration if total_duration > 0 else 0,
-                    "num_segments": len(segments)
-                }
-            }
-            
-        except Exception as e:
-            return {
-                "status": "error",
-                "error": str(e),
-                "speech_segments": [],
-                "metadata": {}
-            }
-
-    def _load_audio(self, audio_data: bytes) -> torch.Tensor:
+        return self.detect_batch([(audio_data, sample_rate)])[0]
+
+    def detect_batch(self, items: List[Tuple[bytes, Optional[int]]]) -> List[Dict]:
+        """
+        将多段音频补零到相同长度后按窗口批量推理，每个时间步只调用一次模型
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        waveforms: Dict[int, np.ndarray] = {}
+
+        # 1. 加载音频，单条解码失败不影响同批次的其他请求
+        for index, (audio_data, sample_rate) in enumerate(items):
+            try:
+                audio, sample_rate = decode_audio(audio_data, sample_rate)
+                waveforms[index] = resample(audio, sample_rate, self.sample_rate)
+            except Exception as e:
+                results[index] = self._error_result(e)
+
+        if waveforms:
+            try:
+                # 2. 批量检测语音
+                probs = self._batch_probs(list(waveforms.values()))
+                # 3. 处理结果
+                for (index, waveform), window_probs in zip(waveforms.items(), probs):
+                    results[index] = self._build_result(
+                        len(waveform), self.sample_rate, WINDOW_SIZES[self.sample_rate], window_probs
+                    )
+            except Exception as e:
+                for index in waveforms:
+                    results[index] = self._error_result(e)
+
+        return results
+
+    @torch.no_grad()
+    def _batch_probs(self, waveforms: List[np.ndarray]) -> List[np.ndarray]:
         """
-        加载音频数据
+        计算每段音频逐窗口的语音概率，形状为 (B, T) 的批次按时间步送入模型
         """
-        # 使用 soundfile 读取音频数据
-        with BytesIO(audio_data) as audio_buffer:
-            audio, sample_rate = sf.read(audio_buffer)
-            
-            # 转换为单声道
-            if len(audio.shape) > 1:
-                audio = audio.mean(axis=1)
-            
-            # 重采样到目标采样率
-            if sample_rate != self.sample_rate:
-                audio = torchaudio.transforms.Resample(
-                    sample_rate, self.sample_rate
-                )(torch.from_numpy(audio))
-            else:
-                audio = torch.from_numpy(audio)
-            
-            return audio.to(self.device)
+        window_size = WINDOW_SIZES[self.sample_rate]
+        num_windows = [max(math.ceil(len(waveform) / window_size), 1) for waveform in waveforms]
+        max_windows = max(num_windows)
+
+        # 在主机内存中拼好批次后一次性拷贝到推理设备
+        batch = np.zeros((len(waveforms), max_windows * window_size), dtype=np.float32)
+        for row, waveform in enumerate(waveforms):
+            batch[row, :len(waveform)] = waveform
+        batch = torch.from_numpy(batch).to(self.device)
+
+        self.model.reset_states(len(waveforms))
+        probs = torch.empty(len(waveforms), max_windows, device=self.device)
+        for step in range(max_windows):
+            chunk = batch[:, step * window_size:(step + 1) * window_size]
+            probs[:, step] = self.model(chunk, self.sample_rate).reshape(-1)
+
+        probs = probs.cpu().numpy()
+        return [probs[row, :count] for row, count in enumerate(num_windows)]
 
     def get_supported_formats(self) -> List[str]:
         """获取支持的音频格式"""
-        return ['.wav', '.flac', '.ogg'] 
\ No newline at end of file
+        return ['.wav', '.flac', '.ogg']
+
+    def get_stream_sample_rates(self) -> List[int]:
+        return list(WINDOW_SIZES)
+
+    def get_window_size(self, sample_rate: int) -> int:
+        return WINDOW_SIZES[sample_rate]
+
+    def create_stream_state(self, sample_rate: int) -> torch.nn.Module:
+        """
+        TorchScript 模型把循环状态保存在模型内部，
+        模型只有约2MB，因此每个会话复制一份以隔离状态
+
+        各会话的状态在不同的模型副本中，无法拼成一个批次，因此不覆盖 stream_forward_batch，
+        流式帧逐个会话推理；需要流式合批时使用状态为显式张量的 ONNX 实现
+        """
+        model = copy.deepcopy(self._stream_template)
+        model.reset_states()
+        return model
+
+    @torch.no_grad()
+    def stream_forward(self, window: np.ndarray, state: torch.nn.Module, sample_rate: int) -> Tuple[float, torch.nn.Module]:
+        prob = state(torch.from_numpy(window).to(self.device), sample_rate).item()
+        return prob, state
@@ -0,0 +1,201 @@
+import time
+import numpy as np
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .base import BaseVADProvider
+
+
+class SpeechEndpointer:
+    """
+    基于逐窗口语音概率的端点检测状态机
+
+    使用双阈值滞回判断语音开始，静音持续超过 min_silence_duration_ms 判定语音结束。
+    语音持续达到 min_speech_duration_ms 后才发出 speech_start（时间仍为语音实际开始处），
+    更短的片段（咳嗽、按键声等）不产生任何事件。流式会话和整段音频检测共用这一逻辑。
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        window_size: int,
+        threshold: float = 0.5,
+        min_silence_duration_ms: int = 300,
+        speech_pad_ms: int = 30,
+        min_speech_duration_ms: int = 0,
+    ):
+        self.sample_rate = sample_rate
+        self.window_size = window_size
+        self.threshold = threshold
+        self.neg_threshold = max(threshold - 0.15, 0.01)
+        self.min_silence_samples = sample_rate * min_silence_duration_ms // 1000
+        self.speech_pad_samples = sample_rate * speech_pad_ms // 1000
+        self.min_speech_samples = sample_rate * min_speech_duration_ms // 1000
+
+        self.current_sample = 0
+        self.triggered = False
+        self.announced = False
+        self.speech_start_sample = 0
+        self.temp_end = 0
+
+    def update(self, prob: float) -> Optional[Dict]:
+        """
+        根据一个窗口的语音概率推进状态机，返回新产生的事件
+        """
+        self.current_sample += self.window_size
+
+        if prob >= self.threshold and self.temp_end:
+            self.temp_end = 0
+
+        if prob >= self.threshold and not self.triggered:
+            self.triggered = True
+            self.announced = False
+            self.speech_start_sample = max(
+                self.current_sample - self.speech_pad_samples - self.window_size, 0
+            )
+
+        if prob < self.neg_threshold and self.triggered and not self.temp_end:
+            self.temp_end = self.current_sample
+
+        # 语音结束与达到最短时长在同一窗口时先发出 speech_start，结束条件在下一个窗口仍然成立
+        if (
+            self.triggered and not self.announced
+            and self._end_sample() - self.speech_start_sample >= self.min_speech_samples
+        ):
+            self.announced = True
+            return self._speech_start_event()
+
+        if prob < self.neg_threshold and self.triggered:
+            if self.current_sample - self.temp_end < self.min_silence_samples:
+                return None
+            end_sample = self._end_sample()
+            self.temp_end = 0
+            self.triggered = False
+            return self._speech_end_event(end_sample) if self.announced else None
+
+        return None
+
+    def flush(self) -> List[Dict]:
+        """
+        音频结束时调用，若仍处于语音段内则补发结束事件
+        """
+        if not self.triggered:
+            return []
+        end_sample = self._end_sample()
+        self.triggered = False
+        self.temp_end = 0
+        if self.announced:
+            return [self._speech_end_event(end_sample)]
+        if end_sample - self.speech_start_sample < self.min_speech_samples:
+            return []
+        return [self._speech_start_event(), self._speech_end_event(end_sample)]
+
+    @property
+    def in_speech(self) -> bool:
+        """已发出 speech_start 且尚未结束"""
+        return self.triggered and self.announced
+
+    @property
+    def processed_duration(self) -> float:
+        return self.current_sample / self.sample_rate
+
+    def _end_sample(self) -> int:
+        """若语音在当前窗口结束，结束处的采样点"""
+        if not self.temp_end:
+            return self.current_sample
+        return min(self.temp_end + self.speech_pad_samples, self.current_sample)
+
+    def _speech_start_event(self) -> Dict:
+        return {"event": "speech_start", "time": self.speech_start_sample / self.sample_rate}
+
+    def _speech_end_event(self, end_sample: int) -> Dict:
+        return {
+            "event": "speech_end",
+            "time": end_sample / self.sample_rate,
+            "start_time": self.speech_start_sample / self.sample_rate,
+            "duration": (end_sample - self.speech_start_sample) / self.sample_rate,
+        }
+
+
+class StreamingVADSession:
+    """
+    流式 VAD 会话
+
+    保存单个音频流的模型循环状态和未满一个窗口的剩余采样点，
+    每次 push 只处理新到达的音频帧，并增量输出语音起止事件。
+    """
+
+    def __init__(
+        self,
+        provider: "BaseVADProvider",
+        sample_rate: int = 16000,
+        threshold: float = 0.5,
+        min_silence_duration_ms: int = 300,
+        speech_pad_ms: int = 30,
+        min_speech_duration_ms: int = 500,
+    ):
+        if sample_rate not in provider.get_stream_sample_rates():
+            raise ValueError(
+                f"不支持的采样率 {sample_rate}，可选: {provider.get_stream_sample_rates()}"
+            )
+        self.provider = provider
+        self.sample_rate = sample_rate
+        self.window_size = provider.get_window_size(sample_rate)
+        self.endpointer = SpeechEndpointer(
+            sample_rate,
+            self.window_size,
+            threshold=threshold,
+            min_silence_duration_ms=min_silence_duration_ms,
+            speech_pad_ms=speech_pad_ms,
+            min_speech_duration_ms=min_speech_duration_ms,
+        )
+
+        self.state: Any = provider.create_stream_state(sample_rate)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pending_byte = b""
+        self.last_active = time.monotonic()
+
+    def push(self, pcm_data: bytes) -> List[Dict]:
+        """
+        追加一段16位单声道PCM音频并返回新产生的事件
+        """
+        return self.process_windows(self.take_windows(pcm_data))
+
+    def take_windows(self, pcm_data: bytes) -> np.ndarray:
+        """
+        将新音频追加到缓冲区，取出所有完整的窗口，形状为 (N, window_size)
+        """
+        self.last_active = time.monotonic()
+        data = self._pending_byte + pcm_data
+        usable = len(data) - len(data) % 2
+        self._pending_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+
+        num_windows = len(samples) // self.window_size
+        self._pending = samples[num_windows * self.window_size:]
+        return samples[:num_windows * self.window_size].reshape(num_windows, self.window_size)
+
+    def process_windows(self, windows: np.ndarray) -> List[Dict]:
+        """
+        逐窗口运行模型并更新端点状态
+        """
+        events = []
+        for window in windows:
+            prob, self.state = self.provider.stream_forward(window, self.state, self.sample_rate)
+            event = self.endpointer.update(prob)
+            if event:
+                events.append(event)
+        return events
+
+    def flush(self) -> List[Dict]:
+        return self.endpointer.flush()
+
+    @property
+    def triggered(self) -> bool:
+        return self.endpointer.in_speech
+
+    @property
+    def processed_duration(self) -> float:
+        return self.endpointer.processed_duration
@@ -0,0 +1,353 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from multiprocessing import connection, shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from batching import run_frame_batch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RemoteSession:
+    """
+    固定在某个工作进程上的流式会话句柄，模型状态保存在工作进程中
+    """
+    session_id: str
+    worker_index: int
+    sample_rate: int
+    window_size: int
+    triggered: bool = False
+    processed_duration: float = 0.0
+    last_active: float = field(default_factory=time.monotonic)
+
+
+def _open_shared_audio(payload: list) -> Tuple[list, list]:
+    """
+    映射父进程写入音频的共享内存，返回 (共享内存段, 检测输入)；
+    检测输入是共享内存上的 memoryview，解码时直接在其上构造采样数组，不复制音频
+    """
+    segments, items = [], []
+    try:
+        for name, size, sample_rate in payload:
+            shm = shared_memory.SharedMemory(name=name)
+            segments.append(shm)
+            items.append((shm.buf[:size], sample_rate))
+    except Exception:
+        _close_shared_audio(segments, items)
+        raise
+    return segments, items
+
+
+def _close_shared_audio(segments: list, items: list):
+    """检测完成后解除映射；共享内存的释放(unlink)由父进程在收到结果后负责"""
+    try:
+        for view, _ in items:
+            view.release()
+        for shm in segments:
+            shm.close()
+    except BufferError as e:
+        # 仍有数组引用共享内存时由垃圾回收解除映射
+        logger.warning(f"共享内存仍被引用，延后解除映射: {e}")
+
+
+def _worker_main(worker_index: int, provider_factory: Callable, requests, responses):
+    """
+    工作进程主循环：加载并预热一份模型，串行处理父进程分派的任务
+    """
+    logging.basicConfig(level=logging.INFO)
+    try:
+        provider = provider_factory()
+        provider.warmup()
+    except Exception as e:
+        responses.put((None, worker_index, False, f"{type(e).__name__}: {e}"))
+        return
+    sessions: Dict[str, Any] = {}
+    responses.put((None, worker_index, True, "ready"))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        task_id, op, payload = message
+        try:
+            if op == "detect_batch":
+                segments, items = _open_shared_audio(payload)
+                try:
+                    result = provider.detect_batch(items)
+                finally:
+                    _close_shared_audio(segments, items)
+                    del segments, items
+            elif op == "open_session":
+                session_id, params = payload
+                session = provider.create_session(**params)
+                sessions[session_id] = session
+                result = {"sample_rate": session.sample_rate, "window_size": session.window_size}
+            elif op == "push_frames":
+                batch = [(sessions[session_id], pcm_data) for session_id, pcm_data in payload]
+                events = run_frame_batch(provider, [s for s, _ in batch], [f for _, f in batch])
+                result = [
+                    {"events": e, "in_speech": s.triggered, "processed_duration": s.processed_duration}
+                    for (s, _), e in zip(batch, events)
+                ]
+            elif op == "close_session":
+                session = sessions.pop(payload, None)
+                result = session.flush() if session else []
+            else:
+                raise ValueError(f"未知的任务类型: {op}")
+            responses.put((task_id, worker_index, True, result))
+        except Exception as e:
+            responses.put((task_id, worker_index, False, f"{type(e).__name__}: {e}"))
+
+
+class ProcessPoolEngine:
+    """
+    VAD 模型工作进程池
+
+    每个工作进程持有一份模型，HTTP 服务只在主进程中运行一份。
+    整段音频通过共享内存交给工作进程，不经过 pickle 序列化；
+    整段检测按在途任务数选择负载最低的工作进程，每个进程的在途任务数不超过 max_queue_depth；
+    流式会话固定在创建它的工作进程上。
+    工作进程异常退出（内存不足、推理库崩溃、被杀死）时，分派给它的任务立即失败，
+    该进程上的流式会话失效，随后重新启动该进程；重新加载模型期间新任务分派给其他已就绪的进程。
+    """
+
+    def __init__(self, provider_factory: Callable, num_workers: int, max_queue_depth: int = 4):
+        self.provider_factory = provider_factory
+        self.num_workers = num_workers
+        self.max_queue_depth = max_queue_depth
+        self.concurrency = num_workers * max_queue_depth
+        self.in_flight = [0] * num_workers
+        self.ready = [False] * num_workers
+        self.load_errors: Dict[int, str] = {}
+        self._ctx = multiprocessing.get_context("spawn")
+        self._responses = self._ctx.Queue()
+        self._requests = [self._ctx.Queue() for _ in range(num_workers)]
+        self._processes: List[multiprocessing.Process] = []
+        # 任务ID -> (结果, 共享内存段, 工作进程序号)
+        self._pending: Dict[int, Tuple[asyncio.Future, List[shared_memory.SharedMemory], int]] = {}
+        self.restarts = [0] * num_workers
+        self._stopping = False
+        self._monitor: Optional[threading.Thread] = None
+        self._task_ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slot_available: Optional[asyncio.Condition] = None
+        self._reader: Optional[threading.Thread] = None
+        self._all_ready: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._slot_available = asyncio.Condition()
+        self._all_ready = asyncio.Event()
+        self._processes = [self._spawn(index) for index in range(self.num_workers)]
+        self._reader = threading.Thread(target=self._read_responses, name="vad-pool-reader", daemon=True)
+        self._reader.start()
+        self._monitor = threading.Thread(target=self._watch_workers, name="vad-pool-monitor", daemon=True)
+        self._monitor.start()
+        logger.info(f"VAD工作进程池已启动，进程数 {self.num_workers}，单进程队列深度 {self.max_queue_depth}")
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.provider_factory, self._requests[index], self._responses),
+            name=f"vad-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    async def stop(self):
+        self._stopping = True
+        for requests in self._requests:
+            requests.put(None)
+        self._responses.put(None)
+        for process in self._processes:
+            await self._loop.run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.terminate()
+
+    def is_ready(self) -> bool:
+        return all(self.ready)
+
+    async def wait_ready(self):
+        await self._all_ready.wait()
+        if self.load_errors:
+            raise RuntimeError(f"VAD工作进程加载模型失败: {self.load_errors}")
+
+    async def detect_batch(self, items: List[Tuple[bytes, Optional[int]]]) -> List[Dict]:
+        await self.wait_ready()
+        worker_index = await self._acquire_least_loaded()
+        segments = []
+        try:
+            for audio_data, _ in items:
+                shm = shared_memory.SharedMemory(create=True, size=max(len(audio_data), 1))
+                shm.buf[:len(audio_data)] = audio_data
+                segments.append(shm)
+        except Exception:
+            self._release_shared(segments)
+            self._finish(worker_index)
+            raise
+        payload = [(shm.name, len(audio_data), sample_rate) for shm, (audio_data, sample_rate) in zip(segments, items)]
+        return await self._submit(worker_index, "detect_batch", payload, segments)
+
+    async def open_session(self, **params) -> RemoteSession:
+        await self.wait_ready()
+        worker_index = min(self._candidates(), key=lambda i: self.in_flight[i])
+        self.in_flight[worker_index] += 1
+        session_id = uuid.uuid4().hex
+        info = await self._submit(worker_index, "open_session", (session_id, params))
+        return RemoteSession(session_id, worker_index, info["sample_rate"], info["window_size"])
+
+    async def push_frames(self, sessions: List[RemoteSession], frames: List[bytes]) -> List[List[Dict]]:
+        # 音频帧只有几KB，直接随消息发送；同一工作进程的会话合并为一个批次
+        by_worker: Dict[int, List[int]] = {}
+        for index, session in enumerate(sessions):
+            by_worker.setdefault(session.worker_index, []).append(index)
+
+        async def push_to_worker(worker_index: int, indices: List[int]):
+            self.in_flight[worker_index] += 1
+            payload = [(sessions[i].session_id, frames[i]) for i in indices]
+            return indices, await self._submit(worker_index, "push_frames", payload)
+
+        events: List[List[Dict]] = [[] for _ in sessions]
+        for indices, results in await asyncio.gather(
+            *(push_to_worker(worker_index, indices) for worker_index, indices in by_worker.items())
+        ):
+            for index, result in zip(indices, results):
+                session = sessions[index]
+                session.triggered = result["in_speech"]
+                session.processed_duration = result["processed_duration"]
+                session.last_active = time.monotonic()
+                events[index] = result["events"]
+        return events
+
+    async def close_session(self, session: RemoteSession) -> List[Dict]:
+        self.in_flight[session.worker_index] += 1
+        return await self._submit(session.worker_index, "close_session", session.session_id)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": "process_pool",
+            "ready": self.is_ready(),
+            "errors": self.load_errors,
+            "workers": [
+                {
+                    "index": index,
+                    "alive": process.is_alive(),
+                    "ready": self.ready[index],
+                    "in_flight": self.in_flight[index],
+                    "restarts": self.restarts[index]
+                }
+                for index, process in enumerate(self._processes)
+            ]
+        }
+
+    def _candidates(self) -> List[int]:
+        """可分派任务的工作进程：优先选择已就绪的，全部在重启时任务在其队列中等待"""
+        ready = [index for index in range(self.num_workers) if self.ready[index]]
+        return ready or list(range(self.num_workers))
+
+    async def _acquire_least_loaded(self) -> int:
+        """选择在途任务最少且未达到队列深度上限的工作进程，全部已满时等待"""
+        async with self._slot_available:
+            while True:
+                worker_index = min(self._candidates(), key=lambda i: self.in_flight[i])
+                if self.in_flight[worker_index] < self.max_queue_depth:
+                    self.in_flight[worker_index] += 1
+                    return worker_index
+                await self._slot_available.wait()
+
+    async def _submit(self, worker_index: int, op: str, payload: Any, segments: Optional[list] = None):
+        """调用方已为 worker_index 占用一个在途名额"""
+        task_id = next(self._task_ids)
+        future = self._loop.create_future()
+        self._pending[task_id] = (future, segments or [], worker_index)
+        self._requests[worker_index].put((task_id, op, payload))
+        return await future
+
+    def _read_responses(self):
+        """后台线程：读取工作进程的结果并交回事件循环"""
+        while True:
+            message = self._responses.get()
+            if message is None:
+                break
+            self._loop.call_soon_threadsafe(self._complete, *message)
+
+    def _watch_workers(self):
+        """后台线程：等待工作进程的 sentinel，进程退出时交给事件循环处理"""
+        reported = set()
+        while not self._stopping:
+            processes = {process.sentinel: (index, process) for index, process in enumerate(self._processes)}
+            for sentinel in connection.wait([s for s in processes if s not in reported], timeout=1.0):
+                reported.add(sentinel)
+                if not self._stopping:
+                    self._loop.call_soon_threadsafe(self._on_worker_exit, *processes[sentinel])
+
+    def _on_worker_exit(self, worker_index: int, process: multiprocessing.Process):
+        if self._stopping or self._processes[worker_index] is not process:
+            return
+        # sentinel 就绪后进程很快结束，回收后才能取得退出码
+        process.join(1)
+        logger.error(f"VAD工作进程 {worker_index} 异常退出，退出码 {process.exitcode}")
+        self.ready[worker_index] = False
+        # 分派给该进程的任务不会再有结果
+        for task_id in [t for t, (_, _, index) in self._pending.items() if index == worker_index]:
+            future, segments, _ = self._pending.pop(task_id)
+            self._release_shared(segments)
+            self._finish(worker_index)
+            if not future.done():
+                future.set_exception(RuntimeError(f"VAD工作进程 {worker_index} 异常退出"))
+        if worker_index in self.load_errors:
+            # 加载模型失败的进程重启后仍会失败
+            return
+        # 未被处理的消息留在旧队列中，重启的进程使用新队列
+        self._requests[worker_index] = self._ctx.Queue()
+        self._processes[worker_index] = self._spawn(worker_index)
+        self.restarts[worker_index] += 1
+
+    def _complete(self, task_id: Optional[int], worker_index: int, ok: bool, result: Any):
+        if task_id is None:
+            if ok:
+                self.ready[worker_index] = True
+                logger.info(f"VAD工作进程 {worker_index} 已就绪")
+                # 重启的进程就绪后唤醒等待名额的任务
+                asyncio.ensure_future(self._notify_slot())
+            else:
+                self.load_errors[worker_index] = result
+                logger.error(f"VAD工作进程 {worker_index} 加载模型失败: {result}")
+            # 任一进程加载失败时同样唤醒等待方，由 wait_ready 抛出错误
+            if self.is_ready() or self.load_errors:
+                self._all_ready.set()
+            return
+        if task_id not in self._pending:
+            # 进程退出时已按失败处理的任务
+            return
+        future, segments, _ = self._pending.pop(task_id)
+        self._release_shared(segments)
+        self._finish(worker_index)
+        if future.done():
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(result))
+
+    def _finish(self, worker_index: int):
+        self.in_flight[worker_index] -= 1
+        asyncio.ensure_future(self._notify_slot())
+
+    async def _notify_slot(self):
+        async with self._slot_available:
+            self._slot_available.notify()
+
+    @staticmethod
+    def _release_shared(segments: List[shared_memory.SharedMemory]):
+        for shm in segments:
+            shm.close()
+            shm.unlink()
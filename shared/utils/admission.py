@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from shared.utils.http_pool import parse_service_limits
+
+logger = logging.getLogger(__name__)
+
+# 每个下游服务的默认并发上限、排队上限和最长排队时间（秒），可通过环境变量覆盖
+DEFAULT_CONCURRENCY = int(os.getenv("GATEWAY_DEFAULT_CONCURRENCY", "64"))
+DEFAULT_MAX_QUEUE = int(os.getenv("GATEWAY_MAX_QUEUE", "100"))
+DEFAULT_MAX_QUEUE_WAIT = float(os.getenv("GATEWAY_MAX_QUEUE_WAIT", "5"))
+# 每个客户端每秒允许的请求数及突发上限，0 表示不限流
+DEFAULT_RATE_LIMIT = float(os.getenv("GATEWAY_RATE_LIMIT", "0"))
+DEFAULT_RATE_BURST = int(os.getenv("GATEWAY_RATE_BURST", "20"))
+# 平均处理时长的指数滑动平均系数
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    """服务过载，请求被拒绝；retry_after 为建议客户端重试前等待的秒数"""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimited(AdmissionRejected):
+    """客户端请求频率超过限制"""
+
+    status_code = 429
+
+
+class ConcurrencyLimiter:
+    """
+    单个下游服务的并发限制和有界等待队列
+
+    同时执行的请求数不超过 max_concurrency，其余请求按到达顺序排队，排队数不超过 max_queue。
+    按最近请求的平均处理时长估算排队等待时间，预计无法在 max_wait（或调用方剩余时间）内开始执行的请求
+    立即拒绝，而不是排队到超时；等待超过期限的请求同样被拒绝。
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int = 100, max_wait: float = 5.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_service_time: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def estimated_wait(self) -> float:
+        """新请求预计的排队时间（秒）"""
+        if self.active < self.max_concurrency and not self._waiters:
+            return 0.0
+        return (len(self._waiters) + 1) * (self.avg_service_time or 0.0) / self.max_concurrency
+
+    async def acquire(self, timeout: Optional[float] = None) -> float:
+        """获取执行名额，返回开始时间，完成后必须以该时间调用 release；无法及时获得名额时抛出 AdmissionRejected"""
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return time.monotonic()
+
+        wait_budget = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        if len(self._waiters) >= self.max_queue:
+            self._reject()
+            raise AdmissionRejected(f"{self.name} 服务排队请求过多", self._retry_after())
+        if self.estimated_wait() > wait_budget:
+            self._reject()
+            raise AdmissionRejected(f"{self.name} 服务繁忙，预计等待时间超过期限", self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, max(wait_budget, 0))
+        except asyncio.TimeoutError:
+            # 超时的同时被分配到名额时照常执行
+            if not (waiter.done() and not waiter.cancelled()):
+                self._remove_waiter(waiter)
+                self._reject()
+                raise AdmissionRejected(f"{self.name} 服务繁忙，排队超时", self._retry_after())
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_off()
+            else:
+                self._remove_waiter(waiter)
+            raise
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, started: float):
+        elapsed = time.monotonic() - started
+        if self.avg_service_time is None:
+            self.avg_service_time = elapsed
+        else:
+            self.avg_service_time += SERVICE_TIME_SMOOTHING * (elapsed - self.avg_service_time)
+        self._hand_off()
+
+    def _hand_off(self):
+        """把名额直接交给排在最前面的等待者，没有等待者时归还"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove_waiter(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _reject(self):
+        self.rejected += 1
+        if self.rejected % 100 == 1:
+            logger.warning(f"{self.name} 服务过载，拒绝请求（累计 {self.rejected} 次）")
+
+    def _retry_after(self) -> float:
+        return max(self.estimated_wait(), self.avg_service_time or 1.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_service_time": round(self.avg_service_time, 4) if self.avg_service_time is not None else None,
+        }
+
+
+class RateLimiter:
+    """
+    按客户端的令牌桶限流：每个客户端每秒补充 rate 个令牌，最多积攒 burst 个，每个请求消耗一个
+
+    只保留最近活跃的 max_clients 个客户端的令牌桶，被淘汰的客户端重新从满桶开始。
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        # 客户端 -> (剩余令牌数, 上次更新时间)
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, key: str) -> float:
+        """消耗一个令牌；允许时返回0，否则返回还需等待的秒数"""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            self.limited += 1
+            wait = (1 - tokens) / self.rate
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets), "limited": self.limited}
+
+
+class Admission:
+    """一个已获准执行的请求占用的名额，请求结束后调用 release 归还，重复调用无副作用"""
+
+    def __init__(self, limiter: ConcurrencyLimiter, started: float):
+        self.limiter = limiter
+        self.started = started
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter.release(self.started)
+
+
+class AdmissionController:
+    """
+    网关的准入控制
+
+    请求先按客户端限流（超出时返回429），再占用目标服务的并发名额（过载时返回503），
+    两种拒绝都带有 Retry-After，让客户端退避而不是立即重试。
+    各服务的并发上限由 service_limits 指定（例如 GATEWAY_SERVICE_CONCURRENCY="llm=32,tts=16"），
+    未指定的服务使用 default_concurrency。
+    """
+
+    def __init__(
+        self,
+        service_limits: Optional[Dict[str, int]] = None,
+        default_concurrency: int = DEFAULT_CONCURRENCY,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_wait: float = DEFAULT_MAX_QUEUE_WAIT,
+        rate: float = DEFAULT_RATE_LIMIT,
+        burst: int = DEFAULT_RATE_BURST,
+    ):
+        self.service_limits = service_limits if service_limits is not None else parse_service_limits(
+            os.getenv("GATEWAY_SERVICE_CONCURRENCY")
+        )
+        self.default_concurrency = default_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rate_limiter = RateLimiter(rate, burst)
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def limiter(self, service: str) -> ConcurrencyLimiter:
+        if service not in self._limiters:
+            self._limiters[service] = ConcurrencyLimiter(
+                service,
+                self.service_limits.get(service, self.default_concurrency),
+                max_queue=self.max_queue,
+                max_wait=self.max_wait,
+            )
+        return self._limiters[service]
+
+    async def admit(self, service: str, client_key: str, timeout: Optional[float] = None) -> Admission:
+        """检查客户端限流并获取服务名额；被拒绝时抛出 RateLimited 或 AdmissionRejected"""
+        wait = self.rate_limiter.check(client_key)
+        if wait > 0:
+            raise RateLimited(f"客户端 {client_key} 请求过于频繁", wait)
+        limiter = self.limiter(service)
+        started = await limiter.acquire(timeout)
+        return Admission(limiter, started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_queue": self.max_queue,
+            "max_queue_wait": self.max_wait,
+            "rate_limit": self.rate_limiter.stats(),
+            "services": {name: limiter.stats() for name, limiter in self._limiters.items()},
+        }
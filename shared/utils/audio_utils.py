@@ -4,6 +4,38 @@
 # - Read audio metadata
 # - Segment audio based on silence (could be part of VAD logic or a pre-processing step)
 
+import struct
+from typing import Optional
+
+def parse_pcm_sample_rate(content_type: Optional[str]) -> Optional[int]:
+    """
+    解析原始PCM的Content-Type，例如 audio/L16;rate=16000;channels=1
+    非原始PCM格式返回 None，由解码器自行识别文件格式
+    """
+    if not content_type:
+        return None
+    media_type, *params = [part.strip() for part in content_type.split(";")]
+    if media_type.lower() != "audio/l16":
+        return None
+    for param in params:
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "rate" and value.strip().isdigit():
+            return int(value.strip())
+    return 16000
+
+def wav_header(sample_rate: int, data_size: Optional[int] = None, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """
+    生成PCM WAV文件头
+    data_size 为 None 时生成流式文件头：总长度未知，RIFF和data块长度填 0xFFFFFFFF，播放器读到数据结束为止
+    """
+    block_align = channels * bits_per_sample // 8
+    riff_size = 0xFFFFFFFF if data_size is None else 36 + data_size
+    return b"".join([
+        b"RIFF", struct.pack("<I", riff_size), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits_per_sample),
+        b"data", struct.pack("<I", 0xFFFFFFFF if data_size is None else data_size),
+    ])
+
 def example_audio_util(data: bytes) -> str:
     """An example utility function."""
     print(f"Processing audio data of length: {len(data)}")
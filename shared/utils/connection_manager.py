@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import orjson
+from fastapi import WebSocket
+
+from shared.utils.event_bus import BaseEventBus, Event, EventSubscription
+
+logger = logging.getLogger(__name__)
+
+# 每个连接待发送消息的上限，以及超出上限时的处理方式：
+# drop_oldest 丢弃最早的状态消息（音频帧不丢弃）；close 关闭连接（客户端重连后继续接收之后的消息）
+DEFAULT_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+DEFAULT_OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+OVERFLOW_POLICIES = ("drop_oldest", "close")
+# 队列溢出时关闭连接使用的关闭码（1013: Try Again Later）
+OVERFLOW_CLOSE_CODE = 1013
+# 可被同一服务的后续状态取代的进度消息
+PROGRESS_STATUSES = {"service_start"}
+
+
+def is_audio(event: Event) -> bool:
+    return isinstance(event, (bytes, bytearray))
+
+
+def progress_key(event: Event) -> Optional[str]:
+    """状态消息所属的服务；同一服务的新状态到达时，尚未发送的进度消息不再需要发送"""
+    if isinstance(event, dict) and event.get("service") and str(event.get("status", "")).startswith("service_"):
+        return event["service"]
+    return None
+
+
+class OutboundQueue:
+    """
+    单个连接的有界发送队列
+
+    新状态到达时，同一服务尚未发送的 service_start 被合并掉（只发送较新的状态）；
+    队列已满时按 overflow_policy 丢弃最早的状态消息，或由 put 返回 False 通知调用方关闭连接。
+    音频帧丢失会使客户端在一句话中间听到断续且没有任何提示，因此从不丢弃：
+    队列中没有可丢弃的状态消息时，新的音频帧使 put 返回 False，新的状态消息则直接丢弃。
+    """
+
+    def __init__(self, max_size: int = DEFAULT_SEND_QUEUE_SIZE, overflow_policy: str = DEFAULT_OVERFLOW_POLICY):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {overflow_policy}，可选: {', '.join(OVERFLOW_POLICIES)}")
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        self.coalesced = 0
+        self.audio_overflows = 0
+        # 每项为 [消息, 合并键]，被合并的消息置为 None，出队时跳过
+        self._items: Deque[List[Any]] = deque()
+        self._size = 0
+        self._progress: Dict[str, List[Any]] = {}
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def put(self, event: Event) -> bool:
+        key = progress_key(event)
+        if key is not None:
+            superseded = self._progress.pop(key, None)
+            if superseded is not None:
+                superseded[0] = None
+                self._size -= 1
+                self.coalesced += 1
+        if self._size >= self.max_size:
+            if self.overflow_policy == "close":
+                return False
+            if not self._drop_oldest_status():
+                if is_audio(event):
+                    self.audio_overflows += 1
+                    return False
+                self.dropped += 1
+                return True
+
+        entry = [event, key]
+        self._items.append(entry)
+        self._size += 1
+        if key is not None and event.get("status") in PROGRESS_STATUSES:
+            self._progress[key] = entry
+        self._ready.set()
+        return True
+
+    async def get(self) -> Event:
+        while True:
+            while self._items:
+                entry = self._items.popleft()
+                event, key = entry
+                if event is None:
+                    continue
+                self._size -= 1
+                if key is not None and self._progress.get(key) is entry:
+                    del self._progress[key]
+                return event
+            self._ready.clear()
+            await self._ready.wait()
+
+    def _drop_oldest_status(self) -> bool:
+        """丢弃最早的一条状态消息（置为 None，出队时跳过），没有状态消息时返回 False"""
+        while self._items and self._items[0][0] is None:
+            self._items.popleft()
+        for entry in self._items:
+            if entry[0] is None or is_audio(entry[0]):
+                continue
+            if entry[1] is not None and self._progress.get(entry[1]) is entry:
+                del self._progress[entry[1]]
+            entry[0] = None
+            self._size -= 1
+            self.dropped += 1
+            return True
+        return False
+
+
+class ClientConnection:
+    """一个WebSocket连接：事件进入发送队列，由独立的写任务按顺序发送，发送快慢不影响发布方"""
+
+    def __init__(self, websocket: WebSocket, client_id: str, queue: OutboundQueue):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.queue = queue
+        self.sent = 0
+        self.closed = False
+        self.subscription: Optional[EventSubscription] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write())
+
+    def deliver(self, event: Event):
+        """事件总线的回调，只入队，不等待发送"""
+        if self.closed:
+            return
+        if not self.queue.put(event):
+            reason = "音频发送积压" if is_audio(event) else "发送队列已满"
+            logger.warning(f"客户端 {self.client_id} 的发送队列已满（{self.queue.max_size}），关闭连接: {reason}")
+            self._close(OVERFLOW_CLOSE_CODE, reason)
+
+    async def _write(self):
+        try:
+            while True:
+                event = await self.queue.get()
+                if is_audio(event):
+                    await self.websocket.send_bytes(bytes(event))
+                else:
+                    await self.websocket.send_text(orjson.dumps(event).decode("utf-8"))
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # 连接已断开：不再接收新消息，等待接收循环调用 disconnect 清理
+            self.closed = True
+            logger.info(f"客户端 {self.client_id} 的连接不可写，停止推送: {str(e)}")
+
+    def _close(self, code: int, reason: str = ""):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+        asyncio.create_task(self._close_websocket(code, reason))
+
+    async def _close_websocket(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def aclose(self):
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except BaseException:
+                pass
+        if self.subscription is not None:
+            await self.subscription.close()
+
+
+class ConnectionManager:
+    """
+    WebSocket连接管理
+
+    send_status / send_audio 把消息发布到事件总线后立即返回；每个连接订阅其 client_id 的事件，
+    放入自己的有界发送队列，由写任务发送。客户端网络慢或连接已断开只影响该连接自己的队列，
+    工作流不会因推送而等待或报错。同一 client_id 可以有多个连接，各自接收全部消息。
+    """
+
+    def __init__(
+        self,
+        bus: BaseEventBus,
+        max_queue: int = DEFAULT_SEND_QUEUE_SIZE,
+        overflow_policy: str = DEFAULT_OVERFLOW_POLICY,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {overflow_policy}，可选: {', '.join(OVERFLOW_POLICIES)}")
+        self.bus = bus
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        # 已关闭连接的累计计数
+        self._totals = {"sent": 0, "dropped": 0, "coalesced": 0, "audio_overflows": 0}
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, client_id, OutboundQueue(self.max_queue, self.overflow_policy))
+        connection.subscription = await self.bus.subscribe(client_id, connection.deliver)
+        connection.start()
+        self.active_connections.setdefault(client_id, set()).add(connection)
+        logger.info(f"WebSocket client connected: {client_id}")
+        return connection
+
+    async def disconnect(self, connection: ClientConnection):
+        connections = self.active_connections.get(connection.client_id)
+        if not connections or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.active_connections[connection.client_id]
+        await connection.aclose()
+        self._totals["sent"] += connection.sent
+        self._totals["dropped"] += connection.queue.dropped
+        self._totals["coalesced"] += connection.queue.coalesced
+        self._totals["audio_overflows"] += connection.queue.audio_overflows
+        logger.info(f"WebSocket client disconnected: {connection.client_id}")
+
+    async def send_status(self, client_id: str, status: dict):
+        await self.bus.publish(client_id, status)
+        logger.debug(f"Published status for client {client_id}: {status}")
+
+    async def send_audio(self, client_id: str, data: bytes):
+        """音频数据以二进制消息推送"""
+        await self.bus.publish(client_id, data)
+
+    def stats(self) -> Dict[str, Any]:
+        connections = [c for group in self.active_connections.values() for c in group]
+        return {
+            "connections": len(connections),
+            "queued": sum(len(c.queue) for c in connections),
+            "max_queue": self.max_queue,
+            "overflow_policy": self.overflow_policy,
+            "sent": self._totals["sent"] + sum(c.sent for c in connections),
+            "dropped": self._totals["dropped"] + sum(c.queue.dropped for c in connections),
+            "coalesced": self._totals["coalesced"] + sum(c.queue.coalesced for c in connections),
+            "audio_overflows": self._totals["audio_overflows"] + sum(c.queue.audio_overflows for c in connections),
+        }
@@ -0,0 +1,100 @@
+import logging
+import time
+from typing import Mapping, Optional
+
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# 请求截止时间（Unix时间戳，秒），由网关设置，沿调用链原样传递给下游服务
+DEADLINE_HEADER = "X-Request-Deadline"
+
+
+class DeadlineExceeded(Exception):
+    """请求的截止时间已到，剩余时间不足以再调用下游服务"""
+
+
+class Deadline:
+    """
+    一个请求的截止时间
+
+    使用绝对时间而不是剩余时长，经过任务队列排队或跨进程传递后仍然有效；
+    at 为 None 表示没有截止时间。
+    """
+
+    __slots__ = ("at",)
+
+    def __init__(self, at: Optional[float] = None):
+        self.at = at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.time() + seconds)
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str], default_timeout: Optional[float] = None,
+                     max_timeout: Optional[float] = None) -> "Deadline":
+        """
+        读取请求头中的截止时间；没有或无法解析时，以 default_timeout 秒后为截止时间（为 None 时不设截止时间）。
+        max_timeout 限制调用方可以要求的最长时间。
+        """
+        at = parse_deadline(headers.get(DEADLINE_HEADER))
+        if at is None and default_timeout is not None:
+            at = time.time() + default_timeout
+        if max_timeout is not None:
+            at = min(at, time.time() + max_timeout) if at is not None else time.time() + max_timeout
+        return cls(at)
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，没有截止时间时为 None"""
+        if self.at is None:
+            return None
+        return max(0.0, self.at - time.time())
+
+    @property
+    def expired(self) -> bool:
+        return self.at is not None and time.time() >= self.at
+
+    def timeout(self, default: float) -> float:
+        """单次调用的超时时间：不超过 default，也不超过剩余时间"""
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def headers(self) -> dict:
+        """传递给下游服务的请求头"""
+        return {} if self.at is None else {DEADLINE_HEADER: f"{self.at:.3f}"}
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining()})"
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class DeadlineMiddleware:
+    """
+    下游服务的ASGI中间件：请求头中的截止时间已过时直接返回504，不再处理调用方已经放弃等待的请求
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            header = DEADLINE_HEADER.lower().encode("latin-1")
+            for name, value in scope.get("headers", ()):
+                if name == header:
+                    at = parse_deadline(value.decode("latin-1"))
+                    if at is not None and time.time() >= at:
+                        logger.warning(f"请求 {scope.get('path')} 已超过截止时间，不再处理")
+                        response = JSONResponse({"detail": "请求已超过截止时间"}, status_code=504)
+                        await response(scope, receive, send)
+                        return
+                    break
+        await self.app(scope, receive, send)
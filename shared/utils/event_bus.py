@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, Optional, Set, Union
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# 事件为状态消息（dict，以JSON传输）或音频数据（bytes）
+Event = Union[Dict[str, Any], bytes]
+
+# 跨进程传输时事件的类型标记
+JSON_EVENT = b"J"
+BINARY_EVENT = b"B"
+
+
+def encode_event(event: Event) -> bytes:
+    if isinstance(event, (bytes, bytearray)):
+        return BINARY_EVENT + bytes(event)
+    return JSON_EVENT + orjson.dumps(event)
+
+
+def decode_event(data: bytes) -> Event:
+    if data[:1] == BINARY_EVENT:
+        return data[1:]
+    return orjson.loads(data[1:])
+
+
+class EventSubscription:
+    """一个客户端连接对事件的订阅，事件到达时在事件循环中同步调用 callback，callback 不能阻塞"""
+
+    def __init__(self, bus: "BaseEventBus", client_id: str, callback: Callable[[Event], None]):
+        self.bus = bus
+        self.client_id = client_id
+        self.callback = callback
+
+    async def close(self):
+        await self.bus.unsubscribe(self)
+
+
+class BaseEventBus:
+    """
+    按 client_id 发布和订阅工作流状态事件
+
+    任意进程发布的事件投递给所有进程中订阅了该 client_id 的连接，
+    因此客户端连接在哪个网关副本上都能收到编排服务的状态推送。
+    """
+
+    backend = "base"
+
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self._subscribers: Dict[str, Set[EventSubscription]] = {}
+
+    async def publish(self, client_id: str, event: Event):
+        raise NotImplementedError
+
+    async def subscribe(self, client_id: str, callback: Callable[[Event], None]) -> EventSubscription:
+        subscription = EventSubscription(self, client_id, callback)
+        subscribers = self._subscribers.setdefault(client_id, set())
+        subscribers.add(subscription)
+        if len(subscribers) == 1:
+            await self._on_first_subscriber(client_id)
+        return subscription
+
+    async def unsubscribe(self, subscription: EventSubscription):
+        subscribers = self._subscribers.get(subscription.client_id)
+        if not subscribers or subscription not in subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.client_id]
+            await self._on_last_unsubscribe(subscription.client_id)
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "clients": len(self._subscribers),
+            "subscriptions": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+        }
+
+    def _dispatch(self, client_id: str, event: Event):
+        """把事件投递给本进程中该客户端的所有订阅"""
+        for subscription in list(self._subscribers.get(client_id, ())):
+            try:
+                subscription.callback(event)
+            except Exception as e:
+                logger.error(f"投递客户端 {client_id} 的事件失败: {str(e)}", exc_info=True)
+            self.delivered += 1
+
+    async def _on_first_subscriber(self, client_id: str):
+        pass
+
+    async def _on_last_unsubscribe(self, client_id: str):
+        pass
+
+
+class InMemoryEventBus(BaseEventBus):
+    """进程内的事件总线，只能投递给同一进程中的订阅"""
+
+    backend = "memory"
+
+    async def publish(self, client_id: str, event: Event):
+        self.published += 1
+        self._dispatch(client_id, event)
+
+
+class RedisEventBus(BaseEventBus):
+    """
+    基于 Redis pub/sub 的事件总线，每个 client_id 一个频道 {prefix}:{client_id}
+
+    每个进程只使用一个订阅连接：本进程出现该客户端的第一个订阅时订阅其频道，最后一个订阅关闭时退订，
+    后台任务读取消息后在本地分发给各订阅。Redis 不可用时发布失败只记录日志，不影响工作流。
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        prefix: str = "events",
+        client: Any = None,
+    ):
+        super().__init__()
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self.publish_errors = 0
+        self._redis = client if client is not None else redis.Redis(
+            host=host, port=port, db=db, password=password, decode_responses=False
+        )
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._reader: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    def _channel(self, client_id: str) -> str:
+        return f"{self.prefix}:{client_id}"
+
+    async def publish(self, client_id: str, event: Event):
+        self.published += 1
+        try:
+            await self._redis.publish(self._channel(client_id), encode_event(event))
+        except Exception as e:
+            self.publish_errors += 1
+            logger.error(f"发布客户端 {client_id} 的事件失败: {str(e)}")
+
+    async def _on_first_subscriber(self, client_id: str):
+        await self._pubsub.subscribe(self._channel(client_id))
+        self._subscribed.set()
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    async def _on_last_unsubscribe(self, client_id: str):
+        try:
+            await self._pubsub.unsubscribe(self._channel(client_id))
+        except Exception as e:
+            logger.warning(f"退订客户端 {client_id} 的事件频道失败: {str(e)}")
+        if not self._subscribers:
+            self._subscribed.clear()
+
+    async def _read(self):
+        prefix = f"{self.prefix}:".encode("utf-8")
+        while True:
+            await self._subscribed.wait()
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 连接断开后下一次读取时自动重连并重新订阅
+                logger.error(f"读取事件频道失败: {str(e)}")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, str):
+                channel = channel.encode("utf-8")
+            client_id = channel[len(prefix):].decode("utf-8")
+            try:
+                event = decode_event(message["data"])
+            except Exception as e:
+                logger.warning(f"无法解析客户端 {client_id} 的事件: {str(e)}")
+                continue
+            self._dispatch(client_id, event)
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        try:
+            await self._pubsub.aclose()
+            await self._redis.aclose()
+        except Exception as e:
+            logger.warning(f"关闭事件总线连接失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "publish_errors": self.publish_errors}
+
+
+def create_event_bus(name: str, **kwargs) -> BaseEventBus:
+    """
+    按名称创建事件总线；Redis 实现在构造时才导入 redis，使用进程内总线时不需要安装
+    """
+    if name == "memory":
+        return InMemoryEventBus()
+    if name == "redis":
+        return RedisEventBus(**kwargs)
+    raise ValueError(f"未知的事件总线: {name}，可选: memory, redis")
+
+
+def create_event_bus_from_env() -> BaseEventBus:
+    """按环境变量 EVENT_BUS_BACKEND 及 Redis 连接参数创建事件总线"""
+    return create_event_bus(
+        os.getenv("EVENT_BUS_BACKEND", "memory"),
+        host=os.getenv("REDIS_HOST", "redis"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+        prefix=os.getenv("EVENT_BUS_REDIS_PREFIX", "events"),
+    )
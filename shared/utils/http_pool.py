@@ -0,0 +1,122 @@
+import logging
+import os
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 连接池默认参数，可通过环境变量覆盖
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+DEFAULT_HTTP2 = os.getenv("HTTP_POOL_HTTP2", "False").lower() == "true"
+
+
+def parse_service_limits(value: Optional[str]) -> Dict[str, int]:
+    """
+    解析按服务配置的最大连接数，例如 "llm=200,tts=50"
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() and limit.strip().isdigit():
+            limits[name.strip()] = int(limit.strip())
+    return limits
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ServiceClientPool:
+    """
+    进程级的下游服务HTTP客户端池
+
+    每个下游服务一个 httpx.AsyncClient，各自限制最大连接数并保持长连接，
+    同一进程内的所有请求复用这些连接，避免每次请求重新建立TCP连接。
+    HTTP/2 只在 TLS 连接上通过 ALPN 协商启用，明文的内部服务仍使用 HTTP/1.1 长连接。
+    """
+
+    def __init__(
+        self,
+        services: Dict[str, str],
+        timeout: float = 60.0,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+        keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+        http2: bool = DEFAULT_HTTP2,
+        service_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.services = dict(services)
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.service_limits = service_limits if service_limits is not None else parse_service_limits(
+            os.getenv("HTTP_POOL_SERVICE_LIMITS")
+        )
+        if http2 and not _http2_available():
+            logger.warning("未安装 h2，HTTP/2 未启用，请安装 httpx[http2]")
+            http2 = False
+        self.http2 = http2
+        self.request_counts: Dict[str, int] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def client(self, service: str) -> httpx.AsyncClient:
+        """获取指定服务的客户端，首次使用时创建"""
+        if service not in self._clients:
+            if service not in self.services:
+                raise KeyError(f"未配置的服务: {service}")
+            max_connections = self.service_limits.get(service, self.max_connections)
+            self.request_counts[service] = 0
+            self._clients[service] = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=min(self.max_keepalive, max_connections),
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                event_hooks={"request": [self._count_request(service)]},
+            )
+        return self._clients[service]
+
+    def client_for_url(self, url: str) -> httpx.AsyncClient:
+        """根据请求地址选择对应服务的客户端"""
+        for service, base_url in self.services.items():
+            if url.startswith(base_url):
+                return self.client(service)
+        raise KeyError(f"地址不属于任何已配置的服务: {url}")
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def stats(self) -> Dict[str, Dict]:
+        """各服务连接池的使用情况"""
+        result = {}
+        for service, client in self._clients.items():
+            # httpcore 连接池在 transport 内部，字段不属于 httpx 的公开接口，取不到时只返回请求计数
+            pool = getattr(client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            idle = sum(1 for connection in connections if connection.is_idle())
+            result[service] = {
+                "max_connections": self.service_limits.get(service, self.max_connections),
+                "connections": len(connections),
+                "active": len(connections) - idle,
+                "idle": idle,
+                "http2": sum(1 for connection in connections if "HTTP/2" in connection.info()),
+                "requests_total": self.request_counts[service],
+            }
+        return result
+
+    def _count_request(self, service: str):
+        async def hook(request: httpx.Request):
+            self.request_counts[service] += 1
+        return hook
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Any, Dict, Optional, Union
+from urllib.parse import urlsplit
+
+import httpx
+
+from shared.utils.deadline import Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# 重试参数，可通过环境变量覆盖
+DEFAULT_ATTEMPTS = int(os.getenv("SERVICE_RETRY_ATTEMPTS", "3"))
+DEFAULT_BASE_DELAY = float(os.getenv("SERVICE_RETRY_BASE_DELAY", "0.1"))
+DEFAULT_MAX_DELAY = float(os.getenv("SERVICE_RETRY_MAX_DELAY", "2"))
+# 每个请求为重试预算积攒的额度，即重试次数最多约占请求数的比例
+DEFAULT_RETRY_BUDGET_RATIO = float(os.getenv("SERVICE_RETRY_BUDGET_RATIO", "0.2"))
+# 剩余时间不足该秒数时不再发起新的尝试
+MIN_ATTEMPT_TIME = 0.05
+# 按剩余尝试次数分配剩余时间时，单次尝试至少分到的秒数（不超过剩余时间）
+ATTEMPT_TIMEOUT_FLOOR = float(os.getenv("SERVICE_ATTEMPT_TIMEOUT_FLOOR", "1"))
+# 可能是暂时性故障的状态码，只对幂等请求重试
+TRANSIENT_STATUS_CODES = {502, 503, 504}
+# 下游明确表示未处理该请求的状态码，非幂等请求也可以重试
+REJECTED_STATUS_CODES = {429}
+
+
+def parse_service_timeouts(value: Optional[str]) -> Dict[str, float]:
+    """
+    解析按服务配置的单次尝试超时（秒），例如 "llm=120,tts=60"
+    """
+    timeouts = {}
+    for item in (value or "").split(","):
+        name, _, timeout = item.partition("=")
+        try:
+            timeouts[name.strip()] = float(timeout)
+        except ValueError:
+            continue
+    return timeouts
+
+
+# 按服务设置的单次尝试超时，覆盖按剩余时间分配的超时
+SERVICE_ATTEMPT_TIMEOUTS = parse_service_timeouts(os.getenv("SERVICE_ATTEMPT_TIMEOUTS"))
+
+
+def attempt_timeout_for(service: str) -> Optional[float]:
+    """服务的单次尝试超时，未配置时为 None"""
+    return SERVICE_ATTEMPT_TIMEOUTS.get(service)
+
+
+class RetryBudget:
+    """
+    按下游服务限制重试的总量
+
+    每个请求积攒 ratio 次重试的额度，最多积攒 max_tokens 次，每次重试消耗一次。
+    下游持续故障时重试次数不超过请求数的 ratio 倍，避免重试放大故障期间的负载。
+    """
+
+    def __init__(self, ratio: float = DEFAULT_RETRY_BUDGET_RATIO, max_tokens: float = 10):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.retries = 0
+        self.exhausted = 0
+        self._tokens: Dict[str, float] = {}
+
+    def record_request(self, key: str):
+        self._tokens[key] = min(self.max_tokens, self._tokens.get(key, self.max_tokens) + self.ratio)
+
+    def try_retry(self, key: str) -> bool:
+        tokens = self._tokens.get(key, self.max_tokens)
+        if tokens < 1:
+            self.exhausted += 1
+            return False
+        self._tokens[key] = tokens - 1
+        self.retries += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ratio": self.ratio,
+            "retries": self.retries,
+            "exhausted": self.exhausted,
+            "tokens": {key: round(tokens, 2) for key, tokens in self._tokens.items()},
+        }
+
+
+def is_retryable(error: Exception, idempotent: bool) -> bool:
+    """
+    连接未建立的错误总是可以重试（请求没有发出）；下游返回429时也可以重试；
+    超时、连接中断和502/503/504时请求可能已被处理，只对幂等请求重试。其他错误不重试。
+    """
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code in REJECTED_STATUS_CODES or (idempotent and status_code in TRANSIENT_STATUS_CODES)
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return idempotent
+    return False
+
+
+def retry_delay(attempt: int, base_delay: float, max_delay: float, retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次重试前的等待时间：指数退避加全抖动，下游给出 Retry-After 时至少等待该时间，
+    但不超过 max_delay
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, max_delay))
+    return delay
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    try:
+        return float(error.response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _attempt_timeout(deadline: Deadline, attempts_left: int, override: Optional[float] = None) -> Union[float, Any]:
+    """
+    单次尝试的超时：剩余时间平分给剩余的尝试次数，至少 ATTEMPT_TIMEOUT_FLOOR 秒，
+    一次卡住的调用不会用完全部剩余时间；指定了 override 时改为不超过 override。
+    没有截止时间时使用客户端的默认超时。
+    """
+    if override is not None:
+        return deadline.timeout(override)
+    remaining = deadline.remaining()
+    if remaining is None:
+        return httpx.USE_CLIENT_DEFAULT
+    return min(remaining, max(remaining / max(1, attempts_left), ATTEMPT_TIMEOUT_FLOOR))
+
+
+async def call_service_with_retry(
+    client: httpx.AsyncClient,
+    url: str,
+    deadline: Optional[Deadline] = None,
+    method: str = "POST",
+    idempotent: bool = True,
+    attempts: int = DEFAULT_ATTEMPTS,
+    attempt_timeout: Optional[float] = None,
+    retry_budget: Optional[RetryBudget] = None,
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs,
+) -> httpx.Response:
+    """
+    带重试的服务调用，截止时间通过请求头传递给下游服务
+
+    每次尝试的超时和重试前的等待都不超过剩余时间，剩余时间不足时不再重试；
+    每次尝试的超时为剩余时间按剩余尝试次数平分的份额；attempt_timeout 为按服务设置的超时，指定时覆盖该份额。
+    下游要求的 Retry-After 超过最长退避时间时不再重试，由调用方决定何时重试；
+    非幂等请求（idempotent=False）只在请求确定未被处理时重试。
+    超过截止时间时抛出 DeadlineExceeded，最后一次尝试的错误原样抛出。
+    """
+    deadline = deadline or Deadline()
+    key = urlsplit(url).netloc
+    if retry_budget is not None:
+        retry_budget.record_request(key)
+
+    attempt = 0
+    while True:
+        remaining = deadline.remaining()
+        if remaining is not None and remaining < MIN_ATTEMPT_TIME:
+            raise DeadlineExceeded(f"调用 {url} 前已超过请求截止时间")
+        try:
+            logger.info(f"正在调用服务: {url}")
+            response = await client.request(
+                method, url,
+                headers={**(headers or {}), **deadline.headers()},
+                # 超时不会重试的非幂等请求可以使用全部剩余时间
+                timeout=_attempt_timeout(deadline, attempts - attempt if idempotent else 1, attempt_timeout),
+                **kwargs
+            )
+            response.raise_for_status()
+            return response
+        except httpx.HTTPStatusError as e:
+            logger.error(f"服务调用失败: {url}, 状态码: {e.response.status_code}, 错误: {e.response.text}")
+            error = e
+        except httpx.RequestError as e:
+            logger.error(f"请求错误: {url}, 错误: {type(e).__name__} {str(e)}")
+            error = e
+
+        attempt += 1
+        if attempt >= attempts or not is_retryable(error, idempotent):
+            raise error
+        retry_after = _retry_after(error)
+        if retry_after is not None and retry_after > DEFAULT_MAX_DELAY:
+            logger.warning(f"{url} 要求 {retry_after:.0f} 秒后重试，超过最长退避时间，不再重试")
+            raise error
+        delay = retry_delay(attempt, DEFAULT_BASE_DELAY, DEFAULT_MAX_DELAY, retry_after)
+        remaining = deadline.remaining()
+        if remaining is not None and delay + MIN_ATTEMPT_TIME > remaining:
+            logger.warning(f"剩余时间 {remaining:.2f} 秒不足以重试 {url}")
+            raise error
+        if retry_budget is not None and not retry_budget.try_retry(key):
+            logger.warning(f"{key} 的重试预算已用完，不再重试")
+            raise error
+        logger.warning(f"{delay:.2f} 秒后第 {attempt} 次重试: {url}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 各服务以仓库根目录为包的根（如 services.intent_service、shared.utils），测试同样从根目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from shared.utils import admission as admission_module
+from shared.utils.admission import AdmissionController, AdmissionRejected, ConcurrencyLimiter, RateLimited, RateLimiter
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    async def scenario():
+        limiter = ConcurrencyLimiter("llm", max_concurrency=1, max_queue=10, max_wait=5)
+        first = await limiter.acquire()
+        order = []
+
+        async def worker(name):
+            started = await limiter.acquire()
+            order.append(name)
+            limiter.release(started)
+
+        tasks = [asyncio.create_task(worker(i)) for i in range(3)]
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 3
+        limiter.release(first)
+        await asyncio.gather(*tasks)
+        return order, limiter.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == [0, 1, 2]
+    assert (stats["active"], stats["queued"], stats["admitted"]) == (0, 0, 4)
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = ConcurrencyLimiter("tts", max_concurrency=1, max_queue=1, max_wait=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected, match="排队请求过多"):
+            await limiter.acquire()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["rejected"], stats["queued"], stats["active"]) == (1, 0, 1)
+
+
+def test_rejects_up_front_when_estimated_wait_exceeds_budget():
+    async def scenario():
+        limiter = ConcurrencyLimiter("llm", max_concurrency=1, max_queue=10, max_wait=5)
+        limiter.avg_service_time = 2.0
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected, match="预计等待时间") as info:
+            await limiter.acquire(timeout=1.0)
+        return info.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.retry_after_header == "2"
+
+
+def test_queue_timeout_rejects_and_leaves_no_waiter():
+    async def scenario():
+        limiter = ConcurrencyLimiter("llm", max_concurrency=1, max_queue=10, max_wait=0.01)
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected, match="排队超时"):
+            await limiter.acquire()
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["queued"], stats["active"], stats["rejected"]) == (0, 1, 1)
+
+
+def test_cancelled_waiter_does_not_consume_slot():
+    async def scenario():
+        limiter = ConcurrencyLimiter("llm", max_concurrency=1, max_queue=10, max_wait=5)
+        started = await limiter.acquire()
+        cancelled = asyncio.create_task(limiter.acquire())
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        limiter.release(started)
+        limiter.release(await waiting)
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["active"], stats["queued"]) == (0, 0)
+
+
+def test_rate_limiter_refills_tokens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission_module.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=2)
+    assert limiter.check("a") == 0 and limiter.check("a") == 0
+    assert limiter.check("a") == pytest.approx(0.5)
+    assert limiter.check("b") == 0
+    now[0] += 0.5
+    assert limiter.check("a") == 0
+    assert limiter.stats()["limited"] == 1
+
+
+def test_rate_limiter_disabled_and_bounded():
+    assert RateLimiter(rate=0, burst=1).check("a") == 0
+    limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+    for key in ("a", "b", "c"):
+        limiter.check(key)
+    assert limiter.stats()["clients"] == 2
+    assert limiter.check("a") == 0
+
+
+def test_controller_applies_service_limits_and_rate_limit():
+    async def scenario():
+        controller = AdmissionController(
+            service_limits={"llm": 1}, default_concurrency=4, max_queue=0, rate=1, burst=2
+        )
+        admission = await controller.admit("llm", "client")
+        with pytest.raises(AdmissionRejected):
+            await controller.admit("llm", "client")
+        with pytest.raises(RateLimited) as info:
+            await controller.admit("llm", "client")
+        admission.release()
+        admission.release()
+        return controller, info.value
+
+    controller, error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert controller.limiter("llm").stats()["active"] == 0
+    assert controller.limiter("tts").max_concurrency == 4
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from shared.utils.connection_manager import OVERFLOW_CLOSE_CODE, ClientConnection, OutboundQueue
+
+
+def drain(queue):
+    async def main():
+        return [await queue.get() for _ in range(len(queue))]
+    return asyncio.run(main())
+
+
+def status(service, state, **extra):
+    return {"status": f"service_{state}", "service": service, **extra}
+
+
+def test_service_start_is_coalesced_by_later_status():
+    queue = OutboundQueue(max_size=10)
+    queue.put(status("asr", "start"))
+    queue.put(status("llm", "start"))
+    queue.put(status("asr", "success"))
+    assert drain(queue) == [status("llm", "start"), status("asr", "success")]
+    assert queue.coalesced == 1
+
+
+def test_drop_oldest_drops_status_but_keeps_audio():
+    queue = OutboundQueue(max_size=3, overflow_policy="drop_oldest")
+    queue.put(b"a1")
+    queue.put({"status": "tts_segment", "index": 0})
+    queue.put(b"a2")
+    assert queue.put(b"a3")
+    assert drain(queue) == [b"a1", b"a2", b"a3"]
+    assert queue.dropped == 1
+
+
+def test_audio_overflow_without_status_to_drop_asks_to_close():
+    queue = OutboundQueue(max_size=2, overflow_policy="drop_oldest")
+    queue.put(b"a1")
+    queue.put(b"a2")
+    # 状态消息可以丢弃，音频帧不行
+    assert queue.put({"status": "progress"})
+    assert not queue.put(b"a3")
+    assert queue.audio_overflows == 1 and queue.dropped == 1
+    assert drain(queue) == [b"a1", b"a2"]
+
+
+def test_close_policy_rejects_any_overflow():
+    queue = OutboundQueue(max_size=1, overflow_policy="close")
+    assert queue.put({"status": "start"})
+    assert not queue.put({"status": "complete"})
+    with pytest.raises(ValueError):
+        OutboundQueue(overflow_policy="block")
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.closed = None
+        self.sent = []
+
+    async def send_bytes(self, data):
+        await asyncio.sleep(10)
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def close(self, code, reason=""):
+        self.closed = (code, reason)
+
+
+def test_connection_closes_with_reason_on_audio_backlog():
+    async def main():
+        websocket = FakeWebSocket()
+        connection = ClientConnection(websocket, "c", OutboundQueue(max_size=2))
+        connection.start()
+        for frame in (b"1", b"2", b"3", b"4"):
+            connection.deliver(frame)
+        await asyncio.sleep(0.01)
+        return connection, websocket
+
+    connection, websocket = asyncio.run(main())
+    assert connection.closed
+    assert websocket.closed == (OVERFLOW_CLOSE_CODE, "音频发送积压")
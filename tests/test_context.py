@@ -0,0 +1,142 @@
+import asyncio
+import random
+
+from orchestrator.context import ContextBuilder, estimate_tokens, message_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("hello world") == 3
+    assert estimate_tokens("") == 0
+    assert message_tokens("你好") == 6
+
+
+def history_items(texts):
+    return [{"type": "user_message" if i % 2 == 0 else "assistant_message", "text": t} for i, t in enumerate(texts)]
+
+
+class FakeMemory:
+    def __init__(self, history=(), relevant=(), fail=False):
+        self.history = list(history)
+        self.relevant = list(relevant)
+        self.fail = fail
+        self.fetches = 0
+
+    async def fetch_history(self, client_id, limit):
+        self.fetches += 1
+        if self.fail:
+            raise RuntimeError("记忆服务不可用")
+        return self.history[-limit:]
+
+    async def search_memory(self, client_id, query, limit):
+        if self.fail:
+            raise RuntimeError("记忆服务不可用")
+        return self.relevant[:limit]
+
+
+def make_builder(memory, **kwargs):
+    return ContextBuilder(memory.fetch_history, memory.search_memory, **kwargs)
+
+
+def test_keeps_most_recent_history_within_budget():
+    texts = [f"第{i}条消息内容" for i in range(20)]
+    memory = FakeMemory(history=history_items(texts))
+    builder = make_builder(memory, token_budget=60, relevant_limit=0, system_prompt="你是助手")
+    result = asyncio.run(builder.build("c1", "你好"))
+    messages = result["messages"]
+    assert messages[0] == {"role": "system", "content": "你是助手"}
+    assert messages[-1] == {"role": "user", "content": "你好"}
+    history = [m["content"] for m in messages[1:-1]]
+    assert history == texts[-len(history):]
+    assert result["history_messages"] == len(history) > 0
+    assert result["tokens"] == sum(message_tokens(m["content"]) for m in messages) <= 60
+
+
+def test_relevant_memory_is_capped_and_deduplicated():
+    memory = FakeMemory(
+        history=history_items(["今天天气不错"]),
+        relevant=[
+            {"text": "今天天气不错", "score": 0.9},
+            {"text": "不相关", "score": 0.1},
+            {"text": "我喜欢爬山", "score": 0.8},
+            {"text": "很长的记忆" * 20, "score": 0.7},
+        ],
+    )
+    builder = make_builder(memory, token_budget=200, relevant_ratio=0.25)
+    result = asyncio.run(builder.build("c1", "周末去哪玩"))
+    relevant = [m for m in result["messages"] if m["role"] == "system"]
+    assert result["relevant_messages"] == 1
+    assert relevant[0]["content"].endswith("- 我喜欢爬山")
+    assert result["messages"][-2] is relevant[0]
+
+
+def test_total_never_exceeds_budget():
+    rng = random.Random(0)
+    for _ in range(200):
+        texts = ["字" * rng.randint(1, 30) for _ in range(rng.randint(0, 30))]
+        relevant = [{"text": "忆" * rng.randint(1, 30), "score": 1.0} for _ in range(5)]
+        budget = rng.randint(40, 300)
+        builder = make_builder(FakeMemory(history_items(texts), relevant), token_budget=budget, system_prompt="系统")
+        for _ in range(3):
+            text = "问" * rng.randint(1, budget // 2 - 10)
+            result = asyncio.run(builder.build("c1", text))
+            assert result["tokens"] == sum(message_tokens(m["content"]) for m in result["messages"])
+            assert result["tokens"] <= budget
+            builder.record("c1", "assistant", "答" * rng.randint(1, 50))
+
+
+def test_history_is_cached_and_extended_between_turns():
+    memory = FakeMemory(history=history_items(["你好", "你好，有什么可以帮你"]))
+    builder = make_builder(memory, relevant_limit=0)
+
+    async def scenario():
+        await builder.build("c1", "讲个笑话")
+        builder.record("c1", "assistant", "从前有座山")
+        return await builder.build("c1", "再讲一个")
+
+    result = asyncio.run(scenario())
+    assert memory.fetches == 1
+    assert [m["content"] for m in result["messages"]] == ["你好", "你好，有什么可以帮你", "讲个笑话", "从前有座山", "再讲一个"]
+    assert builder.stats()["cache_hits"] == 1
+
+
+def test_trimming_drops_oldest_messages_to_low_water():
+    builder = make_builder(FakeMemory(), token_budget=100, relevant_ratio=0, relevant_limit=0)
+
+    async def scenario():
+        for i in range(30):
+            await builder.build("c1", f"第{i}轮")
+        return await builder.build("c1", "最后")
+
+    result = asyncio.run(scenario())
+    context = builder._contexts["c1"]
+    assert context.tokens <= builder.history_budget
+    assert [m["content"] for m, _ in context.messages][-1] == "最后"
+    assert result["messages"][-2]["content"] == "第29轮"
+
+
+def test_memory_failure_falls_back_and_refetches():
+    memory = FakeMemory(history=history_items(["你好"]), fail=True)
+    builder = make_builder(memory)
+
+    async def scenario():
+        first = await builder.build("c1", "在吗")
+        memory.fail = False
+        second = await builder.build("c1", "在吗")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [m["content"] for m in first["messages"]] == ["在吗"]
+    assert memory.fetches == 2
+    assert [m["content"] for m in second["messages"]] == ["你好", "在吗"]
+
+
+def test_evicts_least_recently_used_clients():
+    builder = make_builder(FakeMemory(), max_clients=2, relevant_limit=0)
+
+    async def scenario():
+        for client in ("a", "b", "a", "c"):
+            await builder.build(client, "你好")
+
+    asyncio.run(scenario())
+    assert list(builder._contexts) == ["a", "c"]
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import pytest
+
+from orchestrator.fast_path import FastPath, answer_time
+from services.intent_service.engine import RuleSet
+
+NOW = datetime(2024, 5, 17, 9, 30)
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return RuleSet.from_file("services/intent_service/intents.json")
+
+
+def detect(rules, text):
+    analysis = rules.analyze(text)
+    top = analysis["intents"][0] if analysis["intents"] else {"intent": "闲聊", "confidence": 0.6}
+    return {"intent": top["intent"], "confidence": top["confidence"], **analysis}
+
+
+@pytest.mark.parametrize("text", ["现在几点", "今天星期几", "今天几号？"])
+def test_answers_current_time(rules, text):
+    assert answer_time(text, detect(rules, text), NOW) == "现在是2024年5月17日，星期五，9点30分。"
+
+
+@pytest.mark.parametrize("text", ["明天几号", "下周五是几号", "3.14是几点", "下午3点是几点"])
+def test_other_dates_go_to_llm(rules, text):
+    assert answer_time(text, detect(rules, text), NOW) is None
+
+
+def test_bare_time_word_is_not_a_time_question(rules):
+    intent = detect(rules, "你有时间吗")
+    assert intent["intent"] != "查询时间"
+    assert answer_time("你有时间吗", {"entities": []}, NOW) is None
+
+
+def test_fast_path_counts_hits_and_misses(rules):
+    fast_path = FastPath(min_confidence=0.9)
+    assert fast_path.reply("现在几点", detect(rules, "现在几点")).startswith("现在是")
+    assert fast_path.reply("明天几号", detect(rules, "明天几号")) is None
+    assert fast_path.reply("你好", detect(rules, "你好")) is None
+    assert fast_path.stats()["hits"] == {"查询时间": 1}
+    assert fast_path.stats()["misses"] == 2
@@ -0,0 +1,110 @@
+import json
+import os
+
+import pytest
+
+from services.intent_service import cache as cache_module
+from services.intent_service.cache import ResultCache
+from services.intent_service.engine import IntentEngine
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(max_entries=10, ttl=5)
+    cache.put("a", 1)
+    clock.now += 4
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_zero_capacity_disables_cache():
+    cache = ResultCache(max_entries=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_stats_count_hits_and_misses():
+    cache = ResultCache()
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def write_rules(path, keyword):
+    path.write_text(json.dumps({
+        "intents": [{"name": "查询天气", "confidence": 0.95, "keywords": [keyword]}],
+    }, ensure_ascii=False), encoding="utf-8")
+
+
+@pytest.fixture
+def rules_path(tmp_path):
+    path = tmp_path / "intents.json"
+    write_rules(path, "天气")
+    return path
+
+
+def test_detect_shares_cache_across_trailing_punctuation(rules_path):
+    engine = IntentEngine(str(rules_path))
+    first = engine.detect("今天天气怎么样？")
+    second = engine.detect("今天天气怎么样")
+    assert first["cached"] is False and second["cached"] is True
+    assert second["intent"] == "查询天气"
+    assert second["entities"] == first["entities"]
+    assert engine.detect("今天天气怎么样呢")["cached"] is False
+
+
+def test_cached_result_is_not_mutated_by_callers(rules_path):
+    engine = IntentEngine(str(rules_path))
+    engine.detect("天气")["intent"] = "其他"
+    assert engine.detect("天气")["intent"] == "查询天气"
+
+
+def test_reload_clears_cache(rules_path):
+    engine = IntentEngine(str(rules_path))
+    assert engine.detect("下雨吗")["intent"] == "闲聊"
+    write_rules(rules_path, "下雨")
+    stat = os.stat(rules_path)
+    os.utime(rules_path, (stat.st_atime, stat.st_mtime + 10))
+    assert engine.reload() is True
+    result = engine.detect("下雨吗")
+    assert result["cached"] is False and result["intent"] == "查询天气"
+    assert engine.stats()["version"] == 2
+
+
+def test_failed_reload_keeps_rules_and_cache(rules_path):
+    engine = IntentEngine(str(rules_path))
+    engine.detect("天气")
+    rules_path.write_text(json.dumps({"intents": [{"name": "x", "patterns": ["("]}]}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        engine.reload(force=True)
+    assert engine.stats()["reload_error"]
+    assert engine.detect("天气")["cached"] is True
+    assert engine.rules.version == 1
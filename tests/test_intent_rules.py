@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from services.intent_service.engine import RuleSet
+from services.intent_service.matcher import AhoCorasick
+
+
+def brute_force(patterns, text):
+    return sorted(
+        (start, start + len(pattern), value)
+        for pattern, value in patterns if pattern
+        for start in range(len(text) - len(pattern) + 1)
+        if text.startswith(pattern, start)
+    )
+
+
+def test_finds_overlapping_and_nested_keywords():
+    patterns = [("he", 1), ("she", 2), ("his", 3), ("hers", 4)]
+    matches = sorted(AhoCorasick(patterns).iter_matches("ushers"))
+    assert matches == [(1, 4, 2), (2, 4, 1), (2, 6, 4)]
+
+
+def test_matches_brute_force_on_random_text():
+    rng = random.Random(0)
+    alphabet = "ab天气"
+    patterns = [("".join(rng.choice(alphabet) for _ in range(rng.randint(0, 4))), i) for i in range(30)]
+    automaton = AhoCorasick(patterns)
+    for _ in range(50):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert sorted(automaton.iter_matches(text)) == brute_force(patterns, text)
+
+
+def test_duplicate_keywords_keep_all_values():
+    automaton = AhoCorasick([("天气", "intent"), ("天气", "entity"), ("", "empty")])
+    assert len(automaton) == 2
+    assert sorted(value for _, _, value in automaton.iter_matches("天气")) == ["entity", "intent"]
+
+
+CONFIG = {
+    "default_intent": {"name": "闲聊", "confidence": 0.6},
+    "entities": {
+        "location": {"keywords": ["北京", "北京市"]},
+        "time": {"keywords": ["明天"], "patterns": ["\\d{1,2}点"]},
+    },
+    "intents": [
+        {
+            "name": "查询天气", "confidence": 0.95, "keywords": ["天气", "Weather"],
+            "function": {"name": "get_weather", "arguments": {
+                "location": {"entity": "location", "default": "上海"},
+                "date": {"entity": "time", "default": "今天"},
+                "unit": "celsius",
+            }},
+        },
+        {"name": "查询时间", "confidence": 0.9, "keywords": ["几点"]},
+        {"name": "提醒", "confidence": 0.9, "patterns": ["\\d{1,2}点.*提醒"]},
+    ],
+}
+
+
+@pytest.fixture
+def rules():
+    return RuleSet(CONFIG)
+
+
+def test_analyze_orders_intents_by_confidence_then_rule_order(rules):
+    analysis = rules.analyze("明天北京天气怎么样，几点会下雨")
+    assert [i["intent"] for i in analysis["intents"]] == ["查询天气", "查询时间"]
+    assert analysis["intents"][0]["matches"] == ["天气"]
+
+
+def test_entities_prefer_earliest_longest_match(rules):
+    entities = rules.analyze("北京市明天8点")["entities"]
+    assert [(e["type"], e["value"]) for e in entities] == [("location", "北京市"), ("time", "明天"), ("time", "8点")]
+
+
+def test_keywords_are_normalized(rules):
+    analysis = rules.analyze("ＷＥＡＴＨＥＲ in Beijing")
+    assert analysis["intents"][0]["intent"] == "查询天气"
+
+
+def test_pattern_intents(rules):
+    assert rules.analyze("8点记得提醒我")["intents"][0]["intent"] == "提醒"
+
+
+def test_function_call_uses_entities_and_defaults(rules):
+    entities = rules.analyze("明天北京天气")["entities"]
+    assert rules.function_call("查询天气", entities) == {
+        "name": "get_weather", "arguments": {"location": "北京", "date": "明天", "unit": "celsius"},
+    }
+    assert rules.function_call("查询天气", [])["arguments"]["location"] == "上海"
+    assert rules.function_call("查询时间", entities) is None
+
+
+def test_invalid_pattern_is_rejected():
+    with pytest.raises(ValueError, match="正则无效"):
+        RuleSet({"intents": [{"name": "x", "patterns": ["("]}]})
+
+
+def test_shipped_rules_compile():
+    rules = RuleSet.from_file("services/intent_service/intents.json")
+    assert rules.analyze("北京明天天气")["intents"][0]["intent"] == "查询天气"
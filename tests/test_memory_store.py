@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from services.memory_service import store as store_module
+from services.memory_service.store import ConversationStore
+from services.memory_service.vector_index import VectorIndex
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(store_module.time, "time", lambda: now[0])
+    return now
+
+
+def texts(items):
+    return [item["text"] for item in items]
+
+
+def unit(values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_ring_buffer_keeps_latest_items_per_client():
+    store = ConversationStore(max_items_per_client=3)
+    first = store.add("a", {"text": "0"})
+    for i in range(1, 5):
+        store.add("a", {"text": str(i)})
+    store.add("b", {"text": "b0"})
+    page, total = store.recent("a", limit=10)
+    assert (texts(page), total) == (["2", "3", "4"], 3)
+    assert store.get(first["id"]) is None
+    assert store.stats()["evicted"] == 2
+
+
+def test_recent_pages_from_newest():
+    store = ConversationStore()
+    for i in range(10):
+        store.add("a", {"text": str(i)})
+    assert texts(store.recent("a", limit=3)[0]) == ["7", "8", "9"]
+    assert texts(store.recent("a", limit=3, offset=3)[0]) == ["4", "5", "6"]
+    assert store.recent("a", limit=3, offset=20) == ([], 10)
+    assert store.recent("missing") == ([], 0)
+
+
+def test_items_expire_by_age(clock):
+    store = ConversationStore(max_age_seconds=60)
+    old = store.add("a", {"text": "old"})
+    clock[0] += 30
+    store.add("a", {"text": "new"})
+    clock[0] += 40
+    assert store.get(old["id"]) is None
+    assert texts(store.recent("a")[0]) == ["new"]
+    clock[0] += 40
+    assert store.recent("a") == ([], 0)
+
+
+def test_least_recently_active_client_is_evicted():
+    store = ConversationStore(max_clients=2)
+    kept = store.add("a", {"text": "a"})
+    dropped = store.add("b", {"text": "b"})
+    store.add("a", {"text": "a2"})
+    store.add("c", {"text": "c"})
+    assert store.recent("b") == ([], 0)
+    assert store.get(dropped["id"]) is None
+    assert store.get(kept["id"]) is not None
+    stats = store.stats()
+    assert (stats["clients"], stats["items"], stats["evicted"]) == (2, 3, 1)
+
+
+def test_evicted_items_leave_the_vector_index():
+    store = ConversationStore(max_items_per_client=2, index_factory=lambda: VectorIndex(3))
+    first = store.add("a", {"text": "x"}, unit([1, 0, 0]))
+    store.add("a", {"text": "y"}, unit([0, 1, 0]))
+    store.add("a", {"text": "z"}, unit([0, 0, 1]))
+    results = store.search("a", unit([1, 0, 0]), k=5)
+    assert first["id"] not in [item["id"] for item, _ in results]
+    assert sorted(item["text"] for item, _ in results) == ["y", "z"]
+    assert store.stats()["indexed"] == 2
+
+
+def test_clear_removes_items_and_index():
+    store = ConversationStore(index_factory=lambda: VectorIndex(3))
+    item = store.add("a", {"text": "x"}, unit([1, 0, 0]))
+    assert store.clear("a") == 1
+    assert store.get(item["id"]) is None
+    assert store.search("a", unit([1, 0, 0])) == []
+    assert store.stats()["indexed"] == 0
@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+
+from orchestrator import main as orchestrator
+from shared.utils.deadline import Deadline, DeadlineExceeded
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """用 MockTransport 代替VAD和ASR服务，handler 可按测试替换"""
+    handlers = {}
+
+    async def no_status(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(orchestrator.manager, "send_status", no_status)
+    for name in ("vad", "asr"):
+        async def handle(request, name=name):
+            await request.aread()
+            return await handlers[name](request)
+        monkeypatch.setitem(orchestrator.http_pool._clients, name, httpx.AsyncClient(transport=httpx.MockTransport(handle)))
+        monkeypatch.setitem(orchestrator.http_pool.request_counts, name, 0)
+
+    async def ok(request):
+        return httpx.Response(200, json={"detected_speech": True, "text": str(len(request.content))})
+
+    handlers.update(vad=ok, asr=ok)
+    return handlers
+
+
+async def chunks(count, fail=False):
+    for _ in range(count):
+        yield b"\0" * 100
+    if fail:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("client disconnected")
+
+
+def relay(stream, timeout=5):
+    return orchestrator.relay_audio_stream("c", stream, "audio/wav", Deadline.after(timeout))
+
+
+def test_relays_audio_to_both_services(services):
+    async def main():
+        vad, asr, pump = await relay(chunks(3))
+        return vad, asr, await pump
+
+    vad, asr, total = asyncio.run(main())
+    assert vad["detected_speech"] and asr["text"] == "300"
+    assert total == 300
+
+
+def test_upstream_failure_cancels_stages(services):
+    with pytest.raises(RuntimeError, match="client disconnected"):
+        asyncio.run(asyncio.wait_for(relay(chunks(1, fail=True)), 2))
+
+
+def test_cancelled_stage_becomes_an_ordinary_error(services):
+    async def cancelled(request):
+        asyncio.current_task().cancel()
+        await asyncio.sleep(0)
+
+    services["asr"] = cancelled
+    with pytest.raises(RuntimeError, match="已被取消"):
+        asyncio.run(asyncio.wait_for(relay(chunks(3)), 2))
+
+
+def test_deadline_bounds_the_relay(services):
+    async def slow(request):
+        await asyncio.sleep(5)
+
+    services["asr"] = slow
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(relay(chunks(3), timeout=0.1))
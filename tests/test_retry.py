@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from shared.utils import retry
+from shared.utils.deadline import DEADLINE_HEADER, Deadline, DeadlineExceeded
+from shared.utils.retry import RetryBudget, call_service_with_retry, is_retryable, retry_delay
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retry, "DEFAULT_BASE_DELAY", 0)
+
+
+def run(handler, **kwargs):
+    calls = []
+
+    def record(request):
+        calls.append(request)
+        return handler(request, len(calls))
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(record), timeout=5) as client:
+            return await call_service_with_retry(client, "http://svc/op", **kwargs)
+
+    return asyncio.run(main()), calls
+
+
+def test_retries_transient_errors_until_success():
+    response, calls = run(lambda request, n: httpx.Response(503 if n < 3 else 200))
+    assert response.status_code == 200
+    assert len(calls) == 3
+
+
+def test_non_idempotent_requests_retry_only_rejections():
+    with pytest.raises(httpx.HTTPStatusError):
+        run(lambda request, n: httpx.Response(503), idempotent=False)
+    response, calls = run(lambda request, n: httpx.Response(429 if n == 1 else 200), idempotent=False)
+    assert response.status_code == 200 and len(calls) == 2
+
+
+def test_client_errors_are_not_retried():
+    with pytest.raises(httpx.HTTPStatusError):
+        run(lambda request, n: httpx.Response(400))
+    assert not is_retryable(httpx.ReadTimeout("t"), idempotent=False)
+    assert is_retryable(httpx.ConnectError("c"), idempotent=False)
+
+
+def test_long_retry_after_is_not_waited_for():
+    started = time.monotonic()
+    with pytest.raises(httpx.HTTPStatusError):
+        run(lambda request, n: httpx.Response(429, headers={"Retry-After": "3600"}))
+    assert time.monotonic() - started < 1
+    assert retry_delay(1, 0.1, 2, retry_after=3600) <= 2
+
+
+def test_deadline_is_propagated_and_split_across_attempts():
+    deadline = Deadline.after(30)
+    with pytest.raises(httpx.HTTPStatusError):
+        run(lambda request, n: httpx.Response(503), deadline=deadline)
+    _, calls = run(lambda request, n: httpx.Response(503 if n < 3 else 200), deadline=deadline)
+    assert calls[0].headers[DEADLINE_HEADER] == f"{deadline.at:.3f}"
+    timeouts = [request.extensions["timeout"]["read"] for request in calls]
+    assert timeouts[0] == pytest.approx(10, abs=0.1)
+    assert timeouts[1] == pytest.approx(15, abs=0.1)
+    assert timeouts[2] == pytest.approx(30, abs=0.1)
+
+
+def test_attempt_timeout_override_and_non_idempotent_budget():
+    _, calls = run(lambda request, n: httpx.Response(200), deadline=Deadline.after(30), attempt_timeout=2)
+    assert calls[0].extensions["timeout"]["read"] == 2
+    _, calls = run(lambda request, n: httpx.Response(200), deadline=Deadline.after(30), idempotent=False)
+    assert calls[0].extensions["timeout"]["read"] == pytest.approx(30, abs=0.1)
+    _, calls = run(lambda request, n: httpx.Response(200))
+    assert calls[0].extensions["timeout"]["read"] == 5
+
+
+def test_expired_deadline_is_not_called():
+    with pytest.raises(DeadlineExceeded):
+        run(lambda request, n: httpx.Response(200), deadline=Deadline(time.time() - 1))
+
+
+def test_retry_budget_limits_retries():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        run(lambda request, n: httpx.Response(503), retry_budget=budget)
+    assert budget.retries == 1 and budget.exhausted == 1
+    # 每个请求积攒 0.5 次额度，再过两个请求才能重试一次
+    with pytest.raises(httpx.HTTPStatusError):
+        run(lambda request, n: httpx.Response(503), retry_budget=budget)
+    assert budget.exhausted == 2
+    _, calls = run(lambda request, n: httpx.Response(503 if n == 1 else 200), retry_budget=budget)
+    assert len(calls) == 2
+    assert budget.retries == 2 and budget.stats()["tokens"]["svc"] == 0
+
+
+def test_parse_service_timeouts():
+    assert retry.parse_service_timeouts("llm=60, tts=7.5,bad=x,") == {"llm": 60.0, "tts": 7.5}
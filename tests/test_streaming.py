@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from orchestrator.streaming import ReplyStream, SentenceSegmenter, iter_chat_deltas
+
+
+def segment(chunks, **params):
+    segmenter = SentenceSegmenter(**params)
+    segments = [s for chunk in chunks for s in segmenter.feed(chunk)]
+    return segments + segmenter.flush()
+
+
+def test_splits_on_sentence_endings_across_tokens():
+    assert segment(["你好", "！今天", "天气不错。", "要出门吗"]) == ["你好！", "今天天气不错。", "要出门吗"]
+
+
+def test_clause_endings_need_a_minimum_length():
+    assert segment(["好，", "我们明天一起去公园散步，", "然后吃饭"]) == ["好，我们明天一起去公园散步，", "然后吃饭"]
+    assert segment(["好，我们"], min_clause_chars=2) == ["好，", "我们"]
+
+
+def test_decimal_point_is_not_a_sentence_end():
+    assert segment(["圆周率约为3", ".", "14. 对吗?"]) == ["圆周率约为3.14.", "对吗?"]
+    assert segment(["Wait... ", "ok"]) == ["Wait...", "ok"]
+
+
+def test_trailing_period_waits_for_next_token():
+    segmenter = SentenceSegmenter()
+    assert segmenter.feed("版本是2.") == []
+    assert segmenter.feed("0版") == []
+    assert segmenter.flush() == ["版本是2.0版"]
+
+
+def test_whitespace_only_segments_are_dropped():
+    assert segment(["。\n", "  "]) == ["。"]
+
+
+def test_iter_chat_deltas_reads_sse_until_done():
+    events = [{"choices": [{"delta": {"content": text}}]} for text in ("你", "好")]
+    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\ndata: {}\n\n"
+
+    async def main():
+        response = httpx.Response(200, content=body.encode())
+        return [delta async for delta in iter_chat_deltas(response)]
+
+    assert asyncio.run(main()) == ["你", "好"]
+
+
+def test_reply_stream_delivers_segments_then_text():
+    async def main():
+        reply = ReplyStream()
+
+        async def produce():
+            for part in ("一。", "二。"):
+                reply.put(part)
+                await asyncio.sleep(0)
+            return "一。二。"
+
+        reply.start(produce())
+        segments = [s async for s in reply.segments()]
+        return segments, await reply.text()
+
+    assert asyncio.run(main()) == (["一。", "二。"], "一。二。")
+
+
+def test_reply_stream_propagates_producer_failure():
+    async def main():
+        reply = ReplyStream()
+
+        async def produce():
+            reply.put("半句")
+            raise RuntimeError("llm failed")
+
+        reply.start(produce())
+        segments = [s async for s in reply.segments()]
+        assert segments == ["半句"]
+        await reply.text()
+
+    with pytest.raises(RuntimeError, match="llm failed"):
+        asyncio.run(main())
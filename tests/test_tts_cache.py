@@ -0,0 +1,101 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from services.tts_service import main as tts
+from services.tts_service.cache import DISK_SUFFIX, AudioCache, audio_cache_key
+
+
+def test_cache_key_depends_on_all_parameters():
+    key = audio_cache_key("你好", "default", "wav", 16000)
+    assert key == audio_cache_key("你好", "default", "wav", 16000)
+    assert key != audio_cache_key("你好", "default", "pcm", 16000)
+    assert key != audio_cache_key("你好", "default", "wav", 8000)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = AudioCache(max_bytes=10)
+    cache.put("a", b"aaaa", "audio/wav")
+    cache.put("b", b"bbbb", "audio/wav")
+    assert cache.get("a").data == b"aaaa"
+    cache.put("c", b"cccc", "audio/wav")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.bytes == 8
+    assert cache.stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restart_and_is_memory_mapped(tmp_path):
+    cache = AudioCache(max_bytes=4, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    cache.put("big", b"x" * 100, "audio/wav")
+    assert cache.get("big").data == b"x" * 100
+
+    restarted = AudioCache(max_bytes=4, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    entry = asyncio.run(restarted.aget("big"))
+    assert isinstance(entry.data, memoryview)
+    assert entry.data == b"x" * 100 and entry.content_type == "audio/wav"
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_by_total_size(tmp_path):
+    cache = AudioCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=250)
+    for key in ("a", "b", "c"):
+        asyncio.run(cache.aput(key, b"x" * 100, "audio/wav"))
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert sorted(os.listdir(tmp_path)) == ["b" + DISK_SUFFIX, "c" + DISK_SUFFIX]
+
+
+@pytest.mark.parametrize("content", [b"", b"no header at all", b"\xff\xfe\nxx", b"text/plain\nxx"])
+def test_corrupt_disk_file_is_a_miss_and_removed(tmp_path, content):
+    cache = AudioCache(max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    cache.put("k", b"audio", "audio/wav")
+    cache._entries.clear()
+    path = tmp_path / ("k" + DISK_SUFFIX)
+    path.write_bytes(content)
+    assert asyncio.run(cache.aget("k")) is None
+    assert not path.exists()
+    assert cache.disk_bytes == 0
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert tts.parse_range(header, 100) == expected
+
+
+def test_parse_range_unsatisfiable():
+    with pytest.raises(HTTPException) as error:
+        tts.parse_range("bytes=100-", 100)
+    assert error.value.status_code == 416
+
+
+def test_get_audio_serves_ranges_from_disk(tmp_path, monkeypatch):
+    cache = AudioCache(max_bytes=0, disk_dir=str(tmp_path), disk_max_bytes=1024)
+    cache.put("id", bytes(range(100)), "audio/wav")
+    monkeypatch.setattr(tts, "audio_cache", cache)
+
+    async def main():
+        transport = httpx.ASGITransport(app=tts.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://tts") as client:
+            full = await client.get("/audio/id")
+            partial = await client.get("/audio/id", headers={"Range": "bytes=10-19"})
+            missing = await client.get("/audio/other")
+        return full, partial, missing
+
+    full, partial, missing = asyncio.run(main())
+    assert full.status_code == 200 and full.content == bytes(range(100))
+    assert full.headers["content-length"] == "100"
+    assert partial.status_code == 206 and partial.content == bytes(range(10, 20))
+    assert partial.headers["content-range"] == "bytes 10-19/100"
+    assert missing.status_code == 404
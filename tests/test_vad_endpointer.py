@@ -0,0 +1,45 @@
+from services.vad_service.providers.streaming import SpeechEndpointer
+
+SAMPLE_RATE = 16000
+WINDOW = 512  # 32ms
+
+
+def run(probs, **params):
+    endpointer = SpeechEndpointer(SAMPLE_RATE, WINDOW, **params)
+    events = [event for event in map(endpointer.update, probs) if event]
+    return events + endpointer.flush(), endpointer
+
+
+def windows(ms):
+    return ms * SAMPLE_RATE // 1000 // WINDOW
+
+
+def test_short_blip_produces_no_events():
+    probs = [0.0] * 5 + [0.9] * windows(200) + [0.0] * windows(600)
+    events, endpointer = run(probs, min_speech_duration_ms=500)
+    assert events == []
+    assert not endpointer.in_speech
+
+
+def test_speech_start_waits_for_min_duration_but_keeps_start_time():
+    probs = [0.0] * 5 + [0.9] * windows(1000) + [0.0] * windows(600)
+    events, _ = run(probs, min_speech_duration_ms=500)
+    assert [e["event"] for e in events] == ["speech_start", "speech_end"]
+    assert events[0]["time"] == events[1]["start_time"]
+    assert events[0]["time"] < 5 * WINDOW / SAMPLE_RATE
+    assert events[1]["duration"] >= 0.5
+
+
+def test_without_min_duration_speech_start_is_immediate():
+    endpointer = SpeechEndpointer(SAMPLE_RATE, WINDOW)
+    assert endpointer.update(0.0) is None
+    assert endpointer.update(0.9)["event"] == "speech_start"
+    assert endpointer.in_speech
+
+
+def test_flush_closes_speech_at_the_end_of_audio():
+    events, _ = run([0.9] * windows(600), min_speech_duration_ms=500)
+    assert [e["event"] for e in events] == ["speech_start", "speech_end"]
+    # 尾部的静音不计入语音时长
+    events, _ = run([0.9] * windows(300) + [0.0] * windows(200), min_speech_duration_ms=500)
+    assert events == []
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from services.memory_service.vector_index import INITIAL_CAPACITY, VectorIndex
+
+
+def unit_vectors(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top(vectors, ids, query, k):
+    scores = vectors @ query
+    order = np.argsort(-scores)[:k]
+    return [ids[i] for i in order]
+
+
+def test_brute_force_search_is_exact():
+    vectors = unit_vectors(200)
+    index = VectorIndex(16)
+    ids = [f"m{i}" for i in range(len(vectors))]
+    for item_id, vector in zip(ids, vectors):
+        index.add(item_id, vector)
+    query = unit_vectors(1, seed=1)[0]
+    results = index.search(query, 5)
+    assert not index.uses_ivf
+    assert [item_id for item_id, _ in results] == exact_top(vectors, ids, query, 5)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_handles_small_and_empty_indexes():
+    index = VectorIndex(16)
+    assert index.search(unit_vectors(1)[0], 3) == []
+    index.add("a", unit_vectors(1)[0])
+    assert [item_id for item_id, _ in index.search(unit_vectors(1, seed=2)[0], 3)] == ["a"]
+
+
+def test_re_adding_an_id_replaces_its_vector():
+    vectors = unit_vectors(2)
+    index = VectorIndex(16)
+    index.add("a", vectors[0])
+    index.add("a", vectors[1])
+    assert len(index) == 1
+    assert index.search(vectors[1], 1)[0][1] == pytest.approx(1.0)
+
+
+def test_removed_items_are_never_returned():
+    vectors = unit_vectors(50)
+    index = VectorIndex(16)
+    for i, vector in enumerate(vectors):
+        index.add(f"m{i}", vector)
+    index.remove("m3")
+    index.remove("missing")
+    assert "m3" not in index and len(index) == 49
+    assert all(item_id != "m3" for item_id, _ in index.search(vectors[3], 49))
+
+
+def test_ivf_trains_past_threshold_and_keeps_recall():
+    centers = unit_vectors(32, seed=3)
+    rng = np.random.default_rng(4)
+    vectors = centers[rng.integers(0, len(centers), 2000)] + rng.normal(scale=0.05, size=(2000, 16))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    ids = [f"m{i}" for i in range(len(vectors))]
+    index = VectorIndex(16, ivf_threshold=1000, nprobe=8)
+    for item_id, vector in zip(ids, vectors):
+        index.add(item_id, vector)
+    assert index.uses_ivf
+    assert index._trained_size == 2000
+
+    hits = 0
+    for query in vectors[:50]:
+        expected = set(exact_top(vectors, ids, query, 10))
+        hits += len(expected & {item_id for item_id, _ in index.search(query, 10)})
+    assert hits / 500 >= 0.9
+
+
+def test_compaction_keeps_live_items_searchable():
+    vectors = unit_vectors(300)
+    index = VectorIndex(16)
+    for i, vector in enumerate(vectors):
+        index.add(f"m{i}", vector)
+    for i in range(200):
+        index.remove(f"m{i}")
+    assert len(index) == 100
+    assert len(index._ids) < 300
+    assert len(index._ids) - len(index) <= max(len(index), INITIAL_CAPACITY)
+    live = vectors[200:]
+    ids = [f"m{i}" for i in range(200, 300)]
+    query = unit_vectors(1, seed=5)[0]
+    assert [item_id for item_id, _ in index.search(query, 10)] == exact_top(live, ids, query, 10)
+    index.add("new", query)
+    assert index.search(query, 1)[0][0] == "new"
+
+
+def test_compaction_below_threshold_drops_ivf():
+    vectors = unit_vectors(400)
+    index = VectorIndex(16, ivf_threshold=300)
+    for i, vector in enumerate(vectors):
+        index.add(f"m{i}", vector)
+    assert index.uses_ivf
+    for i in range(300):
+        index.remove(f"m{i}")
+    assert not index.uses_ivf
+    ids = [f"m{i}" for i in range(300, 400)]
+    query = unit_vectors(1, seed=6)[0]
+    assert [item_id for item_id, _ in index.search(query, 5)] == exact_top(vectors[300:], ids, query, 5)
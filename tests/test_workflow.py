@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from orchestrator.workflow import SKIPPED, Stage, Workflow
+
+
+def run(workflow, **inputs):
+    return asyncio.run(workflow.run(None, **inputs))
+
+
+async def value(result, delay=0.0):
+    await asyncio.sleep(delay)
+    return result
+
+
+def test_independent_stages_run_concurrently():
+    order = []
+
+    async def stage(ctx, name, delay, **inputs):
+        order.append(f"{name}-start")
+        await asyncio.sleep(delay)
+        order.append(f"{name}-end")
+        return name
+
+    workflow = Workflow("w", [
+        Stage("a", lambda ctx, x: stage(ctx, "a", 0.02), inputs=["x"]),
+        Stage("b", lambda ctx, x: stage(ctx, "b", 0.01), inputs=["x"]),
+        Stage("c", lambda ctx, a, b: value(a + b), inputs=["a", "b"]),
+    ], inputs=["x"])
+    results = run(workflow, x=1)
+    assert results["c"] == "ab"
+    assert order[:2] == ["a-start", "b-start"]
+
+
+def test_false_guard_skips_stage_and_its_dependents():
+    calls = []
+
+    async def record(ctx, **inputs):
+        calls.append(inputs)
+        return "done"
+
+    workflow = Workflow("w", [
+        Stage("guard", lambda ctx, x: value(x > 0), inputs=["x"]),
+        Stage("guarded", record, inputs=["x"], when="guard"),
+        Stage("downstream", record, inputs=["guarded"]),
+        Stage("other", lambda ctx, x: value(x), inputs=["x"]),
+    ], inputs=["x"])
+    results = run(workflow, x=0)
+    assert results["guarded"] is SKIPPED and results["downstream"] is SKIPPED
+    assert results["other"] == 0
+    assert calls == []
+
+
+def test_unused_speculative_stage_is_cancelled():
+    cancelled = asyncio.Event()
+
+    async def speculative(ctx, x):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    workflow = Workflow("w", [
+        Stage("guard", lambda ctx, x: value(False), inputs=["x"]),
+        Stage("asr", speculative, inputs=["x"], speculative=True),
+        Stage("text", lambda ctx, asr: value(asr), inputs=["asr"], when="guard"),
+    ], inputs=["x"])
+
+    async def main():
+        results = await asyncio.wait_for(workflow.run(None, x=1), 2)
+        return results, cancelled.is_set()
+
+    results, was_cancelled = asyncio.run(main())
+    assert results["text"] is SKIPPED
+    assert "asr" not in results
+    assert was_cancelled
+
+
+def test_failure_cancels_other_foreground_stages_but_waits_for_background():
+    state = {}
+
+    async def fail(ctx, x):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def slow(ctx, x):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["slow"] = "cancelled"
+            raise
+
+    async def background(ctx, x):
+        await asyncio.sleep(0.05)
+        state["background"] = "finished"
+
+    workflow = Workflow("w", [
+        Stage("fail", fail, inputs=["x"]),
+        Stage("slow", slow, inputs=["x"]),
+        Stage("bg", background, inputs=["x"], background=True),
+        Stage("after", lambda ctx, fail: value(fail), inputs=["fail"]),
+    ], inputs=["x"])
+    with pytest.raises(RuntimeError, match="boom"):
+        run(workflow, x=1)
+    assert state == {"slow": "cancelled", "background": "finished"}
+
+
+def test_background_failure_does_not_fail_the_workflow():
+    async def fail(ctx, x):
+        raise RuntimeError("write failed")
+
+    workflow = Workflow("w", [
+        Stage("bg", fail, inputs=["x"], background=True),
+        Stage("main", lambda ctx, x: value(x * 2), inputs=["x"]),
+    ], inputs=["x"])
+    results = run(workflow, x=2)
+    assert results == {"main": 4}
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([Stage("a", value, inputs=["missing"])], "未定义"),
+    ([Stage("a", value, inputs=["b"]), Stage("b", value, inputs=["a"])], "循环依赖"),
+    ([Stage("a", value), Stage("a", value)], "重复"),
+])
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        Workflow("w", stages)
+
+
+def test_missing_input_is_rejected():
+    workflow = Workflow("w", [Stage("a", lambda ctx, x: value(x), inputs=["x"])], inputs=["x"])
+    with pytest.raises(ValueError, match="缺少输入"):
+        run(workflow)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from orchestrator.write_buffer import WriteBehindBuffer
+
+
+class Recorder:
+    def __init__(self, fail=False, short=False):
+        self.batches = []
+        self.fail = fail
+        self.short = short
+
+    async def __call__(self, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError("写入失败")
+        results = [f"id-{item}" for item in items]
+        return results[:-1] if self.short else results
+
+
+def test_full_batch_flushes_immediately_and_results_follow_items():
+    async def scenario():
+        flush = Recorder()
+        buffer = WriteBehindBuffer(flush, max_batch=3, max_delay=60)
+        futures = [buffer.add(i) for i in range(3)]
+        return flush, await asyncio.wait_for(asyncio.gather(*futures), 1), buffer.stats()
+
+    flush, results, stats = asyncio.run(scenario())
+    assert flush.batches == [[0, 1, 2]]
+    assert results == ["id-0", "id-1", "id-2"]
+    assert (stats["batches"], stats["items"], stats["pending"]) == (1, 3, 0)
+
+
+def test_partial_batch_flushes_after_delay():
+    async def scenario():
+        flush = Recorder()
+        buffer = WriteBehindBuffer(flush, max_batch=10, max_delay=0.01)
+        first = buffer.add("a")
+        await asyncio.sleep(0)
+        second = buffer.add("b")
+        assert flush.batches == []
+        return flush, await asyncio.gather(first, second)
+
+    flush, results = asyncio.run(scenario())
+    assert flush.batches == [["a", "b"]]
+    assert results == ["id-a", "id-b"]
+
+
+def test_batches_keep_arrival_order():
+    async def scenario():
+        flush = Recorder()
+        buffer = WriteBehindBuffer(flush, max_batch=2, max_delay=60)
+        futures = [buffer.add(i) for i in range(5)]
+        await buffer.aclose()
+        return flush, [f.result() for f in futures]
+
+    flush, results = asyncio.run(scenario())
+    assert flush.batches == [[0, 1], [2, 3], [4]]
+    assert results == [f"id-{i}" for i in range(5)]
+
+
+def test_failed_batch_propagates_to_every_item():
+    async def scenario():
+        buffer = WriteBehindBuffer(Recorder(fail=True), max_batch=2)
+        futures = [buffer.add(i) for i in range(2)]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return results, buffer.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert (stats["failed_batches"], stats["batches"]) == (1, 0)
+
+
+def test_result_count_mismatch_fails_the_batch():
+    async def scenario():
+        buffer = WriteBehindBuffer(Recorder(short=True), max_batch=2)
+        futures = [buffer.add(i) for i in range(2)]
+        with pytest.raises(ValueError, match="期望 2 条"):
+            await futures[0]
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_aclose_flushes_pending_items():
+    async def scenario():
+        flush = Recorder()
+        buffer = WriteBehindBuffer(flush, max_batch=10, max_delay=60)
+        future = buffer.add("x")
+        await buffer.aclose()
+        return flush, future.result(), buffer.stats()
+
+    flush, result, stats = asyncio.run(scenario())
+    assert flush.batches == [["x"]]
+    assert result == "id-x"
+    assert (stats["pending"], stats["in_flight"]) == (0, 0)